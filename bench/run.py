@@ -0,0 +1,241 @@
+"""Benchmark the client against a local fake SlipStream server.
+
+Every `api.Api` listing and the main commands are timed against a
+`testing.FakeServer` serving a synthetic catalog of the requested size,
+answering each request after a configurable latency::
+
+    $ python bench/run.py --modules 5000 --runs 20000 --latency 0.005
+
+For each benchmark, the number of items, requests and writes of the
+cookie jar, the elapsed time, the throughput, the time to the first item
+and the peak memory allocated are reported. Timings are taken on a first pass, and the peak memory on a
+second one under `tracemalloc`, which slows down the code it traces.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import collections
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+from click.testing import CliRunner
+
+try:
+    import tracemalloc
+except ImportError:  # Python < 3.4
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'src'))
+
+from slipstream.cli import conf, formats, testing  # noqa: E402
+
+Result = collections.namedtuple('Result', [
+    'name',
+    'items',
+    'requests',
+    'cookie_writes',
+    'seconds',
+    'items_per_second',
+    'first_item_ms',
+    'peak_kib',
+])
+
+
+class CookieWrites(object):
+    """Count the writes of the cookie jar by every `api.SessionStore`, in
+    COUNT, which commands should only do when their cookies changed.
+    """
+
+    def __init__(self):
+        from slipstream.cli.api import SessionStore
+
+        self.count = 0
+        save = SessionStore.save
+
+        def counting_save(store, *args, **kwargs):
+            self.count += 1
+            return save(store, *args, **kwargs)
+
+        SessionStore.save = counting_save
+
+
+def _consume(func):
+    """Call FUNC and iterate over what it returns, returning the number of
+    items and the seconds elapsed until the first one and overall.
+    """
+    start = time.time()
+    first = None
+    items = 0
+    for _ in func():
+        if first is None:
+            first = time.time() - start
+        items += 1
+    return items, first, time.time() - start
+
+
+def measure(name, server, cookie_writes, func, memory=True, streaming=True):
+    """Run the benchmark NAME, calling FUNC against SERVER, and return its
+    `Result`, with the writes counted by the `CookieWrites` COOKIE_WRITES.
+    The time to the first item is only reported for STREAMING
+    benchmarks, whose items are yielded as they are received.
+    """
+    requests = server.requests
+    writes = cookie_writes.count
+    items, first, seconds = _consume(func)
+    requests = server.requests - requests
+    writes = cookie_writes.count - writes
+
+    peak = None
+    if memory and tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            _consume(func)
+            peak = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+
+    return Result(name, items, requests, writes, round(seconds, 3),
+                  int(items / seconds) if seconds else None,
+                  round(first * 1000, 1) if streaming and first is not None
+                  else None,
+                  peak)
+
+
+def api_benchmarks(api, concurrency, launches, deployment):
+    """Return the ``(name, func, streaming)`` benchmarks of the `api.Api`
+    API, logged in to the server, launching runs of the module DEPLOYMENT.
+    """
+    runs = []
+
+    def run_deployments():
+        del runs[:]
+        for _ in range(launches):
+            runs.append(api.run_deployment(deployment))
+            yield runs[-1]
+
+    return [
+        ('api list_applications', api.list_applications, True),
+        ('api list_modules -r',
+         lambda: api.list_modules(recurse=True), True),
+        ('api list_modules -r -j %d' % concurrency,
+         lambda: api.list_modules(recurse=True, concurrency=concurrency),
+         True),
+        ('api list_runs', api.list_runs, True),
+        ('api list_runs columnar',
+         lambda: api.list_runs(columnar=True), False),
+        ('api list_virtualmachines', api.list_virtualmachines, True),
+        ('api list_virtualmachines cloud',
+         lambda: api.list_virtualmachines(cloud='ec2-eu-west'), True),
+        ('api list_virtualmachines columnar',
+         lambda: api.list_virtualmachines(columnar=True), False),
+        ('api usage', api.usage, True),
+        ('api run_deployment x%d' % launches, run_deployments, True),
+        ('api terminate_many -j %d' % concurrency,
+         lambda: api.terminate_many(list(runs), concurrency), True),
+    ]
+
+
+def cli_benchmarks(concurrency):
+    """Return the ``(name, func, streaming)`` benchmarks of the commands,
+    run in process once logged in.
+    """
+    from slipstream.cli.commands import cli
+
+    runner = CliRunner()
+
+    def command(*args):
+        def invoke():
+            result = runner.invoke(cli, ['--no-cache'] + list(args))
+            if result.exit_code != 0:
+                raise click.ClickException("slipstream %s failed: %s" % (
+                    ' '.join(args), result.output))
+            return result.output.splitlines()
+        return invoke
+
+    return [('slipstream ' + ' '.join(args), command(*args), False)
+            for args in [
+                ('list', 'applications', '-f', 'ndjson'),
+                ('list', 'modules', '-r', '-j', str(concurrency),
+                 '-f', 'ndjson'),
+                ('list', 'runs', '-f', 'ndjson'),
+                ('list', 'virtualmachines', '-f', 'ndjson'),
+                ('list', 'virtualmachines', '--group-by', 'cloud,status'),
+                ('usage',),
+            ]]
+
+
+@click.command()
+@click.option('--modules', metavar='N', type=click.IntRange(1), default=1000,
+              help="Number of images and deployments.")
+@click.option('--depth', metavar='D', type=click.IntRange(0), default=2,
+              help="Depth of the tree of projects holding them.")
+@click.option('--fanout', metavar='N', type=click.IntRange(1), default=4,
+              help="Number of sub-projects of each project.")
+@click.option('--runs', metavar='N', type=click.IntRange(0), default=10000,
+              help="Number of runs on the server.")
+@click.option('--vms-per-run', 'vms_per_run', metavar='N',
+              type=click.IntRange(0), default=1,
+              help="Number of virtual machines of each run.")
+@click.option('--latency', metavar='SECONDS', type=float, default=0.0,
+              help="Time taken by the server to answer each request.")
+@click.option('-j', '--concurrency', metavar='N', type=click.IntRange(1),
+              default=conf.DEFAULT_CONCURRENCY,
+              help="Number of requests in flight for concurrent benchmarks.")
+@click.option('--launches', metavar='N', type=click.IntRange(0), default=100,
+              help="Number of deployments launched then terminated.")
+@click.option('--no-memory', 'no_memory', is_flag=True, default=False,
+              help="Do not measure the peak memory.")
+@click.option('--no-cli', 'no_cli', is_flag=True, default=False,
+              help="Only benchmark the API, not the commands.")
+@click.option('-f', '--format', 'format', type=click.Choice(formats.FORMATS),
+              default='table', help="Output format.")
+def main(modules, depth, fanout, runs, vms_per_run, latency, concurrency,
+         launches, no_memory, no_cli, format):
+    """Benchmark the client against a local fake SlipStream server."""
+    from slipstream.cli.api import Api
+
+    catalog = testing.synthetic_modules(modules, depth, fanout)
+    deployment = next(path for path, category, _ in catalog
+                      if category == 'Deployment')
+    server = testing.FakeServer(catalog, runs=runs, vms_per_run=vms_per_run,
+                                latency=latency)
+    tmpdir = tempfile.mkdtemp(prefix='slipstream-bench-')
+    conf.DEFAULT_CONFIG_FILE = os.path.join(tmpdir, 'config')
+    conf.DEFAULT_COOKIE_FILE = os.path.join(tmpdir, 'cookies.txt')
+    conf.DEFAULT_CACHE_DIR = os.path.join(tmpdir, 'cache')
+    conf.DEFAULT_INDEX_FILE = os.path.join(tmpdir, 'modules.json')
+    conf.DEFAULT_HISTORY_FILE = os.path.join(tmpdir, 'usage.dat')
+    try:
+        with testing.serve(server) as endpoint:
+            # The server keeps a single session: log in once, saving the
+            # cookie used by both the API and the commands
+            from slipstream.cli.commands import cli
+
+            result = CliRunner().invoke(cli, ['login', '-u', server.username,
+                                              '-p', server.password,
+                                              '-e', endpoint])
+            if result.exit_code != 0:
+                raise click.ClickException(result.output)
+            cookie_writes = CookieWrites()
+            benchmarks = api_benchmarks(Api(endpoint), concurrency, launches,
+                                        deployment)
+            if not no_cli:
+                benchmarks.extend(cli_benchmarks(concurrency))
+
+            results = []
+            for name, func, streaming in benchmarks:
+                results.append(measure(name, server, cookie_writes, func,
+                                       not no_memory, streaming))
+                click.echo("%s: %.3fs" % (name, results[-1].seconds),
+                           err=True)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    formats.write_items(results, format)
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,7 @@ install_requires = [
 
 if sys.version_info < (3, 2):
     install_requires.append('configparser')
+    install_requires.append('futures')
 
 setup(
     name='slipstream-cli',
@@ -31,11 +32,14 @@ setup(
     description="A SlipStream's companion tool for command line lovers.",
     package_dir={'': 'src'},
     packages=find_packages('src'),
-    namespace_packages=['slipstream'],
     zip_safe=False,
     license='Apache License, Version 2.0',
     include_package_data=True,
     install_requires=install_requires,
+    extras_require={
+        'async': ['aiohttp'],
+        'yaml': ['PyYAML'],
+    },
     entry_points={
         'console_scripts': [
             'slipstream=slipstream.cli:main',
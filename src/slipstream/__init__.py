@@ -1 +1,3 @@
-__import__("pkg_resources").declare_namespace(__name__)
+# Extending the package path with pkgutil rather than pkg_resources keeps
+# the namespace package cheap to import.
+__path__ = __import__('pkgutil').extend_path(__path__, __name__)
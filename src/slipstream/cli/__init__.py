@@ -3,6 +3,14 @@ __version__ = "0.8.0"
 
 
 def main():
+    import sys
+    from .agent import forward
+
+    # Let the agent run the command if it is running
+    status = forward(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+
     from .commands import cli
     cli(auto_envvar_prefix='SLIPSTREAM')
 
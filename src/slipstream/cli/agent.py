@@ -0,0 +1,453 @@
+"""A resident process running commands on behalf of the CLI.
+
+The agent listens on a Unix socket, by default `conf.DEFAULT_AGENT_SOCKET`,
+which only its user can access. When it is running, `slipstream.cli.main`
+forwards invocations to it instead of running them: the modules stay
+imported, and the `api.Api` of each profile is kept from one command to the
+next along with its session and pool of connections. Commands are run one
+at a time, so those which can take long, like `watch`, are run by the
+client.
+
+Requests and responses are JSON objects, one per line. A 'run' request is
+answered with the output of the command, as 'stdout' and 'stderr' messages
+sent as it is written, and then its 'exit' status, or with 'fallback' when
+the command has to be run by the client, e.g. because it is interactive.
+The standard input of the client is read on demand: the agent sends a
+'read' message whenever the command reads a line, answered with a 'stdin'
+message holding the line, or nothing at the end of the input.
+
+This module is imported on every invocation: it must stay cheap to import.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import errno
+import io
+import json
+import os
+import socket
+import sys
+import time
+from contextlib import closing
+
+from . import conf
+
+# Commands always run by the client, as they are interactive, manage the
+# agent itself or poll the server until runs are done, along with the
+# commands given one of WAIT_OPTIONS
+LOCAL_COMMANDS = frozenset(['login', 'agent', 'shell', 'watch'])
+WAIT_OPTIONS = ('wait', 'until')
+
+# Prefix of the environment variables forwarded to the agent
+ENV_PREFIX = 'SLIPSTREAM_'
+
+
+class AgentError(Exception):
+    pass
+
+
+def _send(sock, message):
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _receive(sock):
+    """Yield the messages received on SOCK until it is closed."""
+    with closing(sock.makefile('rb')) as fp:
+        for line in fp:
+            yield json.loads(line.decode('utf-8'))
+
+
+def _connect(socket_path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+def request(message, socket_path=None):
+    """Send MESSAGE to the agent and return its single response, or None if
+    the agent is not running.
+    """
+    socket_path = conf.DEFAULT_AGENT_SOCKET if socket_path is None \
+        else socket_path
+    try:
+        sock = _connect(socket_path)
+    except socket.error:
+        return None
+    with closing(sock):
+        _send(sock, message)
+        for response in _receive(sock):
+            return response
+
+
+def status(socket_path=None):
+    """Return the status of the agent, or None if it is not running."""
+    return request({'type': 'status'}, socket_path)
+
+
+def stop(socket_path=None):
+    """Stop the agent, returning whether it was running."""
+    return request({'type': 'stop'}, socket_path) is not None
+
+
+def start(socket_path=None, idle_timeout=conf.DEFAULT_AGENT_IDLE_TIMEOUT,
+          wait=5):
+    """Start the agent in a new process, waiting for up to WAIT seconds for
+    it to listen on SOCKET_PATH, and return its status.
+    """
+    import subprocess
+
+    socket_path = conf.DEFAULT_AGENT_SOCKET if socket_path is None \
+        else socket_path
+    # Run the same code as this process
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        os.path.abspath(path) for path in sys.path if path))
+    with open(os.devnull, 'r+b') as devnull:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'slipstream.cli.agent',
+             '--socket', socket_path, '--idle-timeout', str(idle_timeout)],
+            stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True,
+            cwd='/', env=env, preexec_fn=os.setsid)
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        agent_status = status(socket_path)
+        if agent_status is not None:
+            return agent_status
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    raise AgentError("The agent did not start.")
+
+
+def forward(args, socket_path=None, stdin=None, stdout=None, stderr=None):
+    """Run the command with ARGS in the agent, copying its output to STDOUT
+    and STDERR and the lines it reads from STDIN, and return its exit
+    status, or None if it has to be run in process: when the agent isn't
+    running or the command is one of LOCAL_COMMANDS.
+    """
+    stdin = sys.stdin if stdin is None else stdin
+    stdout = sys.stdout if stdout is None else stdout
+    stderr = sys.stderr if stderr is None else stderr
+    socket_path = conf.DEFAULT_AGENT_SOCKET if socket_path is None \
+        else socket_path
+
+    if not hasattr(socket, 'AF_UNIX') or os.environ.get('SLIPSTREAM_NO_AGENT') \
+            or not os.path.exists(socket_path):
+        return None
+    try:
+        sock = _connect(socket_path)
+    except socket.error:
+        return None
+
+    streams = {'stdout': stdout, 'stderr': stderr}
+    with closing(sock):
+        _send(sock, {
+            'type': 'run',
+            'args': list(args),
+            'env': dict((name, value) for name, value in os.environ.items()
+                        if name.startswith(ENV_PREFIX)),
+            'cwd': os.getcwd(),
+            'tty': dict((name, stream.isatty()) for name, stream in [
+                ('stdin', stdin), ('stdout', stdout), ('stderr', stderr)]),
+        })
+        try:
+            for message in _receive(sock):
+                if 'fallback' in message:
+                    return None
+                if 'exit' in message:
+                    return message['exit']
+                if 'read' in message:
+                    line = stdin.readline()
+                    if isinstance(line, bytes):
+                        line = line.decode('utf-8', 'replace')
+                    _send(sock, {'stdin': line})
+                for name, stream in streams.items():
+                    if name in message:
+                        stream.write(message[name])
+                        stream.flush()
+        except socket.error:
+            pass
+    stderr.write("The agent stopped while running the command.\n")
+    return 1
+
+
+class _Channel(io.RawIOBase):
+    """A binary stream sending what is written to it to the client, as
+    NAME messages.
+    """
+
+    def __init__(self, sock, name, tty):
+        super(_Channel, self).__init__()
+        self.sock = sock
+        self.name = name
+        self.tty = tty
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return self.tty
+
+    def write(self, data):
+        _send(self.sock, {self.name: bytes(data).decode('utf-8', 'replace')})
+        return len(data)
+
+
+class _Input(io.RawIOBase):
+    """A binary stream reading the standard input of the client, one line
+    at a time, from MESSAGES received on SOCK.
+    """
+
+    def __init__(self, sock, messages, tty):
+        super(_Input, self).__init__()
+        self.sock = sock
+        self.messages = messages
+        self.tty = tty
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def isatty(self):
+        return self.tty
+
+    def readinto(self, buffer):
+        if not self.pending:
+            _send(self.sock, {'read': True})
+            message = next(self.messages, {})
+            self.pending = message.get('stdin', '').encode('utf-8')
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def _text_stream(raw, **kwargs):
+    if sys.version_info[0] == 2:
+        return raw
+    return io.TextIOWrapper(raw, encoding='utf-8', **kwargs)
+
+
+class _Isolation(object):
+    """Run a command with the standard streams, environment and working
+    directory of the client sending REQUEST over SOCK, followed by
+    MESSAGES.
+    """
+
+    def __init__(self, sock, request, messages):
+        self.sock = sock
+        self.request = request
+        self.messages = messages
+
+    def __enter__(self):
+        self.saved = (sys.stdin, sys.stdout, sys.stderr, os.getcwd(),
+                      dict(os.environ))
+        tty = self.request.get('tty', {})
+        sys.stdin = _text_stream(io.BufferedReader(_Input(
+            self.sock, self.messages, tty.get('stdin', False))))
+        sys.stdout, sys.stderr = [
+            _text_stream(_Channel(self.sock, name, tty.get(name, False)),
+                         line_buffering=True, write_through=True)
+            for name in ('stdout', 'stderr')]
+        for name in list(os.environ):
+            if name.startswith(ENV_PREFIX):
+                del os.environ[name]
+        os.environ.update(self.request.get('env', {}))
+        os.chdir(self.request.get('cwd', '/'))
+
+    def __exit__(self, *exc_info):
+        sys.stdin, sys.stdout, sys.stderr, cwd, environ = self.saved
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def _mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
+class Agent(object):
+    """Serve the commands forwarded on SOCKET_PATH until stopped, or until
+    no command was received for IDLE_TIMEOUT seconds if not zero.
+    """
+
+    def __init__(self, socket_path=None,
+                 idle_timeout=conf.DEFAULT_AGENT_IDLE_TIMEOUT):
+        self.socket_path = conf.DEFAULT_AGENT_SOCKET if socket_path is None \
+            else socket_path
+        self.idle_timeout = idle_timeout
+        self.started_at = time.time()
+        self.commands = 0
+        self.running = False
+        # Api of each profile, with the time its cookie file was modified
+        self.apis = {}
+
+    def api(self, endpoint, cookie_file, cache, policy, stats):
+        """Return the `api.Api` of a command, reusing the one of the same
+        profile unless its cookie file was changed by another process.
+        """
+        from .api import Api
+
+        if stats is not None:
+            return Api(endpoint, cookie_file, cache, policy, stats)
+        key = (endpoint, cookie_file, cache is None,
+               getattr(cache, 'max_age', None),
+               getattr(cache, 'username', None),
+               tuple(sorted(vars(policy).items())))
+        entry = self.apis.get(key)
+        if entry is None or entry[1] != _mtime(cookie_file):
+            entry = self.apis[key] = [Api(endpoint, cookie_file, cache,
+                                          policy), None]
+        api = entry[0]
+        # Credentials are only kept for the command which gave them
+        api.session.reauthenticate = None
+        return api
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'socket': self.socket_path,
+            'uptime': time.time() - self.started_at,
+            'commands': self.commands,
+            'sessions': len(self.apis),
+        }
+
+    def _bind(self):
+        if os.path.exists(self.socket_path):
+            if status(self.socket_path) is not None:
+                raise AgentError("An agent is already listening on %s."
+                                 % self.socket_path)
+            # Left behind by an agent which was killed
+            os.remove(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            sock.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        sock.listen(8)
+        return sock
+
+    def serve(self):
+        server = self._bind()
+        server.settimeout(self.idle_timeout or None)
+        self.running = True
+        try:
+            while self.running:
+                try:
+                    sock, _ = server.accept()
+                except socket.timeout:
+                    break
+                sock.settimeout(None)
+                with closing(sock):
+                    try:
+                        self.handle(sock)
+                    except socket.error as e:
+                        # The client went away
+                        if e.errno not in (errno.EPIPE, errno.ECONNRESET):
+                            raise
+        finally:
+            self.running = False
+            server.close()
+            os.remove(self.socket_path)
+
+    def handle(self, sock):
+        messages = _receive(sock)
+        for message in messages:
+            type = message.get('type')
+            if type == 'status':
+                _send(sock, self.status())
+            elif type == 'stop':
+                self.running = False
+                _send(sock, {'stopping': True})
+            elif type == 'run':
+                self.commands += 1
+                self.run(sock, message, messages)
+            else:
+                _send(sock, {'error': "Unknown request: %s" % type})
+            return
+
+    def run(self, sock, request, messages=iter(())):
+        with _Isolation(sock, request, messages):
+            status = self._invoke(request['args'])
+        for key, entry in self.apis.items():
+            entry[1] = _mtime(key[1])
+        if status is None:
+            _send(sock, {'fallback': True})
+        else:
+            _send(sock, {'exit': status})
+
+    def _invoke(self, args):
+        """Run the command with ARGS and return its exit status, or None if
+        it has to be run by the client.
+        """
+        from .base import Config
+        from .commands import invoke
+
+        def runs_locally(ctx, cfg):
+            contexts = _subcommand_contexts(ctx)
+            if contexts and contexts[0].command.name in LOCAL_COMMANDS:
+                return True
+            if contexts and any(contexts[-1].params.get(name)
+                                for name in WAIT_OPTIONS):
+                return True
+            # Logging in would prompt for credentials
+            return not ctx.params.get('password') \
+                and not os.path.isfile(cfg.settings['cookie_file']) \
+                and not (contexts and contexts[0].command.name == 'logout')
+
+        cfg = Config()
+        cfg.api_factory = self.api
+        return invoke(args, cfg, skip=runs_locally)
+
+
+def _subcommand_contexts(ctx):
+    """Return the contexts of the subcommands run by the group context CTX,
+    from the outermost, their arguments being parsed without running any
+    callback.
+    """
+    import click
+
+    contexts = []
+    try:
+        while isinstance(ctx.command, click.MultiCommand) and ctx.args:
+            name = ctx.args[0]
+            command = ctx.command.get_command(ctx, name)
+            if command is None:
+                break
+            ctx = command.make_context(name, ctx.args[1:], parent=ctx,
+                                       resilient_parsing=True)
+            contexts.append(ctx)
+    except click.ClickException:
+        # Reported when the command is run
+        pass
+    return contexts
+
+
+def main():
+    import click
+
+    @click.command()
+    @click.option('--socket', 'socket_path', metavar='PATH',
+                  help="The socket to listen on.")
+    @click.option('--idle-timeout', 'idle_timeout', metavar='SECONDS',
+                  type=click.IntRange(0),
+                  default=conf.DEFAULT_AGENT_IDLE_TIMEOUT,
+                  help="Stop after SECONDS without commands, or never if 0.")
+    def serve(socket_path, idle_timeout):
+        """Serve the commands forwarded by the CLI."""
+        try:
+            Agent(socket_path, idle_timeout).serve()
+        except AgentError as e:
+            raise click.ClickException(str(e))
+
+    serve()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""An asyncio client for SlipStream, mirroring `api.Api`.
+
+It needs Python 3.6 or above and aiohttp, installed with the 'async' extra.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import os
+from http.cookiejar import LoadError, MozillaCookieJar
+from urllib.parse import urlencode
+
+import aiohttp
+from yarl import URL
+
+from . import conf
+from .api import (DEFAULT_PAGE_SIZE, ElementTree__iter, deployment_form,
+                  etree, image_form, mod_url, to_application, to_module,
+                  to_module_children, to_run, to_run_id, to_usage,
+                  to_virtualmachine, virtualmachine_filters)
+from .log import logger
+
+# Maximum number of connections opened by an AsyncApi
+DEFAULT_POOL_SIZE = 100
+
+
+class AsyncApi(object):
+    """An `api.Api` whose methods are coroutines, and whose listings are
+    asynchronous generators.
+
+    All the requests share one connection pool of up to POOL_SIZE
+    connections, created on first use from the running event loop. The
+    session cookie is read from COOKIE_FILE, as written by `api.Api`, or
+    obtained with `login`. Responses are not cached.
+
+    Use it as an asynchronous context manager, or call `close` once done::
+
+        async with AsyncApi(endpoint) as api:
+            async for run in api.list_runs():
+                print(run)
+    """
+
+    def __init__(self, endpoint=None, cookie_file=None,
+                 pool_size=DEFAULT_POOL_SIZE):
+        self.endpoint = conf.DEFAULT_ENDPOINT if endpoint is None else endpoint
+        self.cookie_file = cookie_file
+        self.pool_size = pool_size
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            # Accept cookies from IP addresses too, e.g. a local endpoint
+            jar = aiohttp.CookieJar(unsafe=True)
+            self._load_cookies(jar)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size,
+                                               ssl=False),
+                cookie_jar=jar, headers={'Accept': 'application/xml'})
+        return self._session
+
+    def _load_cookies(self, jar):
+        if self.cookie_file is None or not os.path.isfile(self.cookie_file):
+            return
+        cookies = MozillaCookieJar(self.cookie_file)
+        try:
+            cookies.load(ignore_discard=True)
+        except (IOError, LoadError):
+            logger.debug("Unreadable cookie file: %s", self.cookie_file)
+            return
+        for cookie in cookies:
+            jar.update_cookies({cookie.name: cookie.value},
+                               URL(self.endpoint))
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _request(self, method, url, **kwargs):
+        """Send a request to URL and return the response along with its
+        body, raising `aiohttp.ClientResponseError` on error statuses.
+        """
+        async with self.session.request(method, self.endpoint + url,
+                                        **kwargs) as response:
+            body = await response.read()
+            response.raise_for_status()
+            return response, body
+
+    async def login(self, username, password):
+        await self._request('POST', '/login', data={
+            'username': username,
+            'password': password,
+        })
+
+    async def logout(self):
+        await self._request('GET', '/logout')
+        self.session.cookie_jar.clear()
+
+    async def xml_get(self, url):
+        _, body = await self._request('GET', url)
+        return etree.fromstring(body)
+
+    async def xml_collection(self, url, tag, convert, params=None, offset=0,
+                             limit=None, page_size=DEFAULT_PAGE_SIZE,
+                             match=None):
+        """Iterate over the paginated collection at URL, like
+        `api.Api.xml_collection`.
+        """
+        params = dict(params or {})
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            params.update(offset=offset, limit=size)
+            root = await self.xml_get('%s?%s' % (
+                url, urlencode(sorted(params.items()))))
+            paginated = root.get('offset') is not None
+            count = 0
+            skipped = 0
+            for elem in ElementTree__iter(root)(tag):
+                count += 1
+                item = convert(elem)
+                if match is not None and not match(item):
+                    continue
+                if not paginated and skipped < offset:
+                    skipped += 1
+                    continue
+                yield item
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining == 0:
+                        return
+            if not paginated or count < size:
+                return
+            offset += count
+            total = root.get('totalCount')
+            if total is not None and offset >= int(total):
+                return
+
+    async def list_applications(self):
+        root = await self.xml_get('/')
+        for elem in ElementTree__iter(root)('item'):
+            if elem.get('published', False):
+                yield to_application(elem)
+
+    async def _list_module_children(self, path):
+        url = mod_url(path) if path else '/module'
+        try:
+            root = await self.xml_get(url)
+        except aiohttp.ClientResponseError as e:
+            if e.status == 403:
+                logger.debug("Access denied for path: %s. Skipping.", path)
+                return []
+            raise
+        return to_module_children(root)
+
+    async def list_modules(self, path=None, recurse=False, concurrency=1):
+        """List the modules found under PATH, descending into projects when
+        RECURSE is set.
+
+        Sub-projects are fetched as soon as their parent is listed, up to
+        CONCURRENCY at a time, while modules are yielded depth-first in the
+        same order as `api.Api.list_modules`.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = []
+
+        async def fetch(app_path):
+            async with semaphore:
+                return await self._list_module_children(app_path)
+
+        def prefetch(children):
+            subprojects = []
+            for app_path, app in children:
+                task = None
+                if recurse and app.type == 'project':
+                    task = asyncio.ensure_future(fetch(app_path))
+                    tasks.append(task)
+                subprojects.append(task)
+            return subprojects
+
+        async def walk(children):
+            for (app_path, app), task in zip(children, prefetch(children)):
+                yield app
+                if task is not None:
+                    logger.debug("Recursing into path: %s", app_path)
+                    async for app in walk(await task):
+                        yield app
+
+        try:
+            async for app in walk(await self._list_module_children(path)):
+                yield app
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def list_runs(self, offset=0, limit=None, page_size=DEFAULT_PAGE_SIZE):
+        return self.xml_collection('/run', 'item', to_run, offset=offset,
+                                   limit=limit, page_size=page_size)
+
+    def list_virtualmachines(self, run_id=None, cloud=None, status=None,
+                             offset=0, limit=None,
+                             page_size=DEFAULT_PAGE_SIZE):
+        params, match = virtualmachine_filters(run_id, cloud, status)
+        return self.xml_collection('/vms', 'vm', to_virtualmachine, params,
+                                   offset, limit, page_size, match)
+
+    async def _create_run(self, data):
+        response, _ = await self._request('POST', '/run', data=data,
+                                          allow_redirects=False)
+        return to_run_id(response.headers['Location'])
+
+    async def build_image(self, path, cloud=None):
+        return await self._create_run(image_form('Machine', path, cloud))
+
+    async def run_image(self, path, cloud=None):
+        return await self._create_run(image_form('Run', path, cloud))
+
+    async def run_deployment(self, path, params=()):
+        return await self._create_run(deployment_form(path, params))
+
+    async def terminate(self, run_id):
+        await self._request('DELETE', '/run/%s' % run_id)
+        return True
+
+    async def terminate_many(self, run_ids,
+                             concurrency=conf.DEFAULT_CONCURRENCY):
+        """Terminate every run of RUN_IDS, with up to CONCURRENCY requests in
+        flight.
+
+        Yield a ``(run_id, error)`` tuple as each request completes, where
+        ERROR is None if the run was successfully terminated.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def terminate(run_id):
+            async with semaphore:
+                try:
+                    await self.terminate(run_id)
+                except Exception as e:
+                    return run_id, e
+                return run_id, None
+
+        tasks = [asyncio.ensure_future(terminate(run_id))
+                 for run_id in run_ids]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def usage(self):
+        root = await self.xml_get('/dashboard')
+        for elem in ElementTree__iter(root)('usageElement'):
+            yield to_usage(elem)
+
+    async def get_module(self, path):
+        return to_module(await self.xml_get(mod_url(path)))
+
+    async def publish(self, path):
+        await self._request('PUT', '%s/publish' % mod_url(path))
+        return True
+
+    async def unpublish(self, path):
+        await self._request('DELETE', '%s/publish' % mod_url(path))
+        return True
+
+    async def delete_module(self, path):
+        await self._request('DELETE', mod_url(path))
+        return True
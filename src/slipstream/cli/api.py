@@ -1,21 +1,44 @@
 from __future__ import absolute_import
 
+import json
 import os
+import re
 import stat
+import threading
+import time
 import uuid
+from contextlib import closing
 
 import requests
-from six.moves.urllib.parse import urlparse
+from concurrent import futures
+from six.moves.urllib.parse import urlencode, urlparse
 from six.moves.http_cookiejar import MozillaCookieJar
 
 from . import conf, models
 from .log import logger
+from .parallel import imap_unordered
+from .resultset import ResultSet
+from .stats import Timer
+from .transport import RETRY_STATUSES, TransportPolicy
 
 try:
     from defusedxml import cElementTree as etree
 except ImportError:
     from defusedxml import ElementTree as etree
 
+DEFAULT_PAGE_SIZE = conf.DEFAULT_PAGE_SIZE
+
+# Fields of `models.VirtualMachine` the server filters on
+VIRTUALMACHINE_PARAMS = ('run_id', 'cloud', 'status')
+
+COOKIE_NAME = 'com.sixsq.slipstream.cookie'
+
+# The session cookie holds its expiry date, in milliseconds since the epoch
+_EXPIRY_DATE = re.compile(r'com\.sixsq\.expirydate=(\d+)')
+
+# Paths of the requests which don't need a valid session
+_SESSIONLESS_PATHS = ('/login', '/logout')
+
 
 def mod_url(path):
     parts = path.strip('/').split('/')
@@ -33,16 +56,196 @@ def mod(path, with_version=True):
 
 
 def ElementTree__iter(root):
-    return getattr(root, 'iter',  # Python 2.7 and above
-                   root.getiterator)  # Python 2.6 compatibility
+    try:
+        return root.iter  # Python 2.7 and above
+    except AttributeError:
+        return root.getiterator  # Python 2.6 compatibility
+
+
+# Conversions from the documents served by SlipStream to `models`, shared by
+# `Api` and `aio.AsyncApi`.
+
+def to_application(elem):
+    return models.App(name=elem.get('name'),
+                      type=elem.get('category').lower(),
+                      version=int(elem.get('version')),
+                      path=mod(elem.get('resourceUri'), with_version=False))
+
+
+def to_module_children(root):
+    """Return the ``(app_path, models.App)`` pairs listed in the module or
+    module list ROOT.
+    """
+    children = []
+    for elem in ElementTree__iter(root)('item'):
+        # Compute module path
+        if elem.get('resourceUri'):
+            app_path = elem.get('resourceUri')
+        else:
+            app_path = "%s/%s" % (root.get('parentUri').strip('/'),
+                                  '/'.join([root.get('shortName'),
+                                            elem.get('name'),
+                                            elem.get('version')]))
+
+        logger.debug("Found module with path: %s", app_path)
+        app = models.App(name=elem.get('name'),
+                         type=elem.get('category').lower(),
+                         version=int(elem.get('version')),
+                         path=mod(app_path, with_version=False))
+        children.append((app_path, app))
+    return children
+
+
+def to_module(root):
+    return models.App(name=root.get('shortName'),
+                      type=root.get('category').lower(),
+                      version=int(root.get('version')),
+                      path=mod('%s/%s' % (root.get('parentUri').strip('/'),
+                                          root.get('shortName'))))
+
+
+def to_run(elem):
+    return models.Run(id=elem.get('uuid'),
+                      module=mod(elem.get('moduleResourceUri')),
+                      status=elem.get('status').lower(),
+                      started_at=elem.get('startTime'),
+                      cloud=elem.get('cloudServiceName'))
+
+
+def to_virtualmachine(elem):
+    return models.VirtualMachine(id=elem.get('instanceId'),
+                                 cloud=elem.get('cloud'),
+                                 status=elem.get('state').lower(),
+                                 run_id=elem.get('runUuid'))
+
+
+def to_usage(elem):
+    return models.Usage(cloud=elem.get('cloud'),
+                        usage=int(elem.get('currentUsage')),
+                        quota=int(elem.get('quota')))
+
+
+def to_run_id(location):
+    """Return the UUID of the run created at LOCATION."""
+    return uuid.UUID(location.split('/')[-1])
+
+
+def virtualmachine_filters(run_id=None, cloud=None, status=None, where=None):
+    """Return the query parameters selecting virtual machines of the run
+    RUN_ID, on CLOUD or in STATUS, and a function checking that a
+    `models.VirtualMachine` matches them, for servers which ignore them.
+
+    The equalities on these fields required by WHERE, a `where.Where`, are
+    sent along unless given, and the function checks WHERE as well.
+    """
+    if where is not None:
+        equalities = where.equalities(VIRTUALMACHINE_PARAMS)
+        if run_id is None and 'run_id' in equalities:
+            try:
+                run_id = uuid.UUID(equalities['run_id'])
+            except ValueError:
+                # Nothing will match
+                pass
+        cloud = equalities.get('cloud') if cloud is None else cloud
+        status = equalities.get('status') if status is None else status
+    params = {}
+    if run_id is not None:
+        run_id = uuid.UUID(str(run_id))
+        params['runUuid'] = str(run_id)
+    if cloud is not None:
+        params['cloud'] = cloud
+    if status is not None:
+        params['status'] = status
+
+    def match(vm):
+        if run_id is not None and vm.run_id != run_id:
+            return False
+        if cloud is not None and vm.cloud != cloud:
+            return False
+        if status is not None and vm.status != status.lower():
+            return False
+        if where is not None and not where.match(vm):
+            return False
+        return True
+
+    return params, match
+
+
+def select(items, match=None, offset=0, limit=None, until=None):
+    """Yield the ITEMS for which MATCH returns true, skipping OFFSET of them
+    and stopping after LIMIT, or at the first item for which UNTIL returns
+    true. ITEMS, a generator, is closed then.
+    """
+    try:
+        if limit == 0:
+            return
+        for item in items:
+            if until is not None and until(item):
+                return
+            if match is not None and not match(item):
+                continue
+            if offset:
+                offset -= 1
+                continue
+            yield item
+            if limit is not None:
+                limit -= 1
+                if limit == 0:
+                    return
+    finally:
+        items.close()
+
+
+def image_form(type, path, cloud=None):
+    return {
+        'type': type,
+        'refqname': path,
+        'parameter--cloudservice': cloud or 'default',
+    }
+
+
+def deployment_form(path, params=()):
+    data = {'refqname': path}
+    for node, (key, value) in params:
+        data['parameter--node--{0}--{1}'.format(node, key)] = value
+    return data
+
+
+class SessionExpired(requests.RequestException):
+    """Raised instead of sending a request with a session which expired,
+    when there are no credentials to renew it.
+    """
+
+
+def _domain_match(host, domain):
+    domain = domain.lstrip('.')
+    # Cookies of hosts without a dot, such as localhost, get a '.local'
+    return host == domain or host.endswith('.' + domain) \
+        or host + '.local' == domain
 
 
 class SessionStore(requests.Session):
     """A ``requests.Session`` subclass implementing a file-based session store.
+
+    The cookie file is only rewritten when a response actually changes the
+    content of the cookie jar. Connections are pooled and failed requests
+    retried according to a `transport.TransportPolicy`. Every request sent
+    is recorded in STATS, a `stats.RequestStats`, if given.
+
+    The expiry date of the session is read from its cookie before each
+    request. Once the session has expired, or is about to, it is renewed by
+    calling ``reauthenticate`` if set, and otherwise `SessionExpired` is
+    raised without sending the request.
     """
+    reauthenticate = None
 
-    def __init__(self, cookie_file=None):
+    def __init__(self, cookie_file=None, policy=None, stats=None):
         super(SessionStore, self).__init__()
+        self.policy = TransportPolicy() if policy is None else policy
+        self.stats = stats
+        self.breaker = self.policy.circuit_breaker()
+        for prefix in ('https://', 'http://'):
+            self.mount(prefix, self.policy.adapter())
         if cookie_file is None:
             cookie_file = conf.DEFAULT_COOKIE_FILE
         cookie_dir = os.path.dirname(cookie_file)
@@ -54,26 +257,183 @@ class SessionStore(requests.Session):
         if os.path.isfile(cookie_file):
             self.cookies.load(ignore_discard=True)
             self.cookies.clear_expired_cookies()
-
-    def request(self, *args, **kwargs):
-        response = super(SessionStore, self).request(*args, **kwargs)
-        self.cookies.save(ignore_discard=True)
+        self._save_lock = threading.Lock()
+        self._saved_state = self._cookies_state()
+        self._login_lock = threading.Lock()
+
+    def _cookies_state(self):
+        return sorted((cookie.domain, cookie.path, cookie.name, cookie.value,
+                       cookie.expires) for cookie in self.cookies)
+
+    def expiry(self, url):
+        """Return the time, in seconds since the epoch, at which the session
+        for URL expires, or None if unknown.
+        """
+        host = urlparse(url).hostname or ''
+        for cookie in self.cookies:
+            if cookie.name == COOKIE_NAME and _domain_match(host,
+                                                            cookie.domain):
+                match = _EXPIRY_DATE.search(cookie.value or '')
+                if match:
+                    return int(match.group(1)) / 1000.0
+        return None
+
+    def _expired(self, url):
+        expiry = self.expiry(url)
+        return expiry is not None and \
+            time.time() + conf.SESSION_EXPIRY_MARGIN >= expiry
+
+    def check_session(self, url):
+        """Renew the session for URL, or raise `SessionExpired`, if it has
+        expired or is about to.
+        """
+        if urlparse(url).path.endswith(_SESSIONLESS_PATHS) \
+                or not self._expired(url):
+            return
+        if self.reauthenticate is None:
+            raise SessionExpired("Authentication cookie expired. "
+                                 "Log in with `slipstream login`.")
+        with self._login_lock:
+            # Concurrent requests only renew it once
+            if self._expired(url):
+                logger.debug("Session expired, logging in again.")
+                self.reauthenticate()
+
+    def request(self, method, url, *args, **kwargs):
+        self.check_session(url)
+        # Identifies the request and its retries in the log file
+        extra = None
+        if logger.enabled_for(logger.DEBUG):
+            extra = {'request_id': uuid.uuid4().hex}
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            try:
+                response = super(SessionStore, self).request(method, url,
+                                                             *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self.stats is not None:
+                    self.stats.record_request(method, url, None)
+                self.breaker.record_failure()
+                delay = None
+                if self.policy.should_retry(method, attempt):
+                    delay = self.policy.delay(attempt)
+                if delay is None:
+                    raise
+                logger.debug("%s %s failed: %s", method, url, e, extra=extra)
+            else:
+                if self.stats is not None:
+                    self._record(method, url, response, kwargs.get('stream'))
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    break
+                self.breaker.record_failure()
+                delay = None
+                if self.policy.should_retry(method, attempt):
+                    delay = self.policy.delay(attempt, response)
+                if delay is None:
+                    break
+                logger.debug("%s %s failed with status %d", method, url,
+                             response.status_code, extra=extra)
+                response.close()
+            logger.debug("Retrying in %.1fs.", delay, extra=extra)
+            time.sleep(delay)
+            attempt += 1
+        logger.debug("%s %s: %d", method, url, response.status_code,
+                     extra=extra)
+
+        with self._save_lock:
+            if self._cookies_state() != self._saved_state:
+                self.save()
         return response
 
+    def _record(self, method, url, response, stream):
+        body = response.request.body
+        self.stats.record_request(method, url, response.status_code,
+                                  len(body) if body else 0,
+                                  response.elapsed.total_seconds())
+        # The body of streamed responses is counted as it is read
+        if not stream:
+            self.stats.record_received(method, url, len(response.content))
+
+    def save(self, ignore_discard=True):
+        """Write the cookie jar to its file.
+
+        Cookies are written to a temporary file which then replaces the
+        cookie file, so that readers never see a partially written file.
+        """
+        conf.atomic_write(self.cookies.filename, lambda filename:
+                          self.cookies.save(filename,
+                                            ignore_discard=ignore_discard))
+        self._saved_state = self._cookies_state()
+
+    def reserve_connections(self, count):
+        """Make sure COUNT connections per host can be kept alive, so that
+        as many concurrent requests don't need to open new ones.
+        """
+        for prefix, adapter in list(self.adapters.items()):
+            if getattr(adapter, '_pool_maxsize', count) < count:
+                self.mount(prefix, self.policy.adapter(count))
+
     def clear(self, domain):
         """Clear cookies for the specified domain."""
         try:
             self.cookies.clear(domain)
-            self.cookies.save()
+            self.save(ignore_discard=False)
         except KeyError:
             pass
 
 
+class ResponseReader(object):
+    """A file-like object reading the body of a streamed response, and
+    copying it into a `cache.CacheWriter` if one is given.
+
+    With a `stats.RequestStats`, the time spent reading is kept in
+    ``read_seconds`` and the size of the body is recorded once closed.
+    """
+
+    def __init__(self, response, writer=None, stats=None):
+        self.response = response
+        self.writer = writer
+        self.stats = stats
+        self.received = 0
+        self.read_seconds = 0.0
+
+    def read(self, size=None):
+        if self.stats is not None:
+            start = time.time()
+            data = self.response.raw.read(size)
+            self.read_seconds += time.time() - start
+            self.received += len(data)
+        else:
+            data = self.response.raw.read(size)
+        if self.writer is not None:
+            if data:
+                self.writer.write(data)
+            if not data or size is None:
+                self.writer.commit()
+        return data
+
+    def close(self):
+        self.response.close()
+        if self.writer is not None:
+            self.writer.close()
+        if self.stats is not None and self.received:
+            self.stats.record_received(self.response.request.method,
+                                       self.response.url, self.received)
+            self.received = 0
+
+
 class Api(object):
 
-    def __init__(self, endpoint=None, cookie_file=None):
+    def __init__(self, endpoint=None, cookie_file=None, cache=None,
+                 policy=None, stats=None):
         self.endpoint = conf.DEFAULT_ENDPOINT if endpoint is None else endpoint
-        self.session = SessionStore(cookie_file)
+        # The user of the session, set by the CLI from its settings
+        self.username = None
+        self.cache = cache
+        self.stats = stats
+        self.session = SessionStore(cookie_file, policy, stats)
         self.session.verify = False
         self.session.headers.update({'Accept': 'application/xml'})
 
@@ -84,153 +444,387 @@ class Api(object):
         })
         response.raise_for_status()
 
+    def remember_credentials(self, username, password):
+        """Log in again with USERNAME and PASSWORD whenever the session
+        expires, instead of failing.
+        """
+        self.session.reauthenticate = lambda: self.login(username, password)
+
+    def fresh(self):
+        """Return the API to poll the server with, whose listings are never
+        reused. Wrappers reusing results, like the one of the shell, return
+        the API they wrap.
+        """
+        return self
+
     def logout(self):
         response = self.session.get('%s/logout' % self.endpoint)
         response.raise_for_status()
         url = urlparse(self.endpoint)
         self.session.clear(url.netloc)
+        if self.cache is not None:
+            self.cache.clear()
+
+    def _open(self, url, accept):
+        """Return a file-like object reading the body of the resource at URL.
+
+        When the Api has a response cache, fresh responses are read from it
+        and stale ones are revalidated with a conditional request.
+        """
+        url = '%s%s' % (self.endpoint, url)
+        headers = {'Accept': accept}
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.lookup(url, accept)
+            if entry is not None:
+                if entry.fresh:
+                    logger.log(logger.VERBOSE_DEBUG,
+                               "Using cached response for: %s", url)
+                    if self.stats is not None:
+                        self.stats.record_cached('GET', url)
+                    return entry.open()
+                headers.update(entry.validators())
+
+        response = self.session.get(url, headers=headers, stream=True)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.cache.revalidated(entry, response)
+            logger.log(logger.VERBOSE_DEBUG,
+                       "Cached response still valid for: %s", url)
+            return entry.open()
+        if not response.ok:
+            # Load the error document before the connection is released
+            response.content
+            response.raise_for_status()
+        response.raw.decode_content = True
+
+        writer = None
+        if self.cache is not None:
+            writer = self.cache.writer(url, accept, response)
+        return ResponseReader(response, writer, self.stats)
+
+    def _invalidate(self, *urls):
+        if self.cache is not None:
+            for url in urls:
+                self.cache.invalidate('%s%s' % (self.endpoint, url))
+
+    def _record_parse(self, url, seconds, fp):
+        # Reading the body is part of the network time, not of the parsing
+        seconds -= getattr(fp, 'read_seconds', 0.0)
+        self.stats.record_parse('GET', '%s%s' % (self.endpoint, url),
+                                max(0.0, seconds))
 
     def xml_get(self, url):
-        response = self.session.get('%s%s' % (self.endpoint, url),
-                                    headers={'Accept': 'application/xml'})
-        response.raise_for_status()
-        return etree.fromstring(response.text)
+        with closing(self._open(url, 'application/xml')) as fp:
+            start = time.time()
+            root = etree.parse(fp).getroot()
+            if self.stats is not None:
+                self._record_parse(url, time.time() - start, fp)
+            return root
+
+    def xml_iter(self, url, tag, root_attrs=None):
+        """Incrementally parse the XML document at URL, yielding each TAG
+        element as soon as it is complete.
+
+        The body is streamed from the server and every yielded element is
+        discarded once the consumer moves on, so memory usage does not grow
+        with the size of the document. If a ROOT_ATTRS dict is given, it is
+        updated with the attributes of the root element before the first
+        element is yielded.
+        """
+        with closing(self._open(url, 'application/xml')) as fp:
+            parents = []
+            events = etree.iterparse(fp, events=('start', 'end'))
+            timer = None
+            if self.stats is not None:
+                timer = Timer()
+                events = timer.iterate(events)
+            try:
+                for event, elem in events:
+                    if event == 'start':
+                        if not parents and root_attrs is not None:
+                            root_attrs.update(elem.attrib)
+                        parents.append(elem)
+                        continue
+                    parents.pop()
+                    if elem.tag == tag:
+                        yield elem
+                        elem.clear()
+                        if parents:
+                            parents[-1].remove(elem)
+            finally:
+                if timer is not None:
+                    self._record_parse(url, timer.seconds, fp)
+
+    def xml_collection(self, url, tag, convert, params=None, offset=0,
+                       limit=None, page_size=DEFAULT_PAGE_SIZE, match=None):
+        """Iterate over the paginated collection at URL, yielding each TAG
+        element converted with CONVERT.
+
+        Pages of PAGE_SIZE elements are requested as the generator is
+        consumed, starting at OFFSET and stopping once LIMIT items have been
+        yielded. PARAMS are sent along as query parameters. Items for which
+        MATCH returns false are skipped, which filters the collection on the
+        client side when the server ignores some PARAMS. When the server
+        ignores paging altogether, OFFSET and LIMIT are applied on the client
+        side as well.
+        """
+        params = dict(params or {})
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            params.update(offset=offset, limit=size)
+            page_url = '%s?%s' % (url, urlencode(sorted(params.items())))
+            root_attrs = {}
+            paginated = True
+            count = 0
+            skipped = 0
+            for elem in self.xml_iter(page_url, tag, root_attrs):
+                if count == 0:
+                    paginated = 'offset' in root_attrs
+                    if not paginated:
+                        logger.debug("Paging ignored for: %s", url)
+                count += 1
+                item = convert(elem)
+                if match is not None and not match(item):
+                    continue
+                if not paginated and skipped < offset:
+                    skipped += 1
+                    continue
+                yield item
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining == 0:
+                        return
+            if not paginated or count < size:
+                return
+            offset += count
+            total = root_attrs.get('totalCount')
+            if total is not None and offset >= int(total):
+                return
 
     def json_get(self, url):
-        response = self.session.get('%s%s' % (self.endpoint, url),
-                                    headers={'Accept': 'application/json'})
-        response.raise_for_status()
-        return response.json()
-
-    def list_applications(self):
+        with closing(self._open(url, 'application/json')) as fp:
+            start = time.time()
+            document = json.loads(fp.read().decode('utf-8'))
+            if self.stats is not None:
+                self._record_parse(url, time.time() - start, fp)
+            return document
+
+    def list_applications(self, where=None):
+        """List the published applications, only those matching WHERE, a
+        `where.Where`, if given.
+        """
         root = self.xml_get('/')
         for elem in ElementTree__iter(root)('item'):
             if elem.get('published', False):
-                yield models.App(name=elem.get('name'),
-                                 type=elem.get('category').lower(),
-                                 version=int(elem.get('version')),
-                                 path=mod(elem.get('resourceUri'),
-                                          with_version=False))
-
-    def list_modules(self, path=None, recurse=False):
-        logger.log(logger.VERBOSE_DEBUG, "Starting with path: {0}".format(path))
+                app = to_application(elem)
+                if where is None or where.match(app):
+                    yield app
+
+    def _list_module_children(self, path):
+        """Return the ``(app_path, models.App)`` pairs listed under PATH."""
+        logger.log(logger.VERBOSE_DEBUG, "Starting with path: %s", path)
         # Path normalization
         if not path:
             url = '/module'
         else:
             url = mod_url(path)
-        logger.log(logger.VERBOSE_DEBUG, "Using normalized URL: {0}".format(url))
+        logger.log(logger.VERBOSE_DEBUG, "Using normalized URL: %s", url)
 
         try:
             root = self.xml_get(url)
         except requests.HTTPError as e:
             if e.response.status_code == 403:
-                logger.debug("Access denied for path: {0}. Skipping.".format(path))
-                return
+                logger.debug("Access denied for path: %s. Skipping.", path)
+                return []
             raise
+        return to_module_children(root)
+
+    def list_modules(self, path=None, recurse=False, concurrency=1,
+                     where=None):
+        """List the modules found under PATH, descending into projects when
+        RECURSE is set.
+
+        With a CONCURRENCY greater than one, a recursive listing fetches up to
+        that many projects in parallel. Modules are yielded in the same order
+        either way.
+
+        With WHERE, a `where.Where`, only the modules matching it are listed,
+        and projects which can't hold any, as told by the path conditions of
+        WHERE, are not fetched.
+        """
+        if where is None:
+            descend = lambda app: app.type == 'project'
+        else:
+            descend = lambda app: app.type == 'project' \
+                and where.may_contain(app.path)
+        if recurse and concurrency > 1:
+            modules = self._crawl_modules(path, concurrency, descend)
+        else:
+            modules = self._walk_modules(path, recurse, descend)
+        return modules if where is None else select(modules, where.match)
 
-        for elem in ElementTree__iter(root)('item'):
-            # Compute module path
-            if elem.get('resourceUri'):
-                app_path = elem.get('resourceUri')
-            else:
-                app_path = "%s/%s" % (root.get('parentUri').strip('/'),
-                                      '/'.join([root.get('shortName'),
-                                                elem.get('name'),
-                                                elem.get('version')]))
-
-            logger.debug("Found module with path: {0}".format(app_path))
-            app = models.App(name=elem.get('name'),
-                             type=elem.get('category').lower(),
-                             version=int(elem.get('version')),
-                             path=mod(app_path, with_version=False))
+    def _walk_modules(self, path, recurse, descend):
+        for app_path, app in self._list_module_children(path):
             yield app
-            if app.type == 'project' and recurse:
-                logger.debug("Recursing into path: {0}".format(app_path))
-                for app in self.list_modules(app_path, recurse):
+            if recurse and descend(app):
+                logger.debug("Recursing into path: %s", app_path)
+                for app in self._walk_modules(app_path, recurse, descend):
                     yield app
 
-    def list_runs(self):
-        root = self.xml_get('/run')
-        for elem in ElementTree__iter(root)('item'):
-            yield models.Run(id=uuid.UUID(elem.get('uuid')),
-                             module=mod(elem.get('moduleResourceUri')),
-                             status=elem.get('status').lower(),
-                             started_at=elem.get('startTime'),
-                             cloud=elem.get('cloudServiceName'))
-
-    def list_virtualmachines(self):
-        root = self.xml_get('/vms')
-        for elem in ElementTree__iter(root)('vm'):
-            yield models.VirtualMachine(id=uuid.UUID(elem.get('instanceId')),
-                                        cloud=elem.get('cloud'),
-                                        status=elem.get('state').lower(),
-                                        run_id=uuid.UUID(elem.get('runUuid')))
+    def _crawl_modules(self, path, concurrency, descend):
+        # Projects are fetched breadth-first: every listing submits its own
+        # sub-projects to the pool as soon as it has been parsed, while the
+        # generator below waits on them in depth-first order.
+        self.session.reserve_connections(concurrency)
+        executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+        lock = threading.Lock()
+        pending = {}
+        state = {'closed': False}
+
+        def fetch(app_path):
+            children = self._list_module_children(app_path)
+            with lock:
+                if not state['closed']:
+                    for child_path, app in children:
+                        if descend(app):
+                            logger.debug("Recursing into path: %s", child_path)
+                            pending[child_path] = executor.submit(fetch,
+                                                                  child_path)
+            return children
+
+        def walk(app_path):
+            with lock:
+                future = pending.pop(app_path)
+            for child_path, app in future.result():
+                yield app
+                if descend(app):
+                    for app in walk(child_path):
+                        yield app
+
+        pending[path] = executor.submit(fetch, path)
+        try:
+            for app in walk(path):
+                yield app
+        finally:
+            with lock:
+                state['closed'] = True
+                for future in pending.values():
+                    future.cancel()
+            executor.shutdown(wait=True)
+
+    def list_runs(self, offset=0, limit=None, page_size=DEFAULT_PAGE_SIZE,
+                  columnar=False, where=None):
+        """List runs, requesting pages of PAGE_SIZE runs as they are
+        consumed, starting at OFFSET and stopping after LIMIT runs.
+
+        With WHERE, a `where.Where`, only the runs matching it are listed,
+        OFFSET and LIMIT applying to them. As runs are listed newest first,
+        the listing stops at the first run started before the earliest start
+        time WHERE allows. With COLUMNAR, return all of them at once in a
+        `resultset.ResultSet`.
+        """
+        if where is None:
+            runs = self.xml_collection('/run', 'item', to_run, offset=offset,
+                                       limit=limit, page_size=page_size)
+        else:
+            since = where.lower_bound('started_at')
+            until = None if since is None else lambda run: \
+                run.started_at is not None and run.started_at < since
+            runs = select(self.xml_collection('/run', 'item', to_run,
+                                              page_size=page_size),
+                          where.match, offset, limit, until)
+        return ResultSet(models.Run, runs) if columnar else runs
+
+    def list_virtualmachines(self, run_id=None, cloud=None, status=None,
+                             offset=0, limit=None,
+                             page_size=DEFAULT_PAGE_SIZE, columnar=False,
+                             where=None):
+        """List virtual machines, optionally only those of the run RUN_ID,
+        on CLOUD or in STATUS, and matching WHERE, a `where.Where`.
+
+        Filters and paging are handled by the server, falling back to the
+        client for servers which ignore them. The conditions of WHERE which
+        the server can't handle are checked by the client, and paging along
+        with them. With COLUMNAR, return all of them at once in a
+        `resultset.ResultSet`.
+        """
+        params, match = virtualmachine_filters(run_id, cloud, status, where)
+        if where is None or where.covered_by(VIRTUALMACHINE_PARAMS):
+            vms = self.xml_collection('/vms', 'vm', to_virtualmachine, params,
+                                      offset, limit, page_size, match)
+        else:
+            vms = select(self.xml_collection('/vms', 'vm', to_virtualmachine,
+                                             params, page_size=page_size,
+                                             match=match),
+                         offset=offset, limit=limit)
+        return ResultSet(models.VirtualMachine, vms) if columnar else vms
 
     def build_image(self, path, cloud=None):
-        response = self.session.post(self.endpoint + '/run', data={
-            'type': 'Machine',
-            'refqname': path,
-            'parameter--cloudservice': cloud or 'default',
-        })
+        response = self.session.post(self.endpoint + '/run',
+                                     data=image_form('Machine', path, cloud))
         response.raise_for_status()
-        run_id = response.headers['location'].split('/')[-1]
-        return uuid.UUID(run_id)
+        self._invalidate('/run', '/vms')
+        return to_run_id(response.headers['location'])
 
     def run_image(self, path, cloud=None):
-        response = self.session.post(self.endpoint + '/run', data={
-            'type': 'Run',
-            'refqname': path,
-            'parameter--cloudservice': cloud or 'default',
-        })
+        response = self.session.post(self.endpoint + '/run',
+                                     data=image_form('Run', path, cloud))
         response.raise_for_status()
-        run_id = response.headers['location'].split('/')[-1]
-        return uuid.UUID(run_id)
+        self._invalidate('/run', '/vms')
+        return to_run_id(response.headers['location'])
 
     def run_deployment(self, path, params=()):
-        data = {'refqname': path}
-        for node, (key, value) in params:
-            data['parameter--node--{0}--{1}'.format(node, key)] = value
-
-        response = self.session.post(self.endpoint + '/run', data=data)
+        response = self.session.post(self.endpoint + '/run',
+                                     data=deployment_form(path, params))
         response.raise_for_status()
-        run_id = response.headers['location'].split('/')[-1]
-        return uuid.UUID(run_id)
+        self._invalidate('/run', '/vms')
+        return to_run_id(response.headers['location'])
 
     def terminate(self, run_id):
         response = self.session.delete('%s/run/%s' % (self.endpoint, run_id))
         response.raise_for_status()
+        self._invalidate('/run', '/vms')
         return True
 
+    def terminate_many(self, run_ids, concurrency=conf.DEFAULT_CONCURRENCY):
+        """Terminate every run of RUN_IDS, with up to CONCURRENCY requests in
+        flight over the session's connection pool.
+
+        Yield a ``(run_id, error)`` tuple as each request completes, where
+        ERROR is None if the run was successfully terminated.
+        """
+        self.session.reserve_connections(concurrency)
+        for run_id, _, error in imap_unordered(self.terminate, run_ids,
+                                               concurrency):
+            yield run_id, error
+
     def usage(self):
         root = self.xml_get('/dashboard')
         for elem in ElementTree__iter(root)('usageElement'):
-            yield models.Usage(cloud=elem.get('cloud'),
-                               usage=int(elem.get('currentUsage')),
-                               quota=int(elem.get('quota')))
+            yield to_usage(elem)
 
     def get_module(self, path):
-        root = self.xml_get(mod_url(path))
-        return models.App(name=root.get('shortName'),
-                          type=root.get('category').lower(),
-                          version=int(root.get('version')),
-                          path=mod('%s/%s' % (root.get('parentUri').strip('/'),
-                                              root.get('shortName'))))
+        return to_module(self.xml_get(mod_url(path)))
 
     def publish(self, path):
         response = self.session.put('%s%s/publish' % (self.endpoint,
                                                       mod_url(path)))
         response.raise_for_status()
+        self._invalidate('/module')
         return True
 
     def unpublish(self, path):
         response = self.session.delete('%s%s/publish' % (self.endpoint,
                                                          mod_url(path)))
         response.raise_for_status()
+        self._invalidate('/module')
         return True
 
     def delete_module(self, path):
         response = self.session.delete('%s%s' % (self.endpoint, mod_url(path)))
 
         response.raise_for_status()
+        self._invalidate('/module')
         return True
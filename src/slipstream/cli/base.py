@@ -27,6 +27,8 @@ class Config(object):
         self.filename = conf.DEFAULT_CONFIG_FILE if filename is None else filename
         self.profile = conf.DEFAULT_PROFILE if profile is None else profile
         self.parser = configparser.ConfigParser(interpolation=None)
+        # Creates the `api.Api` of commands, e.g. to reuse those of an agent
+        self.api_factory = None
 
     def read_config(self):
         if os.path.isfile(self.filename):
@@ -76,11 +78,38 @@ pass_config = click.make_pass_decorator(Config)
 class AliasedGroup(click.Group):
     """This subclass of a group supports looking up aliases in a config
     file and with a bit of magic.
+
+    Subcommands can also be registered lazily with `add_lazy_command`, in
+    which case the module defining them is only imported when they are
+    looked up.
     """
 
+    def __init__(self, *args, **kwargs):
+        super(AliasedGroup, self).__init__(*args, **kwargs)
+        self.lazy_commands = {}
+
+    def add_lazy_command(self, name, import_name):
+        """Register the command NAME, defined by IMPORT_NAME in the form
+        'package.module:attribute'.
+        """
+        self.lazy_commands[name] = import_name
+
+    def list_commands(self, ctx):
+        return sorted(set(super(AliasedGroup, self).list_commands(ctx)) |
+                      set(self.lazy_commands))
+
+    def _get_builtin_command(self, ctx, cmd_name):
+        rv = click.Group.get_command(self, ctx, cmd_name)
+        if rv is None and cmd_name in self.lazy_commands:
+            module_name, attr = self.lazy_commands.pop(cmd_name).split(':')
+            module = __import__(module_name, fromlist=[attr])
+            rv = getattr(module, attr)
+            self.add_command(rv, cmd_name)
+        return rv
+
     def get_command(self, ctx, cmd_name):
         # Step one: bulitin commands as normal
-        rv = click.Group.get_command(self, ctx, cmd_name)
+        rv = self._get_builtin_command(ctx, cmd_name)
         if rv is not None:
             return rv
 
@@ -96,7 +125,10 @@ class AliasedGroup(click.Group):
         cmd_names = cmd_name.split(' ')
         root = self
         for _cmd_name in cmd_names:
-            root = click.Group.get_command(root, ctx, _cmd_name)
+            if isinstance(root, AliasedGroup):
+                root = root._get_builtin_command(ctx, _cmd_name)
+            else:
+                root = click.Group.get_command(root, ctx, _cmd_name)
             if root is None:
                 return
         return root
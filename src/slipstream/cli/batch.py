@@ -0,0 +1,107 @@
+from __future__ import absolute_import, unicode_literals
+
+import codecs
+import csv
+import os
+
+import six
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _node_params(values):
+    """Convert 'NODE:KEY=VALUE' strings or a {node: {key: value}} mapping to
+    ``(node, (key, value))`` tuples, as given by `types.NodeKeyValue`.
+    """
+    params = []
+    if isinstance(values, dict):
+        for node in sorted(values):
+            for key in sorted(values[node]):
+                params.append((node, (key, six.text_type(values[node][key]))))
+        return tuple(params)
+    for value in values:
+        try:
+            node, param = value.split(':', 1)
+            key, value = param.split('=', 1)
+        except ValueError:
+            raise ManifestError("%s is not a valid NODE:KEY=VALUE value"
+                                % value)
+        params.append((node, (key, value)))
+    return tuple(params)
+
+
+def _read_yaml(fp):
+    try:
+        import yaml
+    except ImportError:
+        raise ManifestError("PyYAML is required to read YAML manifests.")
+    rows = []
+    for i, row in enumerate(yaml.safe_load(fp) or []):
+        if not isinstance(row, dict) or 'path' not in row:
+            raise ManifestError("Row %d has no module path." % (i + 1))
+        rows.append((six.text_type(row.get('id', i + 1)), row['path'],
+                     _node_params(row.get('params') or ())))
+    return rows
+
+
+def _read_csv(fp):
+    lines = [line.encode('utf-8') for line in fp] if six.PY2 else fp
+    reader = csv.reader(lines)
+    try:
+        header = next(reader)
+    except StopIteration:
+        return []
+    if six.PY2:
+        header = [column.decode('utf-8') for column in header]
+    if 'path' not in header:
+        raise ManifestError("The manifest has no 'path' column.")
+    rows = []
+    for i, values in enumerate(reader):
+        if not values:
+            continue
+        if six.PY2:
+            values = [value.decode('utf-8') for value in values]
+        row = dict(zip(header, values))
+        params = ['%s=%s' % (column, value) for column, value in zip(header, values)
+                  if column not in ('id', 'path') and value]
+        rows.append((row.get('id') or six.text_type(i + 1), row['path'],
+                     _node_params(params)))
+    return rows
+
+
+def read_manifest(filename):
+    """Read the deployments listed in the YAML or CSV manifest FILENAME.
+
+    A YAML manifest is a list of mappings with a 'path', an optional 'id'
+    and optional 'params', either as a list of 'NODE:KEY=VALUE' strings or
+    as a mapping of nodes to parameters. A CSV manifest has a 'path' column,
+    an optional 'id' column, and one 'NODE:KEY' column per parameter.
+
+    Return a list of ``(id, path, params)`` tuples, where rows without an
+    id are identified by their position in the manifest.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    with codecs.open(filename, encoding='utf8') as fp:
+        if ext in ('.yaml', '.yml'):
+            return _read_yaml(fp)
+        elif ext == '.csv':
+            return _read_csv(fp)
+    raise ManifestError("Unknown manifest format '%s', expected .yaml or "
+                        ".csv." % ext)
+
+
+def read_results(filename):
+    """Return the ids of the rows already launched according to the results
+    file FILENAME, written by `write_result`.
+    """
+    if not os.path.isfile(filename):
+        return set()
+    with codecs.open(filename, encoding='utf8') as fp:
+        return set(line.split('\t', 1)[0] for line in fp if line.strip())
+
+
+def write_result(fp, row_id, path, run_id):
+    fp.write('%s\t%s\t%s\n' % (row_id, path, run_id))
+    fp.flush()
@@ -0,0 +1,260 @@
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
+
+from . import conf
+
+# Number of seconds a response is used without revalidation, by path prefix.
+# Resources which change all the time are always revalidated.
+DEFAULT_TTLS = {
+    '/module': 300,
+    '/dashboard': 0,
+    '/run': 0,
+    '/vms': 0,
+}
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+class CacheEntry(object):
+    """A response stored in a `ResponseCache`."""
+
+    def __init__(self, cache, key, meta):
+        self.cache = cache
+        self.key = key
+        self.meta = meta
+
+    @property
+    def body_file(self):
+        return os.path.join(self.cache.directory, self.key + '.body')
+
+    @property
+    def fresh(self):
+        """Whether the entry can be used without asking the server."""
+        age = time.time() - self.meta['validated_at']
+        return age < self.cache.ttl(self.meta['url'])
+
+    def validators(self):
+        """Return the headers making a request conditional on this entry."""
+        headers = {}
+        if self.meta.get('etag'):
+            headers['If-None-Match'] = self.meta['etag']
+        if self.meta.get('last_modified'):
+            headers['If-Modified-Since'] = self.meta['last_modified']
+        return headers
+
+    def open(self):
+        return open(self.body_file, 'rb')
+
+
+class CacheWriter(object):
+    """Write a response body into a `ResponseCache` as it is being read.
+
+    Nothing is visible in the cache until `commit` has been called.
+    """
+
+    def __init__(self, cache, key, meta):
+        self.cache = cache
+        self.key = key
+        self.meta = meta
+        self.size = 0
+        fd, self.tmp_filename = tempfile.mkstemp(dir=cache.directory,
+                                                 prefix='.', suffix='.tmp')
+        self.fp = os.fdopen(fd, 'wb')
+
+    def write(self, data):
+        self.fp.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        if self.fp is None:
+            return
+        self.fp.close()
+        self.fp = None
+        self.meta['size'] = self.size
+        self.cache._commit(self.key, self.meta, self.tmp_filename)
+
+    def close(self):
+        """Discard the body unless it has been committed."""
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+            _remove(self.tmp_filename)
+
+
+class ResponseCache(object):
+    """A size-bounded on-disk cache of HTTP responses.
+
+    Responses are keyed by URL, Accept header and USERNAME, as the server
+    shows every user something different. Each one is used as is for a time
+    depending on the resource, after which it is revalidated with the
+    server using its ETag and Last-Modified headers. The least recently used
+    responses are evicted once the cache grows over MAX_SIZE bytes.
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE, max_age=None,
+                 ttls=None, username=None):
+        self.directory = conf.DEFAULT_CACHE_DIR if directory is None else directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.username = username
+        self._lock = threading.Lock()
+        # Total size of the bodies in the cache, counted on the first commit
+        self._size = None
+
+    def key(self, url, accept):
+        digest = hashlib.sha1(('%s\n%s\n%s' % (
+            url, accept, self.username or '')).encode('utf-8'))
+        return digest.hexdigest()
+
+    def ttl(self, url):
+        if self.max_age is not None:
+            return self.max_age
+        path = urlparse(url).path
+        prefixes = [prefix for prefix in self.ttls if path.startswith(prefix)]
+        if not prefixes:
+            return 0
+        return self.ttls[max(prefixes, key=len)]
+
+    def _meta_file(self, key):
+        return os.path.join(self.directory, key + '.meta')
+
+    def _read_meta(self, key):
+        try:
+            with open(self._meta_file(key), 'rb') as fp:
+                return json.loads(fp.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        conf.atomic_write(self._meta_file(key),
+                          json.dumps(meta).encode('utf-8'))
+
+    def lookup(self, url, accept):
+        """Return the `CacheEntry` stored for URL, or None."""
+        key = self.key(url, accept)
+        meta = self._read_meta(key)
+        if meta is None:
+            return None
+        entry = CacheEntry(self, key, meta)
+        if not os.path.isfile(entry.body_file):
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(self._meta_file(key), None)
+        except OSError:
+            return None
+        return entry
+
+    def writer(self, url, accept, response):
+        """Return a `CacheWriter` for the body of RESPONSE, or None when the
+        response is not worth caching.
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not (etag or last_modified or self.ttl(url)):
+            return None
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory,
+                        stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR)
+        return CacheWriter(self, self.key(url, accept), {
+            'url': url,
+            'accept': accept,
+            'etag': etag,
+            'last_modified': last_modified,
+            'validated_at': time.time(),
+        })
+
+    def _commit(self, key, meta, body_filename):
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()[1]
+            previous = self._read_meta(key)
+            conf.replace(body_filename,
+                     os.path.join(self.directory, key + '.body'))
+            self._write_meta(key, meta)
+            self._size += meta['size'] - (previous or {}).get('size', 0)
+            if self._size > self.max_size:
+                self.evict()
+
+    def revalidated(self, entry, response):
+        """Record that the server confirmed ENTRY is still valid."""
+        entry.meta['validated_at'] = time.time()
+        if response.headers.get('ETag'):
+            entry.meta['etag'] = response.headers['ETag']
+        with self._lock:
+            self._write_meta(entry.key, entry.meta)
+
+    def _entries(self):
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            return
+        for filename in filenames:
+            if filename.endswith('.meta'):
+                yield filename[:-len('.meta')]
+
+    def _delete(self, key):
+        _remove(self._meta_file(key))
+        _remove(os.path.join(self.directory, key + '.body'))
+
+    def _scan(self):
+        """Return the ``(used_at, key, size)`` of every entry, and their total
+        size.
+        """
+        entries = []
+        total = 0
+        for key in self._entries():
+            meta = self._read_meta(key)
+            if meta is None:
+                continue
+            try:
+                used_at = os.path.getmtime(self._meta_file(key))
+            except OSError:
+                continue
+            entries.append((used_at, key, meta.get('size', 0)))
+            total += meta.get('size', 0)
+        return entries, total
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in
+        its maximum size.
+
+        This is done on commit only once the running total of the sizes of
+        the entries goes over the maximum size, as it reads every entry.
+        """
+        entries, total = self._scan()
+        entries.sort()
+        while total > self.max_size and entries:
+            _, key, size = entries.pop(0)
+            self._delete(key)
+            total -= size
+        self._size = total
+
+    def invalidate(self, url_prefix):
+        """Remove every entry whose URL starts with URL_PREFIX."""
+        with self._lock:
+            for key in list(self._entries()):
+                meta = self._read_meta(key)
+                if meta is None or meta['url'].startswith(url_prefix):
+                    self._delete(key)
+            # Counted again on the next commit
+            self._size = None
+
+    def clear(self):
+        self.invalidate('')
@@ -1,28 +1,31 @@
 from __future__ import absolute_import, unicode_literals
 
+import codecs
+import collections
 import configparser
 import os
 import sys
+import time
 import traceback
+import uuid
 
 import six
-from requests.exceptions import HTTPError
 
 import click
-from prettytable import PrettyTable
 
-from . import __version__, types
-from .api import Api
+from . import __version__, conf, formats, models, types
 from .base import AliasedGroup, Config, pass_config
+from .formats import printtable, write_items
 from .log import logger
 
-try:
-    from defusedxml import cElementTree as etree
-except ImportError:
-    from defusedxml import ElementTree as etree
+# Modules which are slow to import, such as requests or defusedxml, are only
+# imported by the commands that need them, to keep the startup time of the
+# other commands low.
 
 
 def _excepthook(exctype, value, tb):
+    from requests.exceptions import HTTPError
+
     if exctype == HTTPError:
         if value.response.status_code == 401:
             logger.fatal("Authentication cookie expired. "
@@ -31,6 +34,7 @@ def _excepthook(exctype, value, tb):
             logger.fatal("Invalid credentials provided. "
                         "Log in with `slipstream login`.")
         elif 'xml' in value.response.headers['content-type']:
+            from .api import etree
             root = etree.fromstring(value.response.text)
             logger.fatal(root.text)
         else:
@@ -42,15 +46,61 @@ def _excepthook(exctype, value, tb):
     traceback.print_exception(exctype, value, tb, file=out)
     logger.info(out.getvalue())
 
-sys.excepthook = _excepthook
-
 
-def printtable(items):
-    table = PrettyTable(items[0]._fields)
-    table.align = 'l'
-    for item in items:
-        table.add_row(item)
-    click.echo(table)
+def latest_version(api, path):
+    """Return the latest version of the module at PATH, from the module
+    index when it is up to date.
+    """
+    from .index import ModuleIndex
+
+    index = ModuleIndex()
+    if index.load() and not index.stale and index.matches(api):
+        app = index.get_module(path)
+        if app is not None:
+            return app.version
+    return api.get_module(path).version
+
+
+format_option = click.option(
+    '-f', '--format', 'format', type=click.Choice(formats.FORMATS),
+    default='table', help="The output format. Formats other than 'table' "
+    "write each row as soon as it is received.")
+
+
+def where_option(model):
+    """The --where option of the commands listing MODEL records."""
+    return click.option(
+        '-w', '--where', 'where', metavar='EXPRESSION',
+        type=types.Where(model._fields),
+        help="Only list the items matching EXPRESSION, e.g. \"cloud = "
+        "ec2-eu-west and status in (running, ready)\", on the fields %s. "
+        "Values are compared with =, !=, <, <=, >, >=, in (...), not in "
+        "(...), glob for shell-style patterns and ~ or !~ for regular "
+        "expressions, and comparisons combined with and, or, not and "
+        "parentheses." % ', '.join(model._fields))
+
+
+def wait_options(f):
+    f = click.option('--until', metavar='STATE',
+                     type=click.Choice(models.RUN_STATES),
+                     help="With --wait, the state to wait for instead of a "
+                     "terminal one.")(f)
+    return click.option('--wait', is_flag=True, default=False,
+                        help="Wait until the run reaches a terminal state, "
+                        "showing its status as it changes.")(f)
+
+
+def read_run_ids(run_ids):
+    """Return RUN_IDS as UUIDs, reading them from the standard input, one per
+    line, when none is given or the only one is '-'.
+    """
+    if not run_ids or tuple(run_ids) == ('-',):
+        stdin = click.get_text_stream('stdin')
+        run_ids = [line.strip() for line in stdin if line.strip()]
+    try:
+        return [uuid.UUID(run_id) for run_id in run_ids]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='UUID')
 
 
 def use_profile(ctx, param, value):
@@ -95,6 +145,23 @@ def config_set(ctx, param, value):
 @click.option('-e', '--endpoint', type=types.URL(), metavar='URL',
               callback=config_set, expose_value=False,
               help='The SlipStream endpoint to use.')
+@click.option('--no-cache', 'no_cache', is_flag=True, default=False,
+              help="Do not use the local cache of server responses.")
+@click.option('--max-age', 'max_age', metavar='SECONDS', type=click.IntRange(0),
+              help="Use cached responses without revalidating them with the "
+              "server for at most SECONDS.")
+@click.option('--stats', 'stats', is_flag=True, default=False,
+              help="Print statistics of the requests sent, per endpoint, "
+              "when done.")
+@click.option('--stats-file', 'stats_file', metavar='FILE',
+              type=click.Path(dir_okay=False, writable=True),
+              help="Write statistics of the requests sent to FILE when "
+              "done, in the Prometheus text format if its extension is "
+              "'.prom' and as JSON otherwise.")
+@click.option('--log-file', 'log_file', metavar='FILE',
+              type=click.Path(dir_okay=False, writable=True),
+              help="Append debug messages to FILE as JSON lines, along with "
+              "the command and the ID of each request.")
 @click.option('-q', '--quiet', 'quiet', count=True, help="Give less output. "
               "Option is additive, and can be used up to 3 times.")
 @click.option('-v', '--verbose', 'verbose', count=True, help="Give more output. "
@@ -102,27 +169,136 @@ def config_set(ctx, param, value):
 @click.version_option(__version__, '-V', '--version')
 @click.help_option('-h', '--help')
 @click.pass_context
-def cli(ctx, password, quiet, verbose):
+def cli(ctx, password, no_cache, max_age, stats, stats_file, log_file, quiet,
+        verbose):
     """SlipStream command line tool."""
+    sys.excepthook = _excepthook
+
     # Configure logging
     level = 1  # Notify
     level += verbose
     level -= quiet
     logger.set_level(4 - level)
+    if log_file:
+        set_log_file(ctx, log_file)
 
     # Attach Config object to context for subsequent use
     cfg = ctx.obj
 
-    if any(['login' in ctx.args, 'aliases' in ctx.args]):
+    # The name of the subcommand, which isn't known to the context yet
+    command = ctx.args[0] if ctx.args else None
+    if command in ('login', 'aliases', 'agent', 'query'):
         return
 
     # Ask for credentials to the user when (s)he hasn't provided some
     if password or (not os.path.isfile(cfg.settings['cookie_file'])
-                    and 'logout' not in ctx.args):
+                    and command != 'logout'):
         ctx.invoke(login, password)
 
+    from .api import Api
+    from .cache import ResponseCache
+    from .stats import RequestStats
+    from .transport import TransportPolicy
+
+    cache = None if no_cache else ResponseCache(
+        max_age=max_age, username=cfg.settings.get('username'))
+    try:
+        policy = TransportPolicy.from_settings(cfg.settings)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    request_stats = None
+    if stats or stats_file:
+        request_stats = RequestStats()
+        ctx.call_on_close(lambda: report_stats(request_stats, stats,
+                                               stats_file))
+
+    # Keep the Config for the commands running others, like `shell`
+    ctx.config = cfg
+
     # Attach Api object to context for subsequent use
-    ctx.obj = Api(cfg.settings['endpoint'], cfg.settings['cookie_file'])
+    api_factory = cfg.api_factory or Api
+    ctx.obj = api_factory(cfg.settings['endpoint'], cfg.settings['cookie_file'],
+                          cache, policy, request_stats)
+    ctx.obj.username = cfg.settings.get('username')
+    if password and cfg.settings.get('username'):
+        ctx.obj.remember_credentials(cfg.settings['username'], password)
+
+
+def set_log_file(ctx, filename):
+    """Write the log messages of the command invoked by CTX to FILENAME."""
+    from .log import JsonSink
+
+    # The subcommands, up to their first option or argument starting with a
+    # dash, which could be a password
+    command = []
+    for arg in ctx.args:
+        if arg.startswith('-'):
+            break
+        command.append(arg)
+    try:
+        sink = JsonSink(filename, min(logger.DEBUG, logger.level), {
+            'command': ' '.join(command),
+            'command_id': uuid.uuid4().hex,
+        })
+    except (IOError, OSError) as e:
+        raise click.ClickException("Could not open the log file: %s" % e)
+    logger.set_sink(sink)
+    ctx.call_on_close(lambda: logger.set_sink(None))
+
+
+def report_stats(request_stats, show, filename):
+    """Print the summary of REQUEST_STATS on the standard error if SHOW is
+    set, and write them to FILENAME if given.
+    """
+    if show:
+        summary = request_stats.summary()
+        if summary:
+            printtable(summary, err=True)
+    if filename:
+        try:
+            request_stats.write(filename)
+        except (IOError, OSError) as e:
+            logger.error("Could not write statistics to %s: %s", filename, e)
+
+
+cli.add_lazy_command('watch', 'slipstream.cli.watch:watch')
+cli.add_lazy_command('shell', 'slipstream.cli.shell:shell')
+cli.add_lazy_command('sync', 'slipstream.cli.mirror:sync')
+cli.add_lazy_command('query', 'slipstream.cli.mirror:query')
+
+
+def invoke(args, cfg, skip=None):
+    """Run the command with ARGS in process, with CFG as its `base.Config`,
+    the way `click.BaseCommand.main` does but without exiting, and return
+    its exit status.
+
+    SKIP is called with the context and CFG once the arguments are parsed,
+    and the command isn't run, returning None, if it returns true.
+    """
+    try:
+        # `list` is the command group here
+        ctx = cli.make_context('slipstream', [arg for arg in args], obj=cfg,
+                               auto_envvar_prefix='SLIPSTREAM')
+        if skip is not None and skip(ctx, cfg):
+            return None
+        with ctx:
+            cli.invoke(ctx)
+    except click.ClickException as e:
+        e.show()
+        return e.exit_code
+    except click.Abort:
+        click.echo('Aborted!', err=True)
+        return 1
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        click.echo(e.code, err=True)
+        return 1
+    except Exception:
+        _excepthook(*sys.exc_info())
+        return 1
+    return 0
 
 
 @cli.command()
@@ -145,6 +321,9 @@ def aliases(cfg):
 @pass_config
 def login(cfg, password):
     """Log in with your slipstream credentials."""
+    from requests.exceptions import HTTPError
+    from .api import Api
+
     should_prompt = True
     api = Api(cfg.settings['endpoint'])
     username = cfg.settings.get('username')
@@ -176,6 +355,10 @@ def login(cfg, password):
             logger.notify("Authentication successful.")
             should_prompt = False
 
+    # Responses cached for the previous session may not be visible anymore
+    from .cache import ResponseCache
+    ResponseCache().clear()
+
     cfg.write_config()
     logger.info("Local credentials saved.")
 
@@ -188,6 +371,61 @@ def logout(api):
     logger.notify("Local credentials cleared.")
 
 
+@cli.group()
+def agent():
+    """Manage the background agent running commands.
+
+    While it runs, commands are forwarded to the agent, which keeps their
+    sessions and connections open from one command to the next.
+    """
+    pass
+
+
+@agent.command('start')
+@click.option('--idle-timeout', 'idle_timeout', metavar='SECONDS',
+              type=click.IntRange(0), default=conf.DEFAULT_AGENT_IDLE_TIMEOUT,
+              help="Stop the agent after SECONDS without commands, or never "
+              "if 0.")
+def agent_start(idle_timeout):
+    """Start the agent."""
+    from .agent import AgentError, start, status
+
+    agent_status = status()
+    if agent_status is not None:
+        logger.notify("Agent already running, with PID %d.",
+                      agent_status['pid'])
+        return
+    try:
+        agent_status = start(idle_timeout=idle_timeout)
+    except AgentError as e:
+        raise click.ClickException(str(e))
+    logger.notify("Agent started, with PID %d.", agent_status['pid'])
+
+
+@agent.command('stop')
+def agent_stop():
+    """Stop the agent."""
+    from .agent import stop
+
+    if not stop():
+        raise click.ClickException("The agent is not running.")
+    logger.notify("Agent stopped.")
+
+
+@agent.command('status')
+def agent_status():
+    """Show whether the agent is running."""
+    from .agent import status
+
+    agent_status = status()
+    if agent_status is None:
+        raise click.ClickException("The agent is not running.")
+    click.echo("PID: %(pid)d\nSocket: %(socket)s\nCommands run: %(commands)d\n"
+               "Sessions: %(sessions)d\nUptime: %(uptime)s" % dict(
+                   agent_status,
+                   uptime=format_duration(agent_status['uptime'])))
+
+
 @cli.group()
 def list():
     """List resources: apps, images, etc."""
@@ -195,13 +433,12 @@ def list():
 
 
 @list.command('applications')
+@where_option(models.App)
+@format_option
 @click.pass_obj
-def list_applications(api):
+def list_applications(api, where, format):
     """List available applications."""
-    apps = [app for app in api.list_applications()]
-    if apps:
-        printtable(apps)
-    else:
+    if not write_items(api.list_applications(where=where), format):
         logger.warning("No applications found.")
 
 
@@ -212,37 +449,81 @@ def list_applications(api):
               help="Module type to only search for.")
 @click.option('-r', '--recurse', 'recurse', is_flag=True, default=False,
               help="Recursively list submodules encountered.")
+@click.option('-j', '--concurrency', metavar='N', type=click.IntRange(1),
+              default=1, help="Number of projects to fetch in parallel when "
+              "listing recursively.")
+@click.option('--refresh', 'refresh', is_flag=True, default=False,
+              help="Resynchronize the local module index with the server.")
+@where_option(models.App)
+@format_option
 @click.argument('path', required=False)
-def list_modules(api, type, recurse, path):
+def list_modules(api, type, recurse, concurrency, refresh, where, format,
+                 path):
     """List available modules starting from PATH.
 
     If PATH is not given, starts from root module.
-    """
-    def filter_func(module):
-        if type is not None and module.type != type:
-            return False
-        return True
 
-    try:
-        modules = [module for module in api.list_modules(path, recurse)
-                   if filter_func(module)]
-    except HTTPError as e:
-        if e.response.status_code == 404:
-            raise click.ClickException("Module '{0}' doesn't exists.".format(path))
-        raise
-    if modules:
-        printtable(modules)
+    Once the local module index has been built with --refresh, the whole
+    tree is listed from it with --recurse and no PATH. It is then updated
+    from the server when it is more than a few minutes old, only fetching
+    the projects whose version changed. Other listings are fetched from
+    the server.
+
+    When listing recursively with --where, projects are only descended into
+    if they could hold modules with a path it allows.
+    """
+    from requests.exceptions import HTTPError
+    from .index import ModuleIndex
+    from .where import Where
+
+    if type is not None:
+        condition = 'type = %s' % type
+        where = Where(condition, models.App._fields) if where is None \
+            else where.conjoin(condition)
+
+    index = ModuleIndex()
+    if refresh or (recurse and path is None and index.load()
+                   and index.matches(api)):
+        if refresh or index.stale:
+            index.refresh(api, force=refresh, concurrency=concurrency)
+        if path and not index.knows(path):
+            raise click.ClickException(
+                "Module '{0}' doesn't exists.".format(path))
+        count = write_items(index.list_modules(path, recurse, where), format)
     else:
+        try:
+            count = write_items(api.list_modules(path, recurse, concurrency,
+                                                 where=where), format)
+        except HTTPError as e:
+            if e.response.status_code == 404:
+                raise click.ClickException(
+                    "Module '{0}' doesn't exists.".format(path))
+            raise
+    if not count:
         logger.warning("No modules found matching your criteria.")
 
 
-@list.command('runs', help="list runs")
+@list.command('runs')
+@click.option('--limit', metavar='N', type=click.IntRange(0),
+              help="The maximum number of runs to list.")
+@click.option('--offset', metavar='N', type=click.IntRange(0), default=0,
+              help="The number of runs to skip.")
+@click.option('--page-size', 'page_size', metavar='N', type=click.IntRange(1),
+              default=conf.DEFAULT_PAGE_SIZE,
+              help="The number of runs to request at once.")
+@where_option(models.Run)
+@format_option
 @click.pass_obj
-def list_runs(api):
-    runs = [run for run in api.list_runs()]
-    if runs:
-        printtable(runs)
-    else:
+def list_runs(api, limit, offset, page_size, where, format):
+    """List runs, newest first.
+
+    With --where, the listing stops at the first run started before the
+    earliest start time the expression allows, e.g. with "started_at >=
+    2014-06-13".
+    """
+    runs = api.list_runs(offset=offset, limit=limit, page_size=page_size,
+                         where=where)
+    if not write_items(runs, format):
         logger.warning("No runs found.")
 
 
@@ -253,22 +534,34 @@ def list_runs(api):
               help="The cloud service name to filter with.")
 @click.option('--status', metavar='STATUS', type=click.STRING,
               help="The status to filter with.")
+@click.option('--limit', metavar='N', type=click.IntRange(0),
+              help="The maximum number of virtual machines to list.")
+@click.option('--offset', metavar='N', type=click.IntRange(0), default=0,
+              help="The number of virtual machines to skip.")
+@click.option('--group-by', 'group_by', metavar='FIELD[,FIELD...]',
+              type=types.FieldList(models.VirtualMachine._fields),
+              help="Count the virtual machines for each value of the given "
+              "fields instead, e.g. 'cloud,status'.")
+@where_option(models.VirtualMachine)
+@format_option
 @click.pass_obj
-def list_virtualmachines(api, run_id, cloud, status):
-    """List virtual machines filtered according to given options."""
-    def filter_func(vm):
-        if run_id and vm.run_id != run_id:
-            return False
-        if cloud and vm.cloud != cloud:
-            return False
-        if status and vm.status != status:
-            return False
-        return True
-
-    vms = [vm for vm in api.list_virtualmachines() if filter_func(vm)]
-    if vms:
-        printtable(vms)
-    else:
+def list_virtualmachines(api, run_id, cloud, status, limit, offset, group_by,
+                         where, format):
+    """List virtual machines filtered according to given options.
+
+    The run, cloud and status equalities of --where are handled by the
+    server, like the corresponding options.
+    """
+    vms = api.list_virtualmachines(run_id=run_id, cloud=cloud, status=status,
+                                   offset=offset, limit=limit,
+                                   columnar=bool(group_by), where=where)
+    if group_by:
+        Group = collections.namedtuple('Group', group_by + ['count'])
+        counts = vms.count_by(*group_by)
+        vms = [Group(*(values + (counts[values],)))
+               for values in sorted(counts, key=lambda values: [
+                   six.text_type(value) for value in values])]
+    if not write_items(vms, format):
         logger.warning("No virtual machines found matching your criteria.")
 
 
@@ -276,15 +569,18 @@ def list_virtualmachines(api, run_id, cloud, status):
 @click.option('--cloud', help="The cloud service to run the image with.")
 @click.option('--open', 'should_open', is_flag=True, default=False,
               help="Open the created run in a web browser.")
+@wait_options
 @click.argument('path', metavar='PATH', required=True)
 @click.pass_context
-def build(ctx, cloud, should_open, path):
+def build(ctx, cloud, should_open, wait, until, path):
     """Build the given image PATH"""
     api = ctx.obj
     run_id = api.build_image(path, cloud)
     click.echo(run_id)
     if should_open:
         ctx.invoke(open_cmd, run_id=run_id)
+    if wait or until:
+        wait_runs(api, [run_id], until)
 
 
 @cli.group()
@@ -297,31 +593,139 @@ def run():
 @click.option('--cloud', help="The cloud service to run the image with.")
 @click.option('--open', 'should_open', is_flag=True, default=False,
               help="Open the created run in a web browser")
+@wait_options
 @click.argument('path', metavar='PATH', required=True)
 @click.pass_context
-def run_image(ctx, cloud, should_open, path):
+def run_image(ctx, cloud, should_open, wait, until, path):
     """Run the image to the defined cloud."""
     api = ctx.obj
     run_id = api.run_image(path, cloud)
     click.echo(run_id)
     if should_open:
         ctx.invoke(open_cmd, run_id=run_id)
+    if wait or until:
+        wait_runs(api, [run_id], until)
 
 
 @run.command('deployment')
 @click.option('--open', 'should_open', is_flag=True, default=False,
               help="Open the created run in a web browser.")
+@click.option('--batch', 'manifest', metavar='MANIFEST',
+              type=click.Path(exists=True, dir_okay=False),
+              help="Launch every deployment listed in the YAML or CSV "
+              "MANIFEST instead.")
+@click.option('-o', '--output', metavar='FILE', type=click.Path(dir_okay=False),
+              help="The file recording the runs launched from the manifest. "
+              "Rows already recorded in it are not launched again. Defaults "
+              "to MANIFEST.runs.")
+@click.option('-j', '--concurrency', metavar='N', type=click.IntRange(1),
+              default=conf.DEFAULT_CONCURRENCY,
+              help="Number of deployments to launch in parallel from the "
+              "manifest.")
+@wait_options
 @click.argument('params', type=types.NodeKeyValue(), metavar='NODE:KEY=VALUE',
                 nargs=-1, required=False)
-@click.argument('path', metavar='PATH', nargs=1, required=True)
+@click.argument('path', metavar='PATH', nargs=1, required=False)
 @click.pass_context
-def run_deployment(ctx, should_open, params, path):
+def run_deployment(ctx, should_open, manifest, output, concurrency, wait,
+                   until, params, path):
     """Run a deployment."""
     api = ctx.obj
+    if manifest is not None:
+        if path is not None or params:
+            raise click.UsageError("PATH and parameters can't be given "
+                                   "along with --batch.")
+        if should_open:
+            raise click.UsageError("--open can't be given along with "
+                                   "--batch.")
+        run_ids = run_batch(api, manifest, output, concurrency)
+        if wait or until:
+            wait_runs(api, run_ids, until)
+        return
+    if path is None:
+        raise click.UsageError("Missing argument \"PATH\".")
+
     run_id = api.run_deployment(path, params)
     click.echo(run_id)
     if should_open:
         ctx.invoke(open_cmd, run_id=run_id)
+    if wait or until:
+        wait_runs(api, [run_id], until)
+
+
+def run_batch(api, manifest, output, concurrency):
+    """Launch the deployments listed in MANIFEST, recording their run UUIDs
+    in OUTPUT and skipping those already recorded there. Return the UUIDs of
+    the runs launched.
+    """
+    from requests.exceptions import HTTPError
+
+    from .batch import ManifestError, read_manifest, read_results, write_result
+    from .parallel import imap_unordered
+
+    try:
+        rows = read_manifest(manifest)
+    except ManifestError as e:
+        raise click.ClickException(str(e))
+    if output is None:
+        output = manifest + '.runs'
+
+    launched = read_results(output)
+    skipped = len(rows)
+    rows = [row for row in rows if row[0] not in launched]
+    skipped -= len(rows)
+    if skipped:
+        logger.notify("Skipping %d deployments already launched.", skipped)
+
+    def launch(row):
+        row_id, path, params = row
+        return api.run_deployment(path, params)
+
+    api.session.reserve_connections(concurrency)
+    run_ids = []
+    failures = 0
+    with codecs.open(output, 'a', encoding='utf8') as fp:
+        for (row_id, path, _), run_id, error in imap_unordered(launch, rows,
+                                                               concurrency):
+            if isinstance(error, HTTPError) \
+                    and error.response.status_code == 401:
+                raise error
+            if error is not None:
+                failures += 1
+                logger.error("%s (%s): %s", row_id, path, error)
+                continue
+            write_result(fp, row_id, path, run_id)
+            click.echo(run_id)
+            run_ids.append(run_id)
+
+    if failures:
+        raise click.ClickException(
+            "%d of %d deployments could not be launched. Run the same command "
+            "again to retry them." % (failures, len(rows)))
+    return run_ids
+
+
+def wait_runs(api, run_ids, until=None):
+    """Show the status of RUN_IDS as it changes until they all reach UNTIL,
+    or a terminal state. Fail if any of them was aborted or cancelled.
+    """
+    from .watch import WatchError, watch_runs
+
+    api = api.fresh()
+    statuses = {}
+    try:
+        for run_id, status in watch_runs(api, run_ids, until):
+            logger.notify("%s: %s", run_id, status)
+            statuses[run_id] = status
+    except WatchError as e:
+        raise click.ClickException(str(e))
+
+    failures = len([run_id for run_id in run_ids
+                    if statuses.get(run_id) in ('aborted', 'cancelled')
+                    and statuses.get(run_id) != until])
+    if failures:
+        raise click.ClickException("%d of %d runs were aborted or cancelled."
+                                   % (failures, len(run_ids)))
 
 
 @cli.command('open')
@@ -333,20 +737,92 @@ def open_cmd(api, run_id):
 
 
 @cli.command()
-@click.argument('run_id', metavar='UUID', type=click.UUID)
+@click.option('-j', '--concurrency', metavar='N', type=click.IntRange(1),
+              default=conf.DEFAULT_CONCURRENCY,
+              help="Number of runs to terminate in parallel.")
+@click.argument('run_ids', metavar='UUID...', nargs=-1)
 @click.pass_obj
-def terminate(api, run_id):
-    """Terminate the given run UUID."""
-    api.terminate(run_id)
-    logger.info("Run successfully terminated.")
+def terminate(api, concurrency, run_ids):
+    """Terminate the given run UUIDs.
+
+    If no UUID is given, or UUID is '-', they are read from the standard
+    input, one per line.
+    """
+    from requests.exceptions import HTTPError
+
+    run_ids = read_run_ids(run_ids)
+
+    failures = 0
+    for run_id, error in api.terminate_many(run_ids, concurrency):
+        if error is None:
+            logger.notify("%s: terminated", run_id)
+            continue
+        if isinstance(error, HTTPError) and error.response.status_code == 401:
+            raise error
+        failures += 1
+        logger.error("%s: %s", run_id, error)
+
+    if failures:
+        raise click.ClickException("%d of %d runs could not be terminated."
+                                   % (failures, len(run_ids)))
+
+
+def format_duration(seconds):
+    """Format SECONDS as e.g. '3d 4h', or '-' if it is None."""
+    if seconds is None:
+        return '-'
+    minutes, _ = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return '%dd %dh' % (days, hours)
+    if hours:
+        return '%dh %dm' % (hours, minutes)
+    return '%dm' % minutes
 
 
 @cli.command()
+@click.option('--record', is_flag=True, default=False,
+              help="Also append the current usage to the local history.")
+@click.option('--history', is_flag=True, default=False,
+              help="List the usage recorded in the local history instead.")
+@click.option('--trend', is_flag=True, default=False,
+              help="Show the peak and average usage by cloud service, and "
+              "the time left until its quota is reached at the current "
+              "rate, from the local history instead.")
+@click.option('--since', metavar='DURATION', type=types.Duration(),
+              help="With --history or --trend, only use the usage recorded "
+              "during the last DURATION, e.g. 30m, 12h or 7d.")
+@format_option
 @click.pass_obj
-def usage(api):
+def usage(api, record, history, trend, since, format):
     """List current usage and quota by cloud service."""
+    from .history import UsageHistory
+
+    store = UsageHistory()
+    if history or trend:
+        if record:
+            raise click.UsageError("--record can't be used with --history "
+                                   "or --trend.")
+        if since is not None:
+            since = time.time() - since
+        if history:
+            items = (sample._replace(time=time.strftime(
+                '%Y-%m-%d %H:%M:%S UTC', time.gmtime(sample.time)))
+                for sample in store.samples(since))
+        else:
+            items = (trend._replace(
+                average=round(trend.average, 2),
+                time_to_quota=format_duration(trend.time_to_quota))
+                for trend in store.trends(since))
+        if not write_items(items, format):
+            logger.warning("No usage recorded.")
+        return
+
     items = [item for item in api.usage()]
-    printtable(items)
+    if record:
+        store.record(items)
+    write_items(items, format)
 
 
 @cli.command()
@@ -359,8 +835,10 @@ def publish(api, path, version):
 
     WARNING: you need to be a superuser to publish module.
     """
+    from requests.exceptions import HTTPError
+
     if version is None:
-        version = api.get_module(path).version
+        version = latest_version(api, path)
     try:
         api.publish('%s/%s' % (path, version))
     except HTTPError as e:
@@ -370,12 +848,12 @@ def publish(api, path, version):
             raise click.ClickException(
                 "Module '%s' #%d doesn't exists." % (path, version))
         elif e.response.status_code == 409:
-            logger.warning(
-                "Module '%s' #%d is already published." % (path, version))
+            logger.warning("Module '%s' #%d is already published.", path,
+                           version)
         else:
             raise
     else:
-        logger.notify("Module '%s' #%d published." % (path, version))
+        logger.notify("Module '%s' #%d published.", path, version)
 
 
 @cli.command()
@@ -388,8 +866,10 @@ def unpublish(api, path, version):
 
     WARNING: you need to be a superuser to publish module.
     """
+    from requests.exceptions import HTTPError
+
     if version is None:
-        version = api.get_module(path).version
+        version = latest_version(api, path)
     try:
         api.unpublish('%s/%s' % (path, version))
     except HTTPError as e:
@@ -401,7 +881,7 @@ def unpublish(api, path, version):
         else:
             raise
     else:
-        logger.notify("Module '%s' #%d unpublished." % (path, version))
+        logger.notify("Module '%s' #%d unpublished.", path, version)
 
 
 @cli.command()
@@ -411,6 +891,9 @@ def unpublish(api, path, version):
 def delete(api, path, version):
     """Delete a module.
     """
+    from requests.exceptions import HTTPError
+    from .index import ModuleIndex
+
     logger.debug(path)
     if version is not None:
         path = '%s/%s' % (path, version)
@@ -422,4 +905,9 @@ def delete(api, path, version):
             raise click.ClickException("Module %s done not exist." % path)
         raise
 
-    logger.notify('Deleted module %s' % path)
+    index = ModuleIndex()
+    if index.load():
+        index.discard(path)
+        index.save()
+
+    logger.notify('Deleted module %s', path)
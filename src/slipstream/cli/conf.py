@@ -2,5 +2,46 @@ import os
 
 DEFAULT_CONFIG_FILE = os.path.expanduser('~/.slipstream/config')
 DEFAULT_COOKIE_FILE = os.path.expanduser('~/.slipstream/cookies.txt')
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.slipstream/cache')
+DEFAULT_INDEX_FILE = os.path.expanduser('~/.slipstream/modules.json')
+DEFAULT_HISTORY_FILE = os.path.expanduser('~/.slipstream/usage.dat')
+DEFAULT_MIRROR_FILE = os.path.expanduser('~/.slipstream/mirror.db')
+DEFAULT_AGENT_SOCKET = os.path.expanduser('~/.slipstream/agent.sock')
 DEFAULT_PROFILE = 'slipstream'
 DEFAULT_ENDPOINT = 'https://slipstream.sixsq.com'
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_CONCURRENCY = 4
+# Seconds before the expiry of a session from which it is renewed
+SESSION_EXPIRY_MARGIN = 60
+# Seconds after which an agent without commands to run stops
+DEFAULT_AGENT_IDLE_TIMEOUT = 3600
+
+# os.replace() is only available on Python 3.3 and above
+replace = getattr(os, 'replace', os.rename)
+
+
+def atomic_write(filename, data):
+    """Write DATA, bytes, to FILENAME through a temporary file which then
+    replaces it, so that readers never see a partially written file.
+
+    DATA can also be a function writing the file whose name it is given.
+    The temporary file is removed if writing fails.
+    """
+    import tempfile
+
+    fd, tmp_filename = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)),
+        prefix='.' + os.path.basename(filename), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            if not callable(data):
+                fp.write(data)
+        if callable(data):
+            data(tmp_filename)
+        replace(tmp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,71 @@
+from __future__ import absolute_import, unicode_literals
+
+import csv
+import json
+
+import six
+
+import click
+
+FORMATS = ['table', 'ndjson', 'csv', 'tsv']
+
+
+def _text(value):
+    if value is None:
+        return ''
+    return six.text_type(value)
+
+
+def _json(value):
+    if value is None or isinstance(value, (bool, float) + six.integer_types):
+        return value
+    return six.text_type(value)
+
+
+def _csv_line(values, delimiter):
+    values = [_text(value) for value in values]
+    if six.PY2:
+        values = [value.encode('utf-8') for value in values]
+    out = six.StringIO()
+    csv.writer(out, delimiter=str(delimiter),
+               lineterminator=str('\n')).writerow(values)
+    line = out.getvalue()
+    return line.decode('utf-8') if six.PY2 else line
+
+
+def printtable(items, err=False):
+    from prettytable import PrettyTable
+
+    table = PrettyTable(items[0]._fields)
+    table.align = 'l'
+    for item in items:
+        table.add_row(item)
+    click.echo(table, err=err)
+
+
+def write_items(items, format='table'):
+    """Write ITEMS, an iterable of `models` records, in the given FORMAT and
+    return how many were written.
+
+    Apart from 'table', which needs every item to size its columns, each
+    item is written as soon as ITEMS yields it.
+    """
+    if format == 'table':
+        items = [item for item in items]
+        if items:
+            printtable(items)
+        return len(items)
+
+    count = 0
+    for item in items:
+        if format == 'ndjson':
+            click.echo(json.dumps(dict((field, _json(value)) for field, value
+                                       in zip(item._fields, item)),
+                                  sort_keys=True))
+        else:
+            delimiter = ',' if format == 'csv' else '\t'
+            if count == 0:
+                click.echo(_csv_line(item._fields, delimiter), nl=False)
+            click.echo(_csv_line(item, delimiter), nl=False)
+        count += 1
+    return count
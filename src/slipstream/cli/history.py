@@ -0,0 +1,182 @@
+from __future__ import absolute_import, unicode_literals
+
+import codecs
+import collections
+import mmap
+import os
+import stat
+import struct
+import time
+
+from . import conf
+
+# A sample is stored as its time in seconds since the epoch, the index of
+# its cloud in the list of clouds, the usage and the quota.
+RECORD = struct.Struct(str('<qHII'))
+
+Sample = collections.namedtuple('Sample', [
+    'time',
+    'cloud',
+    'usage',
+    'quota',
+])
+
+Trend = collections.namedtuple('Trend', [
+    'cloud',
+    'samples',
+    'peak',
+    'average',
+    'usage',
+    'quota',
+    'time_to_quota',
+])
+
+
+class UsageHistory(object):
+    """An append-only store of usage samples, in FILENAME.
+
+    Samples are fixed-size binary records appended in time order, so that
+    the samples of a period are found by binary search over the file
+    without reading it whole. Cloud names are kept once, in a text file
+    next to it.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = conf.DEFAULT_HISTORY_FILE if filename is None \
+            else filename
+        self.clouds_filename = self.filename + '.clouds'
+
+    def clouds(self):
+        try:
+            with codecs.open(self.clouds_filename, encoding='utf8') as fp:
+                return [line.rstrip('\n') for line in fp]
+        except (IOError, OSError):
+            return []
+
+    def record(self, usages, timestamp=None):
+        """Append a sample for each of USAGES, `models.Usage` records taken
+        at TIMESTAMP, by default now.
+        """
+        history_dir = os.path.dirname(self.filename)
+        if not os.path.isdir(history_dir):
+            os.mkdir(history_dir, stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR)
+        if timestamp is None:
+            timestamp = time.time()
+        # Keep the store ordered even if the clock went back
+        timestamp = max(int(timestamp), self.last_time() or 0)
+
+        clouds = self.clouds()
+        new_clouds = []
+        records = []
+        for usage in usages:
+            if usage.cloud not in clouds:
+                clouds.append(usage.cloud)
+                new_clouds.append(usage.cloud)
+            records.append(RECORD.pack(timestamp, clouds.index(usage.cloud),
+                                       usage.usage, usage.quota))
+        if new_clouds:
+            with codecs.open(self.clouds_filename, 'a', encoding='utf8') as fp:
+                fp.write(''.join('%s\n' % cloud for cloud in new_clouds))
+        with open(self.filename, 'ab') as fp:
+            # Drop a record left partially written, which would shift those
+            # appended after it
+            size = os.fstat(fp.fileno()).st_size
+            if size % RECORD.size:
+                fp.truncate(size - size % RECORD.size)
+            fp.write(b''.join(records))
+
+    def _open(self):
+        """Return a read-only memory map of the store, or None if it is
+        empty.
+        """
+        try:
+            with open(self.filename, 'rb') as fp:
+                if os.fstat(fp.fileno()).st_size < RECORD.size:
+                    return None
+                return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError):
+            return None
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.filename) // RECORD.size
+        except OSError:
+            return 0
+
+    def last_time(self):
+        data = self._open()
+        if data is None:
+            return None
+        try:
+            count = len(data) // RECORD.size
+            return RECORD.unpack_from(data, (count - 1) * RECORD.size)[0]
+        finally:
+            data.close()
+
+    @staticmethod
+    def _bisect(data, count, timestamp):
+        """Return the index of the first record at or after TIMESTAMP."""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if RECORD.unpack_from(data, middle * RECORD.size)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def samples(self, since=None, until=None):
+        """Yield the `Sample` taken from SINCE, included, to UNTIL,
+        excluded, both times in seconds since the epoch.
+        """
+        data = self._open()
+        if data is None:
+            return
+        try:
+            # Ignore a partially written record
+            count = len(data) // RECORD.size
+            start = 0 if since is None else self._bisect(data, count, since)
+            end = count if until is None else self._bisect(data, count, until)
+            clouds = self.clouds()
+            for index in range(start, end):
+                timestamp, cloud, usage, quota = RECORD.unpack_from(
+                    data, index * RECORD.size)
+                yield Sample(timestamp, clouds[cloud], usage, quota)
+        finally:
+            data.close()
+
+    def trends(self, since=None, until=None):
+        """Return a `Trend` per cloud over the samples from SINCE to UNTIL.
+
+        The time to quota is extrapolated from the least-squares slope of
+        the usage, and is None unless the usage is growing.
+        """
+        stats = collections.OrderedDict()
+        for sample in self.samples(since, until):
+            totals = stats.get(sample.cloud)
+            if totals is None:
+                # count, peak, sum(t), sum(u), sum(t*t), sum(t*u), last sample
+                # and first time, which times are taken relative to so that
+                # the sums don't lose precision
+                totals = stats[sample.cloud] = [0, 0, 0.0, 0.0, 0.0, 0.0, None,
+                                                sample.time]
+            t = float(sample.time - totals[7])
+            totals[0] += 1
+            totals[1] = max(totals[1], sample.usage)
+            totals[2] += t
+            totals[3] += sample.usage
+            totals[4] += t * t
+            totals[5] += t * sample.usage
+            totals[6] = sample
+
+        trends = []
+        for cloud, (n, peak, st, su, stt, stu, last, _) in stats.items():
+            time_to_quota = None
+            variance = n * stt - st * st
+            if variance > 0:
+                slope = (n * stu - st * su) / variance
+                if slope > 0:
+                    time_to_quota = max(0.0, (last.quota - last.usage) / slope)
+            trends.append(Trend(cloud, n, peak, su / n, last.usage, last.quota,
+                                time_to_quota))
+        return trends
@@ -0,0 +1,210 @@
+from __future__ import absolute_import
+
+import json
+import os
+import stat
+import time
+
+from concurrent import futures
+
+from . import conf, models
+from .log import logger
+
+# Number of seconds after which the index is refreshed before being used
+DEFAULT_MAX_AGE = 300
+
+
+def index_path(path):
+    """Normalize a module PATH to the key used in the index, i.e. without
+    the leading 'module/' nor the trailing version.
+    """
+    parts = [part for part in (path or '').strip('/').split('/') if part]
+    if parts and parts[0] == 'module':
+        del parts[0]
+    if parts and parts[-1].isdigit():
+        del parts[-1]
+    return '/'.join(parts)
+
+
+class ModuleIndex(object):
+    """A local copy of the module tree, stored as JSON in FILENAME.
+
+    For every project the index keeps the version it was listed at and the
+    `models.App` found in it. Modules are listed from the index without
+    asking the server until it is refreshed, which tells which projects
+    changed. The index is only valid for the endpoint and the user it was
+    built for, as every user is shown different modules.
+    """
+
+    def __init__(self, filename=None, max_age=DEFAULT_MAX_AGE):
+        self.filename = conf.DEFAULT_INDEX_FILE if filename is None else filename
+        self.max_age = max_age
+        self.endpoint = None
+        self.username = None
+        self.refreshed_at = None
+        self.projects = {}
+
+    def load(self):
+        """Load the index from its file. Return whether there was one."""
+        try:
+            with open(self.filename, 'rb') as fp:
+                data = json.loads(fp.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return False
+        self.endpoint = data['endpoint']
+        self.username = data.get('username')
+        self.refreshed_at = data['refreshed_at']
+        self.projects = data['projects']
+        return True
+
+    def save(self):
+        index_dir = os.path.dirname(self.filename)
+        if not os.path.isdir(index_dir):
+            os.mkdir(index_dir, stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR)
+        conf.atomic_write(self.filename, json.dumps({
+            'endpoint': self.endpoint,
+            'username': self.username,
+            'refreshed_at': self.refreshed_at,
+            'projects': self.projects,
+        }).encode('utf-8'))
+
+    def matches(self, api):
+        """Return whether the index was built for the endpoint and the user
+        of API.
+        """
+        return (self.endpoint, self.username) == (
+            api.endpoint, getattr(api, 'username', None))
+
+    @property
+    def stale(self):
+        if self.refreshed_at is None:
+            return True
+        return time.time() - self.refreshed_at > self.max_age
+
+    def refresh(self, api, force=False, concurrency=1):
+        """Synchronize the index with the module tree served by API, and
+        return the paths of the projects whose listing changed.
+
+        Projects listed with an unchanged version are not fetched again, nor
+        is anything below them, unless FORCE is set: modules created below a
+        project whose version didn't change are only found then. The
+        listings which are fetched are revalidated with the server rather
+        than read from the response cache of API.
+        """
+        if force or not self.matches(api):
+            previous = {}
+        else:
+            previous = self.projects
+        projects = {}
+        changed = []
+
+        def reuse(path):
+            projects[path] = previous[path]
+            for _, type, _, child_path in previous[path]['modules']:
+                if type == 'project' and child_path in previous:
+                    reuse(child_path)
+
+        def fetch(path):
+            return [list(app) for app in api.list_modules(path or None)]
+
+        if concurrency > 1:
+            executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+            map_func = executor.map
+        else:
+            executor = None
+            map_func = map
+
+        cache = getattr(api, 'cache', None)
+        if cache is not None:
+            max_age, cache.max_age = cache.max_age, 0
+        try:
+            # Breadth-first walk, one level of the tree at a time
+            level = [('', None)]
+            while level:
+                fetched = []
+                for path, version in level:
+                    entry = previous.get(path)
+                    if entry is not None and version is not None \
+                            and entry['version'] == version:
+                        logger.debug("Project %s is unchanged.", path)
+                        reuse(path)
+                    else:
+                        fetched.append((path, version))
+
+                level = []
+                listings = map_func(fetch, [path for path, _ in fetched])
+                for (path, version), modules in zip(fetched, listings):
+                    entry = previous.get(path)
+                    if entry is None or entry['modules'] != modules:
+                        changed.append(path)
+                    projects[path] = {'version': version, 'modules': modules}
+                    level.extend(
+                        (child_path, child_version)
+                        for _, type, child_version, child_path in modules
+                        if type == 'project')
+        finally:
+            if cache is not None:
+                cache.max_age = max_age
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        self.endpoint = api.endpoint
+        self.username = getattr(api, 'username', None)
+        self.refreshed_at = time.time()
+        self.projects = projects
+        self.save()
+        return changed
+
+    def knows(self, path):
+        """Return whether the module at PATH, or the root if None, is in the
+        index.
+        """
+        path = index_path(path)
+        return path in self.projects or self.get_module(path) is not None
+
+    def list_modules(self, path=None, recurse=False, where=None):
+        """List the modules found under PATH, like `api.Api.list_modules`."""
+        modules = self._walk_modules(path, recurse, where)
+        if where is None:
+            return modules
+        return (app for app in modules if where.match(app))
+
+    def _walk_modules(self, path, recurse, where):
+        entry = self.projects.get(index_path(path))
+        if entry is None:
+            return
+        for row in entry['modules']:
+            app = models.App(*row)
+            yield app
+            if app.type == 'project' and recurse and (
+                    where is None or where.may_contain(app.path)):
+                for app in self._walk_modules(app.path, recurse, where):
+                    yield app
+
+    def get_module(self, path):
+        """Return the `models.App` for the module at PATH, or None if the
+        index doesn't know about it.
+        """
+        path = index_path(path)
+        entry = self.projects.get(path.rpartition('/')[0])
+        if entry is None:
+            return None
+        for row in entry['modules']:
+            if row[3] == path:
+                return models.App(*row)
+        return None
+
+    def discard(self, path):
+        """Remove the module at PATH, and anything below it, from the index.
+
+        The modules are listed from the server again on the next refresh.
+        """
+        path = index_path(path)
+        entry = self.projects.get(path.rpartition('/')[0])
+        if entry is not None:
+            entry['version'] = None
+            entry['modules'] = [row for row in entry['modules']
+                                if row[3] != path]
+        for project in list(self.projects):
+            if project == path or project.startswith(path + '/'):
+                del self.projects[project]
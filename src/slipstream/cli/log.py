@@ -1,13 +1,52 @@
+import codecs
+import datetime
+import json
 import logging
+import threading
 
 import click
 from click._compat import get_text_stderr
 
 
+class JsonSink(object):
+    """Write the messages of LEVEL and above to FILENAME as JSON lines, with
+    their time, level and the CONTEXT fields, such as the command run, along
+    with the extra fields given to `Logger.log`.
+    """
+
+    def __init__(self, filename, level=logging.DEBUG, context=None):
+        self.filename = filename
+        self.level = level
+        self.context = dict(context or {})
+        self._fp = codecs.open(filename, 'a', encoding='utf8')
+        self._lock = threading.Lock()
+
+    def write(self, level, message, extra=None):
+        record = {
+            'time': datetime.datetime.utcnow().isoformat() + 'Z',
+            'level': Logger.NAMES.get(level, level),
+            'message': message,
+        }
+        record.update(self.context)
+        if extra:
+            record.update(extra)
+        line = json.dumps(record, sort_keys=True, default=str)
+        with self._lock:
+            self._fp.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+
 class Logger(object):
     """
     Logging object for use in command-line script. Allows ranges of
     levels, to avoid some redundancy of displayed information.
+
+    Messages are formatted with their positional or keyword arguments, like
+    with the logging module, only once they are known to be output: pass the
+    arguments rather than formatting the message beforehand.
     """
     VERBOSE_DEBUG = logging.DEBUG - 1
     DEBUG = logging.DEBUG
@@ -18,6 +57,15 @@ class Logger(object):
     FATAL = logging.FATAL
 
     LEVELS = [VERBOSE_DEBUG, DEBUG, INFO, NOTIFY, WARNING, ERROR, FATAL]
+    NAMES = {
+        VERBOSE_DEBUG: 'verbose_debug',
+        DEBUG: 'debug',
+        INFO: 'info',
+        NOTIFY: 'notify',
+        WARNING: 'warning',
+        ERROR: 'error',
+        FATAL: 'fatal',
+    }
     COLORS = {
         VERBOSE_DEBUG: 'green',
         DEBUG: 'green',
@@ -28,6 +76,9 @@ class Logger(object):
 
     def __init__(self):
         self.level = self.NOTIFY
+        self.sink = None
+        # Lowest level of the console and of the sink
+        self._min_level = self.level
 
     def debug(self, msg, *args, **kwargs):
         self.log(self.DEBUG, msg, *args, **kwargs)
@@ -47,7 +98,21 @@ class Logger(object):
     def fatal(self, msg, *args, **kwargs):
         self.log(self.FATAL, msg, *args, **kwargs)
 
+    def enabled_for(self, level):
+        """Return whether messages of LEVEL are output anywhere, e.g. to
+        skip computing what would only be logged.
+        """
+        return level >= self._min_level
+
     def log(self, level, msg, *args, **kwargs):
+        """Output MSG formatted with ARGS, or with KWARGS as a mapping, if
+        LEVEL is enabled. The EXTRA keyword argument holds fields only
+        written to the sink, such as a request ID.
+        """
+        # Nothing is formatted for levels which are not output
+        if level < self._min_level:
+            return
+        extra = kwargs.pop('extra', None)
         if args:
             if kwargs:
                 raise TypeError(
@@ -65,6 +130,8 @@ class Logger(object):
             color = self.COLORS.get(level)
             stream = get_text_stderr() if level >= self.WARNING else None
             click.secho(rendered, file=stream, fg=color)
+        if self.sink is not None and level >= self.sink.level:
+            self.sink.write(level, rendered, extra)
 
     def set_level(self, level):
         if level < 0:
@@ -73,5 +140,17 @@ class Logger(object):
             self.level = self.LEVELS[-1]
         else:
             self.level = self.LEVELS[level]
+        self._update_min_level()
+
+    def set_sink(self, sink):
+        """Also write messages to SINK, a `JsonSink`, or stop if None."""
+        if self.sink is not None:
+            self.sink.close()
+        self.sink = sink
+        self._update_min_level()
+
+    def _update_min_level(self):
+        self._min_level = self.level if self.sink is None else min(
+            self.level, self.sink.level)
 
 logger = Logger()
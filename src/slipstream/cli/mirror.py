@@ -0,0 +1,356 @@
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import os
+import sqlite3
+import stat
+import time
+
+import six
+
+import click
+
+from . import conf, models
+from .commands import format_option
+from .formats import write_items
+from .log import logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    module TEXT,
+    version INTEGER,
+    status TEXT,
+    started_at TEXT,
+    cloud TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_module ON runs (module);
+CREATE INDEX IF NOT EXISTS runs_cloud ON runs (cloud);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status);
+CREATE INDEX IF NOT EXISTS runs_started_at ON runs (started_at);
+CREATE TABLE IF NOT EXISTS vms (
+    id TEXT,
+    cloud TEXT,
+    status TEXT,
+    run_id TEXT,
+    PRIMARY KEY (cloud, id)
+);
+CREATE INDEX IF NOT EXISTS vms_run_id ON vms (run_id);
+CREATE INDEX IF NOT EXISTS vms_status ON vms (status);
+CREATE TABLE IF NOT EXISTS modules (
+    path TEXT PRIMARY KEY,
+    name TEXT,
+    type TEXT,
+    version INTEGER
+);
+CREATE INDEX IF NOT EXISTS modules_type ON modules (type);
+CREATE TABLE IF NOT EXISTS usage (
+    time INTEGER,
+    cloud TEXT,
+    usage INTEGER,
+    quota INTEGER,
+    PRIMARY KEY (time, cloud)
+);
+CREATE INDEX IF NOT EXISTS usage_cloud ON usage (cloud, time);
+"""
+
+# Columns of the mirrored tables, the key columns first
+TABLES = collections.OrderedDict([
+    ('runs', (['id'], ['module', 'version', 'status', 'started_at',
+                       'cloud'])),
+    ('vms', (['cloud', 'id'], ['status', 'run_id'])),
+    ('modules', (['path'], ['name', 'type', 'version'])),
+    ('usage', (['time', 'cloud'], ['usage', 'quota'])),
+])
+
+# Number of keys looked up per query, below the limit of SQLite on the
+# number of parameters of a query
+LOOKUP_SIZE = 500
+
+Change = collections.namedtuple('Change', [
+    'table',
+    'fetched',
+    'inserted',
+    'updated',
+    'deleted',
+])
+
+
+def _text(value):
+    return None if value is None else six.text_type(value)
+
+
+def run_row(run):
+    """Return the row of the `models.Run` RUN, with its module path and
+    version in separate columns.
+    """
+    path, _, version = run.module.rpartition('/')
+    if not version.isdigit():
+        path, version = run.module, None
+    return (_text(run.id), path, None if version is None else int(version),
+            run.status, run.started_at, run.cloud)
+
+
+def vm_row(vm):
+    return (vm.cloud, _text(vm.id), vm.status, _text(vm.run_id))
+
+
+def module_row(app):
+    return (app.path, app.name, app.type,
+            None if app.version is None else int(app.version))
+
+
+def usage_row(usage, timestamp):
+    return (int(timestamp), usage.cloud, usage.usage, usage.quota)
+
+
+class Mirror(object):
+    """A local copy of the runs, virtual machines, modules and usage served
+    by an `api.Api`, stored in the SQLite database FILENAME to be queried
+    with SQL.
+
+    Every sync only writes the rows which changed, in a single transaction.
+    Runs are kept once they are no longer listed by the server, so that
+    reports cover their whole history, while usage is recorded as one
+    sample per cloud service at every sync.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = conf.DEFAULT_MIRROR_FILE if filename is None \
+            else filename
+        self._connection = None
+
+    @property
+    def exists(self):
+        return os.path.isfile(self.filename)
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            mirror_dir = os.path.dirname(self.filename)
+            if mirror_dir and not os.path.isdir(mirror_dir):
+                os.mkdir(mirror_dir,
+                         stat.S_IRUSR | stat.S_IWUSR | stat.S_IXUSR)
+            self._connection = sqlite3.connect(self.filename)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def get_meta(self, key):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?',
+                                      (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _rows(self, table, keys=None):
+        """Return the rows of TABLE by key, only those whose key is in KEYS
+        if given, for the tables with a single key column.
+        """
+        key_columns, values = TABLES[table]
+        size = len(key_columns)
+        select = 'SELECT %s FROM %s' % (', '.join(key_columns + values), table)
+        if keys is None:
+            cursor = self.connection.execute(select)
+            return dict((tuple(row[:size]), tuple(row)) for row in cursor)
+
+        keys = [key[0] for key in keys]
+        rows = {}
+        for start in range(0, len(keys), LOOKUP_SIZE):
+            chunk = keys[start:start + LOOKUP_SIZE]
+            cursor = self.connection.execute('%s WHERE %s IN (%s)' % (
+                select, key_columns[0], ', '.join('?' * len(chunk))), chunk)
+            rows.update((tuple(row[:size]), tuple(row)) for row in cursor)
+        return rows
+
+    def _unfinished_runs(self):
+        """Return the keys of the runs which were not in a terminal state."""
+        cursor = self.connection.execute(
+            'SELECT id FROM runs WHERE status NOT IN (%s)' % ', '.join(
+                '?' * len(models.TERMINAL_STATES)), models.TERMINAL_STATES)
+        return set(tuple(row) for row in cursor)
+
+    def _fetch_runs(self, api, full):
+        """Return the rows of the runs listed by API.
+
+        Runs are listed newest first: unless FULL is set, the listing stops
+        at the first run which was already mirrored in a terminal state once
+        every run mirrored in another state was seen again, as the older
+        ones can't have changed since.
+        """
+        unfinished = set() if full else self._unfinished_runs()
+        rows = []
+        runs = api.list_runs()
+        try:
+            for run in runs:
+                row = run_row(run)
+                key = row[:1]
+                if not full and not unfinished:
+                    previous = self._rows('runs', [key]).get(key)
+                    if previous is not None \
+                            and previous[3] in models.TERMINAL_STATES:
+                        logger.debug("Runs are known from %s on.", row[0])
+                        break
+                unfinished.discard(key)
+                rows.append(row)
+        finally:
+            runs.close()
+        return rows
+
+    def _merge(self, table, rows, delete=True):
+        """Write the ROWS of TABLE which are new or changed, deleting those
+        no longer listed if DELETE is set, and return the `Change`.
+
+        Unless DELETE is set, only the rows with the keys of ROWS are read
+        from the mirror.
+        """
+        keys, values = TABLES[table]
+        size = len(keys)
+        if delete:
+            existing = self._rows(table)
+        else:
+            existing = self._rows(table, [row[:size] for row in rows])
+        changed = []
+        inserted = 0
+        for row in rows:
+            previous = existing.pop(tuple(row[:size]), None)
+            if previous != row:
+                changed.append(row)
+                if previous is None:
+                    inserted += 1
+        columns = keys + values
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (
+                table, ', '.join(columns), ', '.join('?' * len(columns))),
+            changed)
+        deleted = 0
+        if delete and existing:
+            deleted = len(existing)
+            self.connection.executemany(
+                'DELETE FROM %s WHERE %s' % (table, ' AND '.join(
+                    '%s = ?' % key for key in keys)),
+                [key for key in existing])
+        return Change(table, len(rows), inserted, len(changed) - inserted,
+                      deleted)
+
+    def sync(self, api, full=False, concurrency=1, index=None):
+        """Update the mirror from API, and return the `Change` of each
+        table.
+
+        Modules are listed through the module INDEX, a `index.ModuleIndex`
+        loaded from its default file if not given, which only lists the
+        projects whose version changed. Without FULL, only the runs started
+        since the last sync are listed, along with the runs which had not
+        reached a terminal state then. With FULL, the module index is built
+        again as well. Everything is fetched before the mirror is written
+        to, so that queries can run meanwhile.
+        """
+        api = api.fresh()
+        if index is None:
+            from .index import ModuleIndex
+            index = ModuleIndex()
+            index.load()
+
+        endpoint = self.get_meta('endpoint')
+        if endpoint is not None and endpoint != api.endpoint:
+            logger.notify("Mirroring %s instead of %s.", api.endpoint,
+                          endpoint)
+            full = True
+
+        start = time.time()
+        runs = self._fetch_runs(api, full)
+        vms = [vm_row(vm) for vm in api.list_virtualmachines()]
+        index.refresh(api, force=full, concurrency=concurrency)
+        modules = [module_row(app) for app in index.list_modules(None, True)]
+        usages = [usage_row(usage, start) for usage in api.usage()]
+        logger.debug("Fetched everything in %.3f s.", time.time() - start)
+
+        start = time.time()
+        with self.connection:
+            if endpoint is not None and endpoint != api.endpoint:
+                for table in TABLES:
+                    self.connection.execute('DELETE FROM %s' % table)
+            changes = [
+                self._merge('runs', runs, delete=False),
+                self._merge('vms', vms),
+                self._merge('modules', modules),
+            ]
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO usage (time, cloud, usage, quota) '
+                'VALUES (?, ?, ?, ?)', usages)
+            changes.append(Change('usage', len(usages), len(usages), 0, 0))
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                [('endpoint', api.endpoint), ('synced_at', '%d' % start)])
+        logger.debug("Wrote the mirror in %.3f s.", time.time() - start)
+        return changes
+
+    def query(self, sql, params=()):
+        """Run the SQL query with PARAMS, which can't modify the mirror,
+        and return its column names and an iterator over its rows.
+        """
+        self.connection.execute('PRAGMA query_only = ON')
+        try:
+            cursor = self.connection.execute(sql, params)
+        finally:
+            self.connection.execute('PRAGMA query_only = OFF')
+        columns = [column[0] for column in cursor.description or ()]
+        return columns, cursor
+
+
+@click.command()
+@click.option('--full', is_flag=True, default=False,
+              help="List every run and module again, instead of only those "
+              "which may have changed since the last sync.")
+@click.option('-j', '--concurrency', metavar='N', type=click.IntRange(1),
+              default=1, help="Number of projects to fetch in parallel.")
+@click.pass_obj
+def sync(api, full, concurrency):
+    """Update the local mirror of runs, virtual machines, modules and usage,
+    to be queried with `query`.
+
+    Only the rows which changed are written. Usage is recorded at every
+    sync, so that its history can be queried as well.
+    """
+    mirror = Mirror()
+    try:
+        write_items(mirror.sync(api, full, concurrency), 'table')
+    except sqlite3.Error as e:
+        raise click.ClickException("Could not update the mirror: %s" % e)
+    finally:
+        mirror.close()
+
+
+@click.command()
+@format_option
+@click.argument('sql', metavar='SQL')
+def query(sql, format):
+    """Run the SQL query against the local mirror updated by `sync`.
+
+    The tables are runs, vms, modules and usage, e.g.:
+
+    \b
+        slipstream query "SELECT cloud, count(*) AS runs FROM runs
+                          WHERE started_at >= '2014-06' GROUP BY cloud"
+    """
+    mirror = Mirror()
+    if not mirror.exists:
+        raise click.ClickException("No mirror found, run `sync` first.")
+    try:
+        columns, rows = mirror.query(sql)
+        if not columns:
+            return
+        Row = collections.namedtuple('Row', [str(column) for column in
+                                             columns], rename=True)
+        if not write_items((Row(*row) for row in rows), format):
+            logger.warning("No rows found.")
+    except sqlite3.Error as e:
+        raise click.ClickException("Query failed: %s" % e)
+    finally:
+        mirror.close()
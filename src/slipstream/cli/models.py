@@ -1,31 +1,203 @@
 from __future__ import unicode_literals
 
 import collections
+import sys
+import uuid
 
-App = collections.namedtuple('App', [
+import six
+
+# The states a run goes through, in order, as listed by `api.Api.list_runs`
+RUN_STATES = [
+    'initializing',
+    'provisioning',
+    'executing',
+    'sendingreports',
+    'ready',
+    'finalizing',
+    'done',
+    'aborted',
+    'cancelled',
+]
+
+TERMINAL_STATES = ['done', 'aborted', 'cancelled']
+
+# Values of categorical fields shared by every record, on Python 2 whose
+# `intern` only takes byte strings. Past MAX_INTERNED distinct values, new
+# ones are no longer shared.
+MAX_INTERNED = 10000
+_strings = {}
+
+
+def _intern(value):
+    """Return the single shared copy of the string VALUE.
+
+    Interned strings are freed once no record refers to them anymore on
+    Python 3, while on Python 2 at most MAX_INTERNED of them are kept.
+    """
+    if value is None:
+        return None
+    if six.PY3:
+        return sys.intern(value)
+    shared = _strings.get(value)
+    if shared is None:
+        if len(_strings) >= MAX_INTERNED:
+            return value
+        shared = _strings[value] = value
+    return shared
+
+
+def _uuid_int(value):
+    if value is None or isinstance(value, six.integer_types):
+        return value
+    if not isinstance(value, uuid.UUID):
+        value = uuid.UUID(value)
+    return value.int
+
+
+def _uuid_field(index):
+    # The field accessors of namedtuples read the stored value directly
+    return property(lambda self: self[index])
+
+
+class _Record(tuple):
+    """Base class of the compact models, mixed into a namedtuple.
+
+    Categorical fields, listed in ``_categorical_fields``, are interned, and
+    the fields at the indexes in ``_uuid_fields`` are stored as 128-bit ints,
+    then turned back into `uuid.UUID` when read. Records read, iterate,
+    unpack, hash, search and compare like the namedtuples they extend would
+    holding UUIDs, with records and plain tuples on either side. Only the
+    comparisons of Python would see the stored ints when the record is on
+    the right of another tuple subclass, e.g. ``plain_namedtuple == record``
+    is false: put the record on the left. Likewise, formatting with ``%``
+    takes the stored ints as its arguments: format ``tuple(record)``, or use
+    `str.format`, instead.
+    """
+    __slots__ = ()
+    _categorical_fields = frozenset()
+    _uuid_fields = frozenset()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        value = tuple.__getitem__(self, index)
+        if value is not None and index % len(self) in self._uuid_fields:
+            return uuid.UUID(int=value)
+        return value
+
+    def __getslice__(self, i, j):
+        # Python 2 slices tuples without __getitem__
+        return self.__getitem__(slice(i, j))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    # The comparisons of tuple would see the stored ints
+    def __eq__(self, other):
+        if isinstance(other, _Record):
+            other = tuple(other)
+        return tuple(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return tuple(self) < tuple(other)
+
+    def __le__(self, other):
+        return tuple(self) <= tuple(other)
+
+    def __gt__(self, other):
+        return tuple(self) > tuple(other)
+
+    def __ge__(self, other):
+        return tuple(self) >= tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __contains__(self, value):
+        return value in tuple(self)
+
+    def index(self, value, *args):
+        return tuple(self).index(value, *args)
+
+    def count(self, value):
+        return tuple(self).count(value)
+
+    def __add__(self, other):
+        if isinstance(other, _Record):
+            other = tuple(other)
+        return tuple(self) + other
+
+    def __radd__(self, other):
+        return other + tuple(self)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(
+            '%s=%r' % field for field in zip(self._fields, self)))
+
+    @classmethod
+    def _make(cls, iterable):
+        return cls(*iterable)
+
+
+class App(_Record, collections.namedtuple('App', [
     'name',
     'type',
     'version',
     'path',
-])
+])):
+    __slots__ = ()
+    _categorical_fields = frozenset(['type'])
+
+    def __new__(cls, name, type, version, path):
+        return tuple.__new__(cls, (name, _intern(type), version, path))
 
-Run = collections.namedtuple('Run', [
+
+class Run(_Record, collections.namedtuple('Run', [
     'id',
     'module',
     'status',
     'started_at',
     'cloud',
-])
+])):
+    __slots__ = ()
+    _categorical_fields = frozenset(['module', 'status', 'cloud'])
+    _uuid_fields = frozenset([0])
+    id = _uuid_field(0)
+
+    def __new__(cls, id, module, status, started_at, cloud):
+        return tuple.__new__(cls, (_uuid_int(id), _intern(module),
+                                   _intern(status), started_at,
+                                   _intern(cloud)))
 
-VirtualMachine = collections.namedtuple('VirtualMachine', [
+
+class VirtualMachine(_Record, collections.namedtuple('VirtualMachine', [
     'id',
     'cloud',
     'status',
     'run_id',
-])
+])):
+    __slots__ = ()
+    _categorical_fields = frozenset(['cloud', 'status'])
+    _uuid_fields = frozenset([0, 3])
+    id = _uuid_field(0)
+    run_id = _uuid_field(3)
+
+    def __new__(cls, id, cloud, status, run_id):
+        return tuple.__new__(cls, (_uuid_int(id), _intern(cloud),
+                                   _intern(status), _uuid_int(run_id)))
 
-Usage = collections.namedtuple('Usage', [
+
+class Usage(_Record, collections.namedtuple('Usage', [
     'cloud',
     'usage',
     'quota',
-])
+])):
+    __slots__ = ()
+    _categorical_fields = frozenset(['cloud'])
+
+    def __new__(cls, cloud, usage, quota):
+        return tuple.__new__(cls, (_intern(cloud), usage, quota))
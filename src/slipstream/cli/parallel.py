@@ -0,0 +1,40 @@
+from __future__ import absolute_import
+
+import itertools
+
+from concurrent import futures
+
+
+def imap_unordered(func, items, concurrency):
+    """Call FUNC on each of ITEMS with up to CONCURRENCY calls in flight.
+
+    Yield an ``(item, result, error)`` tuple as each call completes, where
+    ERROR is the exception raised by FUNC, if any. ITEMS is consumed as
+    calls complete, so it may be a long or endless iterator. Calls which
+    haven't started yet are cancelled if the generator is closed early.
+    """
+    items = iter(items)
+    pending = {}
+    executor = futures.ThreadPoolExecutor(max_workers=concurrency)
+
+    def submit(count):
+        for item in itertools.islice(items, count):
+            pending[executor.submit(func, item)] = item
+
+    try:
+        submit(concurrency)
+        while pending:
+            done, _ = futures.wait(pending,
+                                   return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    yield item, future.result(), None
+                else:
+                    yield item, None, error
+            submit(len(done))
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,182 @@
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import uuid
+from array import array
+
+from . import models
+
+# Type code of the arrays holding row numbers and category codes
+_ROWS = str('l')
+
+
+class _Column(object):
+    """The values of a field, one per row."""
+
+    def __init__(self):
+        self.keys = []
+
+    def append(self, value):
+        self.keys.append(value)
+
+    def __getitem__(self, row):
+        return self.keys[row]
+
+    def encode(self, value):
+        """Return the key stored for VALUE."""
+        return value
+
+    def decode(self, key):
+        return key
+
+
+class _UUIDColumn(_Column):
+    """The values of a UUID field, stored as ints like in `models`."""
+
+    def encode(self, value):
+        return models._uuid_int(value)
+
+    def decode(self, key):
+        return None if key is None else uuid.UUID(int=key)
+
+
+class _CategoricalColumn(_Column):
+    """The values of a categorical field, stored as an array of codes of
+    the distinct values.
+    """
+
+    def __init__(self):
+        self.keys = array(_ROWS)
+        self.values = []
+        self._codes = {}
+
+    def append(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        self.keys.append(code)
+
+    def __getitem__(self, row):
+        return self.values[self.keys[row]]
+
+    def encode(self, value):
+        return self._codes.get(value, -1)
+
+    def decode(self, key):
+        return self.values[key]
+
+
+class ResultSet(object):
+    """A columnar collection of `models` records of RECORD_TYPE.
+
+    Each field is stored in its own column, categorical ones as arrays of
+    codes. Hash indexes mapping the values of a field to the rows holding
+    them are built on first use, making lookups constant time, and counts
+    by any fields are computed in a single pass over their columns.
+    """
+
+    def __init__(self, record_type, records=()):
+        self.record_type = record_type
+        self.fields = record_type._fields
+        self.columns = collections.OrderedDict()
+        for index, field in enumerate(self.fields):
+            if field in record_type._categorical_fields:
+                column = _CategoricalColumn()
+            elif index in record_type._uuid_fields:
+                column = _UUIDColumn()
+            else:
+                column = _Column()
+            self.columns[field] = column
+        self._indexes = {}
+        self._length = 0
+        self.extend(records)
+
+    def extend(self, records):
+        columns = list(self.columns.values())
+        for record in records:
+            # Read the stored values, e.g. UUIDs as ints
+            for column, value in zip(columns, tuple.__iter__(record)):
+                column.append(value)
+            self._length += 1
+        self._indexes.clear()
+
+    def append(self, record):
+        self.extend([record])
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self._length
+        if not 0 <= row < self._length:
+            raise IndexError(row)
+        return self.record_type(*[column[row]
+                                  for column in self.columns.values()])
+
+    def __iter__(self):
+        for row in range(self._length):
+            yield self[row]
+
+    def column(self, field):
+        """Return the values of FIELD, one per row."""
+        column = self.columns[field]
+        return [column.decode(key) for key in column.keys]
+
+    def index(self, field):
+        """Return the hash index of FIELD, mapping each key stored in its
+        column to an array of the rows holding it.
+        """
+        index = self._indexes.get(field)
+        if index is None:
+            index = {}
+            for row, key in enumerate(self.columns[field].keys):
+                rows = index.get(key)
+                if rows is None:
+                    rows = index[key] = array(_ROWS)
+                rows.append(row)
+            self._indexes[field] = index
+        return index
+
+    def rows(self, **criteria):
+        """Return the rows whose fields have the values given as CRITERIA."""
+        rows = None
+        for field, value in criteria.items():
+            key = self.columns[field].encode(value)
+            matching = self.index(field).get(key, ())
+            rows = set(matching) if rows is None else rows.intersection(
+                matching)
+        if rows is None:
+            return list(range(self._length))
+        return sorted(rows)
+
+    def lookup(self, **criteria):
+        """Return the records whose fields have the values given as
+        CRITERIA, e.g. ``lookup(cloud='exoscale-ch-gva', status='running')``.
+        """
+        return [self[row] for row in self.rows(**criteria)]
+
+    def count_by(self, *fields):
+        """Return a `collections.Counter` of the number of records for each
+        tuple of values of FIELDS.
+        """
+        columns = [self.columns[field] for field in fields]
+        counts = collections.Counter(zip(*[column.keys
+                                           for column in columns]))
+        return collections.Counter(dict(
+            (tuple(column.decode(key) for column, key in zip(columns, keys)),
+             count) for keys, count in counts.items()))
+
+    def join(self, other, field, other_field='id'):
+        """Pair each record with the record of the result set OTHER whose
+        OTHER_FIELD is equal to its FIELD, or None, e.g. virtual machines
+        with their run with ``vms.join(runs, 'run_id')``.
+        """
+        column = self.columns[field]
+        other_column = other.columns[other_field]
+        index = other.index(other_field)
+        for row in range(self._length):
+            other_rows = index.get(other_column.encode(column.decode(
+                column.keys[row])))
+            yield self[row], other[other_rows[0]] if other_rows else None
@@ -0,0 +1,274 @@
+from __future__ import absolute_import, unicode_literals
+
+import shlex
+import types
+
+from six.moves import input
+
+import click
+
+from . import models
+from .base import AliasedGroup, Config
+from .log import logger
+from .resultset import ResultSet
+
+PROMPT = 'slipstream> '
+
+# Commands of the shell itself
+BUILTINS = ['exit', 'help', 'quit', 'refresh']
+
+# Methods of `api.Api` whose results are memoized
+LISTINGS = frozenset([
+    'get_module',
+    'list_applications',
+    'list_modules',
+    'list_runs',
+    'list_virtualmachines',
+    'usage',
+])
+
+# Methods of `api.Api` changing the state of the server, which invalidate
+# the memoized results
+MUTATIONS = frozenset([
+    'build_image',
+    'delete_module',
+    'logout',
+    'publish',
+    'run_deployment',
+    'run_image',
+    'terminate',
+    'terminate_many',
+    'unpublish',
+])
+
+# Methods of `api.Api` returning the ID of a new run
+RUN_CREATIONS = frozenset(['build_image', 'run_deployment', 'run_image'])
+
+
+def _replay(items):
+    for item in items:
+        yield item
+
+
+class MemoizingApi(object):
+    """Wrap API, an `api.Api`, memoizing the results of its listings until
+    `refresh` is called or the state of the server is changed through it.
+    Commands polling the server, like `watch` or `sync`, go through `fresh`
+    to the API itself instead.
+
+    The module paths and run UUIDs seen in the results are collected, to be
+    completed by the shell.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.listings = {}
+        self.paths = set()
+        self.run_ids = set()
+
+    def __getattr__(self, name):
+        attr = getattr(self.api, name)
+        if name in LISTINGS:
+            return lambda *args, **kwargs: self._listing(attr, args, kwargs)
+        if name in MUTATIONS:
+            return lambda *args, **kwargs: self._mutation(name, attr, args,
+                                                          kwargs)
+        return attr
+
+    def fresh(self):
+        return self.api
+
+    def refresh(self):
+        """Forget the memoized results, returning how many there were."""
+        count = len(self.listings)
+        self.listings.clear()
+        return count
+
+    def _listing(self, method, args, kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        if key in self.listings:
+            result, is_generator = self.listings[key]
+        else:
+            result = method(*args, **kwargs)
+            is_generator = isinstance(result, types.GeneratorType)
+            if is_generator:
+                result = [item for item in result]
+            self._collect(result if is_generator or
+                          isinstance(result, ResultSet) else [result])
+            self.listings[key] = result, is_generator
+        return _replay(result) if is_generator else result
+
+    def _mutation(self, name, method, args, kwargs):
+        self.refresh()
+        result = method(*args, **kwargs)
+        if name in RUN_CREATIONS:
+            self.run_ids.add('%s' % result)
+        return result
+
+    def _collect(self, items):
+        for item in items:
+            if isinstance(item, models.App):
+                self.paths.add(item.path)
+            elif isinstance(item, models.Run):
+                self.run_ids.add('%s' % item.id)
+                # Without the version
+                self.paths.add(item.module.rpartition('/')[0])
+            elif isinstance(item, models.VirtualMachine) \
+                    and item.run_id is not None:
+                self.run_ids.add('%s' % item.run_id)
+
+
+class Completer(object):
+    """Complete the commands of the group CLI and their options, along with
+    the module paths and run UUIDs known by API, a `MemoizingApi`.
+    """
+
+    def __init__(self, cli, api, aliases=()):
+        self.cli = cli
+        self.api = api
+        self.aliases = sorted(aliases)
+        self.matches = []
+
+    def candidates(self, line, text):
+        """Return the completions of TEXT, the word being typed at the end
+        of LINE.
+        """
+        try:
+            words = shlex.split(line)
+        except ValueError:
+            return []
+        if text and words and words[-1] == text:
+            words = words[:-1]
+
+        command = self.cli
+        for word in words:
+            if isinstance(command, click.MultiCommand):
+                subcommand = command.get_command(None, word) \
+                    if not isinstance(command, AliasedGroup) \
+                    else command._get_builtin_command(None, word)
+                if subcommand is not None:
+                    command = subcommand
+
+        if isinstance(command, click.MultiCommand) and not text.startswith('-'):
+            names = command.list_commands(None)
+            if command is self.cli:
+                names = names + self.aliases + BUILTINS
+        elif text.startswith('-'):
+            names = [opt for param in command.params
+                     for opt in getattr(param, 'opts', [])]
+        else:
+            names = sorted(self.api.paths) + sorted(self.api.run_ids)
+        return sorted(set(name for name in names if name.startswith(text)))
+
+    def complete(self, text, state):
+        """The completion function of `readline`."""
+        import readline
+
+        if state == 0:
+            line = readline.get_line_buffer()[:readline.get_endidx()]
+            self.matches = self.candidates(line, text)
+        if state < len(self.matches):
+            return self.matches[state]
+        return None
+
+
+def _setup_readline(completer):
+    try:
+        import readline
+    except ImportError:
+        return
+    readline.set_completer(completer.complete)
+    # Complete module paths and UUIDs as single words
+    readline.set_completer_delims(' \t\n')
+    if 'libedit' in (readline.__doc__ or ''):
+        readline.parse_and_bind('bind ^I rl_complete')
+    else:
+        readline.parse_and_bind('tab: complete')
+
+
+@click.command()
+@click.pass_context
+def shell(ctx):
+    """Run commands interactively, in a single session.
+
+    Listings are fetched once and then reused until `refresh` is typed or a
+    command changes something on the server. Module paths and run UUIDs
+    already listed are completed with the Tab key.
+    """
+    from .commands import cli, invoke
+
+    api = MemoizingApi(ctx.obj)
+    outer = ctx.parent.config
+    options = ctx.parent.params
+    # The settings given on the command line of the shell, over the file
+    defaults = Config(outer.filename, outer.profile)
+    defaults.read_config()
+    overrides = dict((key, value) for key, value in outer.settings.items()
+                     if defaults.settings.get(key) != value)
+
+    def api_factory(endpoint, cookie_file, cache, policy, stats):
+        # Only commands given another endpoint or --stats get their own
+        if stats is None and endpoint == api.endpoint \
+                and cookie_file == api.session.cookies.filename:
+            return api
+        from .api import Api
+        return Api(endpoint, cookie_file, cache, policy, stats)
+
+    def apply_options(command_ctx, cfg):
+        # Commands run with the options of the shell, unless they give theirs
+        for key, value in overrides.items():
+            if cfg.settings.get(key) == defaults.settings.get(key):
+                cfg.settings[key] = value
+        params = command_ctx.params
+        params['no_cache'] = params['no_cache'] or options['no_cache']
+        if params['max_age'] is None:
+            params['max_age'] = options['max_age']
+        return False
+
+    interactive = click.get_text_stream('stdin').isatty()
+    if interactive:
+        _setup_readline(Completer(cli, api, outer.aliases))
+        logger.notify("Type `help` for the list of commands, `refresh` to "
+                      "fetch listings again and `exit` to quit.")
+
+    while True:
+        try:
+            line = input(PROMPT if interactive else '')
+        except EOFError:
+            if interactive:
+                click.echo()
+            break
+        except KeyboardInterrupt:
+            click.echo()
+            continue
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            logger.error("%s", e)
+            continue
+        if not args:
+            continue
+        if args[0] in ('exit', 'quit'):
+            break
+        if args[0] == 'refresh':
+            logger.notify("Forgot %d listings.", api.refresh())
+            continue
+        if args[0] == 'help':
+            args = ['--help']
+        if args[0] == 'shell':
+            logger.error("Already in the shell.")
+            continue
+
+        cfg = Config(outer.filename, outer.profile)
+        cfg.api_factory = api_factory
+        try:
+            invoke(args, cfg, apply_options)
+        except KeyboardInterrupt:
+            click.echo()
+        if args[0] in ('login', 'logout'):
+            # Start over with the new session
+            from .api import Api
+            api.api = Api(api.endpoint, api.session.cookies.filename,
+                          api.cache, api.session.policy)
+            api.refresh()
+
@@ -0,0 +1,267 @@
+from __future__ import absolute_import, division, unicode_literals
+
+import bisect
+import collections
+import json
+import re
+import threading
+import time
+
+from six.moves.urllib.parse import urlparse
+
+from . import conf
+
+# Upper bounds, in seconds, of the buckets of the latency histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+           float('inf'))
+
+_UUID = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-'
+                   r'[0-9a-f]{12}', re.IGNORECASE)
+_NUMBER = re.compile(r'/\d+(?=/|$)')
+
+Summary = collections.namedtuple('Summary', [
+    'endpoint',
+    'requests',
+    'errors',
+    'cached',
+    'sent',
+    'received',
+    'ttfb_ms',
+    'ttfb_p95_ms',
+    'parse_ms',
+])
+
+
+def endpoint_pattern(url):
+    """Return the pattern of the endpoint of URL, its path with the module
+    paths, UUIDs and numbers replaced by placeholders.
+    """
+    path = urlparse(url).path or '/'
+    if path.startswith('/module/'):
+        return '/module/{path}'
+    return _NUMBER.sub('/{n}', _UUID.sub('{id}', path))
+
+
+class Histogram(object):
+    """Counts of observed durations per bucket of `BUCKETS`."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the Q quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return BUCKETS[-1]
+
+    def cumulative(self):
+        """Return ``(bound, count)`` pairs of the number of durations up to
+        each bound, as exported to Prometheus.
+        """
+        total = 0
+        pairs = []
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum,
+                'buckets': [['+Inf' if bound == BUCKETS[-1] else bound, count]
+                            for bound, count in self.cumulative()]}
+
+
+class EndpointStats(object):
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses = collections.Counter()
+        self.cached = 0
+        self.sent = 0
+        self.received = 0
+        self.ttfb = Histogram()
+        self.parse = Histogram()
+
+    @property
+    def errors(self):
+        return sum(count for status, count in self.statuses.items()
+                   if status == 'error' or int(status) >= 400)
+
+
+class RequestStats(object):
+    """Statistics of the requests sent to SlipStream, per method and
+    endpoint pattern: number of requests, responses by status, bytes sent
+    and received, time to first byte and parse time.
+
+    It is shared by the threads of an `api.Api`, and updated by
+    `api.SessionStore` as responses are received and by `api.Api` as they
+    are read and parsed.
+    """
+
+    def __init__(self):
+        self.endpoints = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _endpoint(self, method, url):
+        key = (method.upper(), endpoint_pattern(url))
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = EndpointStats()
+        return stats
+
+    def record_request(self, method, url, status, sent=0, ttfb=None):
+        """Record a request to URL, answered with STATUS after TTFB seconds,
+        or failed without a response if STATUS is None.
+        """
+        with self._lock:
+            stats = self._endpoint(method, url)
+            stats.requests += 1
+            stats.statuses['error' if status is None else '%d' % status] += 1
+            stats.sent += sent
+            if ttfb is not None:
+                stats.ttfb.observe(ttfb)
+
+    def record_received(self, method, url, size):
+        with self._lock:
+            self._endpoint(method, url).received += size
+
+    def record_cached(self, method, url):
+        """Record a response read from the cache without a request."""
+        with self._lock:
+            self._endpoint(method, url).cached += 1
+
+    def record_parse(self, method, url, seconds):
+        with self._lock:
+            self._endpoint(method, url).parse.observe(seconds)
+
+    def summary(self):
+        """Return a `Summary` per endpoint, with times in milliseconds."""
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 1)
+
+        with self._lock:
+            return [Summary('%s %s' % key, stats.requests, stats.errors,
+                            stats.cached, stats.sent, stats.received,
+                            ms(stats.ttfb.mean()),
+                            ms(stats.ttfb.quantile(0.95)),
+                            ms(stats.parse.sum))
+                    for key, stats in self.endpoints.items()]
+
+    def to_json(self):
+        with self._lock:
+            return json.dumps({
+                'time': time.time(),
+                'endpoints': [{
+                    'method': method,
+                    'endpoint': endpoint,
+                    'requests': stats.requests,
+                    'statuses': dict(stats.statuses),
+                    'errors': stats.errors,
+                    'cached': stats.cached,
+                    'bytes_sent': stats.sent,
+                    'bytes_received': stats.received,
+                    'ttfb_seconds': stats.ttfb.to_dict(),
+                    'parse_seconds': stats.parse.to_dict(),
+                } for (method, endpoint), stats in self.endpoints.items()],
+            }, indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """Return the statistics in the Prometheus text format, e.g. for the
+        textfile collector of the node exporter.
+        """
+        lines = []
+
+        def metric(name, type, help, samples):
+            lines.append('# HELP slipstream_%s %s' % (name, help))
+            lines.append('# TYPE slipstream_%s %s' % (name, type))
+            for suffix, labels, value in samples:
+                lines.append('slipstream_%s%s{%s} %s' % (
+                    name, suffix, ','.join('%s="%s"' % label
+                                           for label in labels), value))
+
+        def histogram(attr):
+            for (method, endpoint), stats in self.endpoints.items():
+                labels = [('method', method), ('endpoint', endpoint)]
+                hist = getattr(stats, attr)
+                for bound, count in hist.cumulative():
+                    yield '_bucket', labels + [
+                        ('le', '+Inf' if bound == BUCKETS[-1] else
+                         repr(bound))], count
+                yield '_sum', labels, repr(hist.sum)
+                yield '_count', labels, hist.count
+
+        def counter(attr):
+            return [('_total', [('method', method), ('endpoint', endpoint)],
+                     getattr(stats, attr))
+                    for (method, endpoint), stats in self.endpoints.items()]
+
+        with self._lock:
+            metric('http_requests', 'counter',
+                   "Requests sent to SlipStream, by response status.",
+                   [('_total', [('method', method), ('endpoint', endpoint),
+                                ('status', status)], count)
+                    for (method, endpoint), stats in self.endpoints.items()
+                    for status, count in sorted(stats.statuses.items())])
+            metric('http_cached_responses', 'counter',
+                   "Responses read from the local cache without a request.",
+                   counter('cached'))
+            metric('http_sent_bytes', 'counter',
+                   "Bytes of request bodies sent.", counter('sent'))
+            metric('http_received_bytes', 'counter',
+                   "Bytes of response bodies received.", counter('received'))
+            metric('http_ttfb_seconds', 'histogram',
+                   "Time until the headers of the response were received.",
+                   histogram('ttfb'))
+            metric('http_parse_seconds', 'histogram',
+                   "Time spent parsing response bodies.", histogram('parse'))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        """Write the statistics to FILENAME, in the Prometheus text format if
+        its extension is '.prom' and as JSON otherwise.
+
+        The file is replaced atomically, so that collectors never read a
+        partially written one.
+        """
+        if filename.endswith('.prom'):
+            data = self.to_prometheus()
+        else:
+            data = self.to_json() + '\n'
+        conf.atomic_write(filename, data.encode('utf-8'))
+
+
+class Timer(object):
+    """Accumulate the time spent getting items from the iterables it wraps,
+    excluding the time spent by their consumer.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def iterate(self, iterable):
+        iterator = iter(iterable)
+        while True:
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.seconds += time.time() - start
+                return
+            self.seconds += time.time() - start
+            yield item
@@ -0,0 +1,435 @@
+"""A stand-in SlipStream server, to test clients without a real one.
+
+`FakeServer` is a WSGI application keeping modules, runs and virtual
+machines in memory and serving them the way SlipStream does. `serve` runs
+it on a local port in a background thread::
+
+    with serve(FakeServer()) as endpoint:
+        api = Api(endpoint)
+        api.login('test', 'test')
+
+Large synthetic catalogs, e.g. for benchmarks, are made with
+`synthetic_modules` and the RUNS argument of `FakeServer`.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import contextlib
+import threading
+import time
+import uuid
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from xml.etree import ElementTree
+
+from six.moves import socketserver
+from six.moves.http_cookies import SimpleCookie
+from six.moves.urllib.parse import parse_qs
+
+COOKIE_NAME = 'com.sixsq.slipstream.cookie'
+
+# (path, category, version) of the modules served by default
+DEFAULT_MODULES = [
+    ('examples', 'Project', 56),
+    ('examples/images', 'Project', 57),
+    ('examples/images/centos-6', 'Image', 479),
+    ('examples/images/ubuntu-12.04', 'Image', 480),
+    ('examples/tutorials', 'Project', 58),
+    ('examples/tutorials/wordpress', 'Project', 59),
+    ('examples/tutorials/wordpress/wordpress', 'Deployment', 478),
+]
+
+DEFAULT_CLOUDS = ['exoscale-ch-gva', 'ec2-eu-west']
+
+DEFAULT_QUOTA = 20
+
+# Seconds after which sessions expire
+DEFAULT_SESSION_LIFETIME = 12 * 3600
+
+# Statuses given in turn to the runs created by `FakeServer.add_runs`
+RUN_STATUSES = ['Initializing', 'Provisioning', 'Executing',
+                'SendingReports', 'Ready', 'Finalizing', 'Done', 'Aborted',
+                'Cancelled']
+
+STATUS_REASONS = {
+    200: 'OK',
+    201: 'Created',
+    204: 'No Content',
+    400: 'Bad Request',
+    401: 'Unauthorized',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+}
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status):
+        super(HTTPError, self).__init__(status)
+        self.status = status
+
+
+class Request(object):
+
+    def __init__(self, environ):
+        self.method = environ['REQUEST_METHOD']
+        self.path = environ.get('PATH_INFO', '/')
+        self.query = dict((key, values[-1]) for key, values in
+                          parse_qs(environ.get('QUERY_STRING', '')).items())
+        self.cookies = SimpleCookie(environ.get('HTTP_COOKIE', ''))
+        self.form = {}
+        if self.method in ('POST', 'PUT'):
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            body = environ['wsgi.input'].read(length).decode('utf-8')
+            self.form = dict((key, values[-1]) for key, values in
+                             parse_qs(body).items())
+        self.host_url = '%s://%s' % (environ['wsgi.url_scheme'],
+                                     environ.get('HTTP_HOST') or
+                                     environ['SERVER_NAME'])
+
+
+def synthetic_modules(count, depth=2, fanout=4):
+    """Return COUNT modules, alternately images and deployments, spread over
+    the projects of a tree DEPTH levels deep where every project has FANOUT
+    sub-projects, as ``(path, category, version)`` tuples.
+    """
+    modules = []
+    projects = ['']
+    for level in range(depth):
+        children = []
+        for parent in projects:
+            for i in range(fanout):
+                path = '%sproject-%d' % (parent + '/' if parent else '', i)
+                modules.append((path, 'Project', len(modules) + 1))
+                children.append(path)
+        projects = children
+    for i in range(count):
+        parent = projects[i % len(projects)]
+        modules.append(('%smodule-%d' % (parent + '/' if parent else '', i),
+                        ['Image', 'Deployment'][i % 2], len(modules) + 1))
+    return modules
+
+
+def _xml(tag, attrs=None, children=()):
+    elem = ElementTree.Element(tag, dict((key, '%s' % value) for key, value
+                                         in (attrs or {}).items()
+                                         if value is not None))
+    elem.extend(children)
+    return elem
+
+
+class FakeServer(object):
+    """A WSGI application serving the part of the SlipStream API used by
+    `api.Api`, with a single user USERNAME identified by PASSWORD.
+
+    Modules are given as ``(path, category, version)`` tuples. Runs are
+    created with one virtual machine and stay 'Initializing' until they are
+    moved along with `set_status` or terminated. The server starts with
+    RUNS runs of its non-project modules, with VMS_PER_RUN virtual machines
+    each. Every request is answered after LATENCY seconds. Sessions expire
+    after SESSION_LIFETIME seconds, as given in their cookie.
+    """
+
+    def __init__(self, modules=DEFAULT_MODULES, clouds=DEFAULT_CLOUDS,
+                 username='test', password='test', runs=0, vms_per_run=1,
+                 latency=0, session_lifetime=DEFAULT_SESSION_LIFETIME):
+        self.modules = dict((path, {'category': category, 'version': version,
+                                    'published': category != 'Project'})
+                            for path, category, version in modules)
+        self.clouds = list(clouds)
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.session_lifetime = session_lifetime
+        self.token = None
+        self.expires_at = None
+        self.logins = 0
+        self.runs = []
+        self.vms = []
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._index_children()
+        self.add_runs(runs, vms_per_run)
+
+    def _index_children(self):
+        self._children = collections.defaultdict(list)
+        for path in sorted(self.modules):
+            self._children[path.rpartition('/')[0]].append(path)
+
+    def add_module(self, path, category, version):
+        """Create the module PATH of CATEGORY, e.g. 'Image', at VERSION,
+        leaving the version of its project unchanged.
+        """
+        self.modules[path] = {'category': category, 'version': version,
+                              'published': category != 'Project'}
+        self._index_children()
+
+    def add_runs(self, count, vms_per_run=1):
+        """Create COUNT runs of the modules other than projects, on every
+        cloud and in every status in turn.
+        """
+        paths = sorted(path for path, module in self.modules.items()
+                       if module['category'] != 'Project')
+        with self._lock:
+            for i in range(count):
+                self._new_run(paths[i % len(paths)],
+                              self.clouds[i % len(self.clouds)],
+                              'Orchestration',
+                              RUN_STATUSES[i % len(RUN_STATUSES)],
+                              vms_per_run)
+
+    def _new_run(self, path, cloud, type, status, vms):
+        run = {
+            'uuid': str(uuid.uuid4()),
+            'module': 'module/%s/%d' % (path, self.modules[path]['version']),
+            'status': status,
+            'startTime': '2014-06-13 12:09:47.202 UTC',
+            'cloud': cloud,
+            'type': type,
+        }
+        self.runs.append(run)
+        for _ in range(vms):
+            self.vms.append({
+                'instanceId': str(uuid.uuid4()),
+                'cloud': cloud,
+                'state': 'Terminated' if status in ('Done', 'Aborted',
+                                                    'Cancelled')
+                else 'Running',
+                'runUuid': run['uuid'],
+            })
+        return run
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        headers = []
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            with self._lock:
+                self.requests += 1
+                status, body = self.dispatch(request, headers)
+        except HTTPError as e:
+            status, body = e.status, None
+        if isinstance(body, ElementTree.Element):
+            body = ElementTree.tostring(body, encoding='utf-8')
+            headers.append(('Content-Type', 'application/xml'))
+        body = body or b''
+        headers.append(('Content-Length', str(len(body))))
+        start_response('%d %s' % (status, STATUS_REASONS[status]), headers)
+        return [body]
+
+    def dispatch(self, request, headers):
+        parts = [part for part in request.path.split('/') if part]
+        route = (request.method, parts[0] if parts else '')
+        if route == ('POST', 'login'):
+            return self.login(request, headers)
+        cookie = request.cookies.get(COOKIE_NAME)
+        if self.token is None or cookie is None \
+                or cookie.value != self.token or time.time() >= self.expires_at:
+            raise HTTPError(401)
+        if route == ('GET', 'logout'):
+            self.token = None
+            return 200, None
+        if route == ('GET', ''):
+            return 200, self.welcome()
+        if route[1] == 'module':
+            return self.module(request, parts[1:])
+        if route == ('GET', 'run'):
+            # Newest runs first
+            return 200, self.page('runs', request.query, len(self.runs),
+                                  lambda start, end: [
+                                      self.run_item(run) for run in
+                                      reversed(self.runs[max(0, len(
+                                          self.runs) - end):len(self.runs) -
+                                          start])])
+        if route == ('POST', 'run'):
+            return self.create_run(request, headers)
+        if route == ('DELETE', 'run') and len(parts) == 2:
+            return self.terminate(parts[1])
+        if route == ('GET', 'vms'):
+            vms = self.vms
+            if any(param in request.query
+                   for param in ('runUuid', 'cloud', 'status')):
+                vms = [vm for vm in vms if self.match_vm(vm, request.query)]
+            return 200, self.page('vms', request.query, len(vms),
+                                  lambda start, end: [
+                                      _xml('vm', vm) for vm in vms[start:end]])
+        if route == ('GET', 'dashboard'):
+            return 200, self.dashboard()
+        raise HTTPError(404)
+
+    def login(self, request, headers):
+        if request.form.get('username') != self.username \
+                or request.form.get('password') != self.password:
+            raise HTTPError(401)
+        self.logins += 1
+        self.expires_at = time.time() + self.session_lifetime
+        self.token = ('com.sixsq.idtype=local&com.sixsq.identifier=%s&'
+                      'com.sixsq.expirydate=%d&com.sixsq.signature=%s' % (
+                          self.username, self.expires_at * 1000,
+                          uuid.uuid4().hex))
+        headers.append(('Set-Cookie', '%s=%s; Path=/' % (COOKIE_NAME,
+                                                         self.token)))
+        return 200, None
+
+    def module_item(self, path, with_uri=True):
+        module = self.modules[path]
+        return _xml('item', {
+            'resourceUri': 'module/%s/%d' % (path, module['version'])
+            if with_uri else None,
+            'name': path.rpartition('/')[2],
+            'category': module['category'],
+            'version': module['version'],
+        })
+
+    def children(self, path):
+        return self._children.get(path, [])
+
+    def welcome(self):
+        return _xml('welcome', children=[_xml('modules', children=[
+            _xml('item', dict(self.module_item(path).attrib, published='true'))
+            for path in sorted(self.modules)
+            if self.modules[path]['published']])])
+
+    def module(self, request, parts):
+        if not parts:
+            if request.method != 'GET':
+                raise HTTPError(405)
+            return 200, _xml('list', children=[
+                self.module_item(path) for path in self.children('')])
+        action = None
+        if parts[-1] == 'publish':
+            action = parts.pop()
+        if parts and parts[-1].isdigit():
+            parts.pop()
+        path = '/'.join(parts)
+        if path not in self.modules:
+            raise HTTPError(404)
+        module = self.modules[path]
+
+        if action is not None:
+            if request.method not in ('PUT', 'DELETE'):
+                raise HTTPError(405)
+            module['published'] = request.method == 'PUT'
+            return 200, None
+        if request.method == 'DELETE':
+            for child in list(self.modules):
+                if child == path or child.startswith(path + '/'):
+                    del self.modules[child]
+            self._index_children()
+            return 204, None
+        if request.method != 'GET':
+            raise HTTPError(405)
+
+        parent, _, name = path.rpartition('/')
+        tag = '%sModule' % module['category'].lower()
+        children = []
+        if module['category'] == 'Project':
+            children.append(_xml('children', children=[
+                self.module_item(child, with_uri=False)
+                for child in self.children(path)]))
+        return 200, _xml(tag, {
+            'category': module['category'],
+            'shortName': name,
+            'version': module['version'],
+            'parentUri': 'module/%s' % parent,
+        }, children)
+
+    def page(self, tag, query, total, items):
+        """Return the page of the collection TAG of TOTAL items requested by
+        QUERY, whose elements are made by ITEMS from a start and end index.
+        """
+        offset = int(query.get('offset', 0))
+        limit = int(query.get('limit', total))
+        page = items(min(offset, total), min(offset + limit, total))
+        return _xml(tag, {'offset': offset, 'limit': limit,
+                          'count': len(page), 'totalCount': total}, page)
+
+    def run_item(self, run):
+        return _xml('item', {
+            'resourceUri': 'run/%s' % run['uuid'],
+            'uuid': run['uuid'],
+            'moduleResourceUri': run['module'],
+            'status': run['status'],
+            'startTime': run['startTime'],
+            'cloudServiceName': run['cloud'],
+            'type': run['type'],
+        })
+
+    def create_run(self, request, headers):
+        path = request.form.get('refqname', '').strip('/')
+        if path.startswith('module/'):
+            path = path[len('module/'):]
+        if path not in self.modules:
+            raise HTTPError(404)
+        cloud = request.form.get('parameter--cloudservice', 'default')
+        if cloud == 'default':
+            cloud = self.clouds[0]
+        run = self._new_run(path, cloud,
+                            request.form.get('type', 'Orchestration'),
+                            'Initializing', 1)
+        headers.append(('Location', '%s/run/%s' % (request.host_url,
+                                                   run['uuid'])))
+        return 201, None
+
+    def set_status(self, run_id, status):
+        """Move the run RUN_ID to STATUS, e.g. 'Ready' or 'Done'."""
+        with self._lock:
+            for run in self.runs:
+                if run['uuid'] == str(run_id):
+                    run['status'] = status
+
+    def terminate(self, run_id):
+        for run in self.runs:
+            if run['uuid'] == run_id:
+                run['status'] = 'Cancelled'
+                for vm in self.vms:
+                    if vm['runUuid'] == run_id:
+                        vm['state'] = 'Terminated'
+                return 204, None
+        raise HTTPError(404)
+
+    def match_vm(self, vm, query):
+        return all(query.get(param) is None or
+                   vm[attr].lower() == query[param].lower()
+                   for param, attr in [('runUuid', 'runUuid'),
+                                       ('cloud', 'cloud'),
+                                       ('status', 'state')])
+
+    def dashboard(self):
+        return _xml('dashboard', children=[_xml('usage', children=[
+            _xml('usageElement', {
+                'cloud': cloud,
+                'quota': DEFAULT_QUOTA,
+                'currentUsage': len([vm for vm in self.vms
+                                     if vm['cloud'] == cloud
+                                     and vm['state'] == 'Running']),
+            }) for cloud in self.clouds])])
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class _QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve(app, host='127.0.0.1', port=0):
+    """Serve the WSGI application APP from a background thread, on an
+    available PORT unless one is given. Yield the endpoint URL to use.
+    """
+    server = make_server(host, port, app, server_class=_ThreadingWSGIServer,
+                         handler_class=_QuietHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield 'http://%s:%d' % server.server_address[:2]
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
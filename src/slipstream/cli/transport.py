@@ -0,0 +1,165 @@
+from __future__ import absolute_import
+
+import email.utils
+import random
+import threading
+import time
+
+import requests
+
+from .log import logger
+
+# Settings of a profile configuring the transport, with their defaults
+DEFAULT_SETTINGS = {
+    # Number of hosts to keep connections to
+    'pool_size': 10,
+    # Number of connections kept alive per host
+    'max_connections': 10,
+    # Number of times a failed GET or DELETE is sent again
+    'retries': 3,
+    # Seconds to wait before the first retry, doubled for every other one
+    'retry_backoff': 0.5,
+    'retry_max_backoff': 30.0,
+    # Number of consecutive failures after which requests fail fast
+    'circuit_threshold': 5,
+    # Seconds after which a request is allowed through an open circuit
+    'circuit_timeout': 30.0,
+}
+
+# Methods which can safely be sent again
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'DELETE'])
+
+# Statuses sent by the frontend when SlipStream is temporarily unavailable
+RETRY_STATUSES = frozenset([502, 503, 504])
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request to an endpoint which failed too
+    many times in a row.
+    """
+
+
+def retry_after(value):
+    """Return the number of seconds to wait according to the Retry-After
+    header VALUE, either a number of seconds or an HTTP date, or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    date = email.utils.parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(date) - time.time())
+
+
+class CircuitBreaker(object):
+    """Count consecutive failures, and fail fast once there were THRESHOLD
+    of them, until TIMEOUT seconds have passed. A single request is then let
+    through, which closes the circuit again if it succeeds.
+    """
+
+    def __init__(self, threshold, timeout):
+        self.threshold = threshold
+        self.timeout = timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        if not self.threshold:
+            return
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.time() - self.opened_at < self.timeout:
+                raise CircuitOpenError(
+                    "Giving up after %d consecutive failures, retrying in "
+                    "%ds." % (self.failures, self.timeout -
+                              (time.time() - self.opened_at)))
+            # Half-open: let this request through, and fail fast for the
+            # others until it completes
+            self.opened_at = time.time()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.threshold and self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.debug("Opening the circuit after %d failures.",
+                                 self.failures)
+                self.opened_at = time.time()
+
+
+class TransportPolicy(object):
+    """How `api.SessionStore` pools connections and retries requests.
+
+    Idempotent requests failing with a connection error or a status of
+    RETRY_STATUSES are sent up to RETRIES more times, waiting for the time
+    given by the Retry-After header or an exponential backoff with full
+    jitter. Every failure counts towards the circuit breaker.
+    """
+
+    def __init__(self, pool_size=DEFAULT_SETTINGS['pool_size'],
+                 max_connections=DEFAULT_SETTINGS['max_connections'],
+                 retries=DEFAULT_SETTINGS['retries'],
+                 retry_backoff=DEFAULT_SETTINGS['retry_backoff'],
+                 retry_max_backoff=DEFAULT_SETTINGS['retry_max_backoff'],
+                 circuit_threshold=DEFAULT_SETTINGS['circuit_threshold'],
+                 circuit_timeout=DEFAULT_SETTINGS['circuit_timeout']):
+        self.pool_size = pool_size
+        self.max_connections = max_connections
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.retry_max_backoff = retry_max_backoff
+        self.circuit_threshold = circuit_threshold
+        self.circuit_timeout = circuit_timeout
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Create a policy from the SETTINGS of a `base.Config` profile,
+        raising ValueError for invalid values.
+        """
+        kwargs = {}
+        for name, default in DEFAULT_SETTINGS.items():
+            if name not in settings:
+                continue
+            try:
+                value = type(default)(settings[name])
+            except ValueError:
+                raise ValueError("Invalid value for setting '%s': %s"
+                                 % (name, settings[name]))
+            if value < 0:
+                raise ValueError("Setting '%s' can't be negative." % name)
+            kwargs[name] = value
+        return cls(**kwargs)
+
+    def adapter(self, max_connections=None):
+        return requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=max_connections or self.max_connections)
+
+    def circuit_breaker(self):
+        return CircuitBreaker(self.circuit_threshold, self.circuit_timeout)
+
+    def should_retry(self, method, attempt):
+        return method.upper() in IDEMPOTENT_METHODS and attempt < self.retries
+
+    def delay(self, attempt, response=None):
+        """Return the number of seconds to wait before sending a request
+        again after ATTEMPT failed ones, the last one with RESPONSE, or None
+        if the server asked to wait longer than the maximum backoff.
+        """
+        if response is not None:
+            seconds = retry_after(response.headers.get('Retry-After'))
+            if seconds is not None:
+                return seconds if seconds <= self.retry_max_backoff else None
+        backoff = min(self.retry_backoff * 2 ** attempt, self.retry_max_backoff)
+        return random.uniform(0, backoff)
@@ -2,6 +2,8 @@ import click
 
 from six.moves.urllib.parse import urlparse
 
+from . import where
+
 
 class URL(click.ParamType):
     name = 'url'
@@ -34,3 +36,55 @@ class NodeKeyValue(click.ParamType):
             return (node, tuple(param.split('=', 1)))
         except ValueError:
             self.fail("%s is not a valid NODE:KEY=VALUE value" % value, param, ctx)
+
+
+class FieldList(click.ParamType):
+    name = 'fieldlist'
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, list):
+            return value
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        for field in fields:
+            if field not in self.fields:
+                self.fail("invalid field: %s. (choose from %s)"
+                          % (field, ', '.join(self.fields)), param, ctx)
+        if not fields:
+            self.fail("no field given", param, ctx)
+        return fields
+
+
+class Duration(click.ParamType):
+    """A duration such as '90s', '30m', '12h', '7d' or '2w', converted to
+    seconds.
+    """
+    name = 'duration'
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        try:
+            return int(value[:-1]) * self.units[value[-1]]
+        except (KeyError, ValueError, IndexError):
+            self.fail("%s is not a valid duration, e.g. 30m, 12h or 7d"
+                      % value, param, ctx)
+
+
+class Where(click.ParamType):
+    """A `where.Where` expression over FIELDS."""
+    name = 'where'
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, where.Where):
+            return value
+        try:
+            return where.Where(value, self.fields)
+        except where.WhereError as e:
+            self.fail("invalid expression: %s" % e, param, ctx)
@@ -0,0 +1,128 @@
+from __future__ import absolute_import, unicode_literals
+
+import time
+
+import click
+
+from . import models
+from .commands import read_run_ids, wait_runs
+
+# Seconds between two polls of the runs, doubled each time nothing changed
+DEFAULT_INTERVAL = 2
+DEFAULT_MAX_INTERVAL = 60
+
+# Number of polls in a row a run can be missing from the listing, e.g. while
+# it is being created, before watching it fails
+DEFAULT_MAX_MISSING = 3
+
+
+class WatchError(Exception):
+    pass
+
+
+def reached(status, until=None):
+    """Whether a run in STATUS is done being watched for UNTIL."""
+    if status in models.TERMINAL_STATES:
+        return True
+    if until is None or status not in models.RUN_STATES:
+        return False
+    return models.RUN_STATES.index(status) >= models.RUN_STATES.index(until)
+
+
+def poll_runs(api, run_ids, since=None):
+    """Return the `models.Run` of each of RUN_IDS found in a single pass
+    over the runs listed by API, along with the start time of the newest
+    run listed.
+
+    As runs are listed newest first, the pass stops as soon as all of
+    RUN_IDS were seen, or at the first run started before SINCE.
+    """
+    remaining = set(run_ids)
+    found = {}
+    newest = None
+    runs = api.list_runs()
+    try:
+        for run in runs:
+            if newest is None:
+                newest = run.started_at
+            if since is not None and run.started_at is not None \
+                    and run.started_at < since:
+                break
+            if run.id in remaining:
+                found[run.id] = run
+                remaining.discard(run.id)
+                if not remaining:
+                    break
+    finally:
+        runs.close()
+    return found, newest
+
+
+def watch_runs(api, run_ids, until=None, interval=DEFAULT_INTERVAL,
+               max_interval=DEFAULT_MAX_INTERVAL,
+               max_missing=DEFAULT_MAX_MISSING):
+    """Poll RUN_IDS until each of them reaches UNTIL, or a terminal state.
+
+    Yield ``(run_id, status)`` every time a run changes status. All the runs
+    are polled together with one listing of the runs. Polls start INTERVAL
+    seconds apart, and slow down up to MAX_INTERVAL while nothing changes.
+    Unchanged listings are revalidated with the server rather than fetched
+    again when the API has a response cache.
+
+    Only the first poll goes through the whole listing: runs missing from
+    it can only show up later as new runs, so the next polls stop at the
+    runs older than both them and the runs found.
+
+    Raise `WatchError` once some runs were missing from MAX_MISSING
+    listings in a row.
+    """
+    statuses = {}
+    missing = dict((run_id, 0) for run_id in run_ids)
+    remaining = list(run_ids)
+    delay = interval
+    since = None
+    while remaining:
+        polled, newest = poll_runs(api, remaining, since)
+        changed = False
+        starts = []
+        for run_id in list(remaining):
+            run = polled.get(run_id)
+            if run is None:
+                missing[run_id] += 1
+                starts.append(newest)
+                continue
+            missing[run_id] = 0
+            if statuses.get(run_id) != run.status:
+                statuses[run_id] = run.status
+                changed = True
+                yield run_id, run.status
+            if reached(run.status, until):
+                remaining.remove(run_id)
+            else:
+                starts.append(run.started_at)
+        if not remaining:
+            break
+        not_found = [run_id for run_id in remaining
+                     if missing[run_id] >= max_missing]
+        if not_found:
+            raise WatchError("Runs not found: %s" % ', '.join(
+                '%s' % run_id for run_id in not_found))
+        # Without a start time to bound it, the next poll goes through all
+        since = None if None in starts else min(starts)
+        delay = interval if changed else min(delay * 2, max_interval)
+        time.sleep(delay)
+
+
+@click.command()
+@click.option('--until', metavar='STATE', type=click.Choice(models.RUN_STATES),
+              help="The state to wait for instead of a terminal one.")
+@click.argument('run_ids', metavar='UUID...', nargs=-1)
+@click.pass_obj
+def watch(api, until, run_ids):
+    """Show the status of the given run UUIDs as it changes, until they all
+    reach a terminal state.
+
+    If no UUID is given, or UUID is '-', they are read from the standard
+    input, one per line. Fails if any of the runs was aborted or cancelled.
+    """
+    wait_runs(api, read_run_ids(run_ids), until)
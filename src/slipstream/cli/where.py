@@ -0,0 +1,365 @@
+"""The expressions of the `--where` option of the list commands.
+
+An expression compares the fields of the listed records with values, and
+combines comparisons with `and`, `or`, `not` and parentheses, e.g.::
+
+    cloud = exoscale-ch-gva and status in (running, pending)
+    path glob 'examples/tutorials/*' and version >= 480
+    not (module ~ '^examples/images/') or started_at >= '2014-06-13'
+
+The operators are `=`, `!=`, `<`, `<=`, `>`, `>=`, `in`, `not in`, `glob`
+for shell-style patterns and `~` and `!~` for regular expressions. Values
+are quoted when they hold spaces, parentheses, commas, quotes or operators.
+Values which are numbers are compared as such with numeric fields, and
+anything else as text.
+
+Expressions are compiled once into a predicate. They also tell the API
+which of their conditions can be handed to the server, or used to avoid
+fetching what can't match.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import collections
+import fnmatch
+import operator
+import re
+import uuid
+
+import six
+
+KEYWORDS = frozenset(['and', 'or', 'not', 'in', 'glob'])
+
+# Fields whose values are lower-cased by the API, as are the values they
+# are compared with
+LOWERCASE_FIELDS = frozenset(['status', 'type'])
+
+# Fields holding UUIDs, whose values are compared in their canonical form
+UUID_FIELDS = frozenset(['id', 'run_id'])
+
+ORDERINGS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+TOKEN = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<operator>==|!=|<=|>=|!~|[=<>~(),])
+  | (?P<word>[^\s'"()=!<>~,]+)
+)""", re.VERBOSE)
+
+NUMBER_TYPES = six.integer_types + (float,)
+
+Token = collections.namedtuple('Token', ['kind', 'value', 'position'])
+
+Comparison = collections.namedtuple('Comparison', ['field', 'operator',
+                                                   'values'])
+And = collections.namedtuple('And', ['operands'])
+Or = collections.namedtuple('Or', ['operands'])
+Not = collections.namedtuple('Not', ['operand'])
+
+
+class WhereError(ValueError):
+    pass
+
+
+def tokenize(text):
+    """Return the `Token` list of TEXT, ending with an 'end' token."""
+    tokens = []
+    position = 0
+    while True:
+        match = TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            rest = text[position:]
+            if rest.strip():
+                raise WhereError("Unexpected character at position %d: %s"
+                                 % (len(text) - len(rest.lstrip()),
+                                    rest.strip()[0]))
+            tokens.append(Token('end', None, len(text)))
+            return tokens
+        kind = match.lastgroup
+        value = match.group(kind)
+        start = match.start(kind)
+        if kind == 'string':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        elif kind == 'operator' and value == '==':
+            value = '='
+        elif kind == 'word' and value.lower() in KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        tokens.append(Token(kind, value, start))
+        position = match.end()
+
+
+class _Parser(object):
+
+    def __init__(self, text, fields):
+        self.tokens = tokenize(text)
+        self.fields = fields
+        self.index = 0
+
+    @property
+    def token(self):
+        return self.tokens[self.index]
+
+    def accept(self, kind, value=None):
+        token = self.token
+        if token.kind == kind and (value is None or token.value == value):
+            self.index += 1
+            return token
+        return None
+
+    def expect(self, kind, value=None, what=None):
+        token = self.accept(kind, value)
+        if token is None:
+            found = self.token
+            raise WhereError("Expected %s at position %d, found %s" % (
+                what or value, found.position,
+                'the end' if found.kind == 'end' else repr(found.value)))
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        self.expect('end', what='an operator or the end')
+        return node
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.accept('keyword', 'or'):
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while self.accept('keyword', 'and'):
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def parse_not(self):
+        if self.accept('keyword', 'not'):
+            return Not(self.parse_not())
+        if self.accept('operator', '('):
+            node = self.parse_or()
+            self.expect('operator', ')')
+            return node
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        token = self.expect('word', what='a field')
+        field = token.value
+        if field not in self.fields:
+            raise WhereError("Unknown field at position %d: %s (choose from "
+                             "%s)" % (token.position, field,
+                                      ', '.join(self.fields)))
+        negated = bool(self.accept('keyword', 'not'))
+        if negated or self.accept('keyword', 'in'):
+            if negated:
+                self.expect('keyword', 'in')
+            self.expect('operator', '(')
+            values = [self.value()]
+            while self.accept('operator', ','):
+                values.append(self.value())
+            self.expect('operator', ')')
+            return Comparison(field, 'not in' if negated else 'in', values)
+        if self.accept('keyword', 'glob'):
+            return Comparison(field, 'glob', [self.value()])
+        token = self.token
+        if token.kind != 'operator' or token.value in '(),':
+            raise WhereError("Expected an operator at position %d"
+                             % token.position)
+        self.index += 1
+        return Comparison(field, token.value, [self.value()])
+
+    def value(self):
+        token = self.accept('string') or self.accept('word') \
+            or self.expect('keyword', what='a value')
+        return token.value
+
+
+def parse(text, fields):
+    """Parse the expression TEXT over FIELDS, the names of the fields of the
+    filtered records, into a tree of `Comparison`, `And`, `Or` and `Not`.
+    """
+    return _Parser(text, fields).parse()
+
+
+def _number(value):
+    for convert in six.integer_types + (float,):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return None
+
+
+def _text(value):
+    return '' if value is None else six.text_type(value)
+
+
+def _normalize(field, value):
+    """Return VALUE in the form the API gives to the values of FIELD."""
+    if field in LOWERCASE_FIELDS:
+        return value.lower()
+    if field in UUID_FIELDS:
+        # Left as is when not a whole UUID, e.g. for ordering comparisons
+        try:
+            return six.text_type(uuid.UUID(value))
+        except ValueError:
+            pass
+    return value
+
+
+def _compile_comparison(node):
+    get = operator.attrgetter(node.field)
+    op = node.operator
+    values = node.values
+    if op not in ('~', '!~'):
+        values = [_normalize(node.field, value) for value in values]
+
+    if op in ('~', '!~'):
+        try:
+            search = re.compile(values[0]).search
+        except re.error as e:
+            raise WhereError("Invalid regular expression %r: %s"
+                             % (values[0], e))
+        if op == '~':
+            return lambda item: search(_text(get(item))) is not None
+        return lambda item: search(_text(get(item))) is None
+
+    if op == 'glob':
+        match = re.compile(fnmatch.translate(values[0])).match
+        return lambda item: match(_text(get(item))) is not None
+
+    if op in ('in', 'not in', '=', '!='):
+        texts = frozenset(values)
+        numbers = frozenset(number for number in map(_number, values)
+                            if number is not None)
+
+        def contains(item):
+            value = get(item)
+            if isinstance(value, NUMBER_TYPES):
+                return value in numbers
+            return _text(value) in texts
+
+        if op in ('in', '='):
+            return contains
+        return lambda item: not contains(item)
+
+    compare = ORDERINGS[op]
+    text = values[0]
+    number = _number(text)
+
+    def ordered(item):
+        value = get(item)
+        if value is None:
+            return False
+        if number is not None and isinstance(value, NUMBER_TYPES):
+            return compare(value, number)
+        return compare(six.text_type(value), text)
+
+    return ordered
+
+
+def compile(node):
+    """Return the predicate checking whether a record matches NODE."""
+    if isinstance(node, Comparison):
+        return _compile_comparison(node)
+    if isinstance(node, Not):
+        operand = compile(node.operand)
+        return lambda item: not operand(item)
+    operands = [compile(operand) for operand in node.operands]
+    if len(operands) == 2:
+        # The most common case, without a loop
+        first, second = operands
+        if isinstance(node, And):
+            return lambda item: first(item) and second(item)
+        return lambda item: first(item) or second(item)
+    if isinstance(node, And):
+        return lambda item: all(operand(item) for operand in operands)
+    return lambda item: any(operand(item) for operand in operands)
+
+
+class Where(object):
+    """The expression TEXT over FIELDS, compiled into its `match` predicate.
+    """
+
+    def __init__(self, text, fields):
+        self.text = text
+        self.fields = tuple(fields)
+        self.node = parse(text, self.fields)
+        self.match = compile(self.node)
+        self.conjuncts = self.node.operands if isinstance(self.node, And) \
+            else [self.node]
+
+    def __repr__(self):
+        return 'Where(%r)' % self.text
+
+    def __eq__(self, other):
+        return isinstance(other, Where) and (self.text, self.fields) == \
+            (other.text, other.fields)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.text, self.fields))
+
+    def conjoin(self, text):
+        """Return the expression matching the records which match both
+        this expression and TEXT.
+        """
+        return Where('(%s) and (%s)' % (self.text, text), self.fields)
+
+    def _comparisons(self, field, operators):
+        for node in self.conjuncts:
+            if isinstance(node, Comparison) and node.field == field \
+                    and node.operator in operators:
+                yield node
+
+    def equalities(self, fields):
+        """Return the values which the records must equal, by field of
+        FIELDS, for the conditions which are required by the expression.
+        """
+        equalities = {}
+        for field in fields:
+            for node in self._comparisons(field, ('=', 'in')):
+                if len(node.values) == 1:
+                    equalities[field] = _normalize(field, node.values[0])
+        return equalities
+
+    def covered_by(self, fields):
+        """Return whether the expression is only made of the equalities on
+        FIELDS found by `equalities`, i.e. whether they select the same
+        records.
+        """
+        for node in self.conjuncts:
+            if not isinstance(node, Comparison) or node.field not in fields \
+                    or node.operator not in ('=', 'in') \
+                    or len(node.values) != 1:
+                return False
+        # Two different values for the same field would select nothing
+        return len(self.conjuncts) == len(self.equalities(fields))
+
+    def lower_bound(self, field):
+        """Return the greatest value the expression requires FIELD to be
+        above or equal to, or None.
+        """
+        bounds = [node.values[0]
+                  for node in self._comparisons(field, ('>', '>=', '='))]
+        return max(bounds) if bounds else None
+
+    def may_contain(self, path, field='path'):
+        """Return whether records with a FIELD below PATH, the path of a
+        project, could match, from the equalities and patterns the
+        expression requires FIELD to match.
+        """
+        prefix = path.strip('/') + '/'
+        for node in self._comparisons(field, ('=', 'in', 'glob')):
+            if node.operator == 'glob':
+                # The part of the pattern before its first wildcard
+                start = re.split(r'[*?\[]', node.values[0], 1)[0]
+                if not (start.startswith(prefix) or prefix.startswith(start)):
+                    return False
+            elif not any(value.startswith(prefix) for value in node.values):
+                return False
+        return True
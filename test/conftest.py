@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 
+import sys
 import uuid
 
 from slipstream.cli import models
@@ -8,6 +9,12 @@ import mock
 import pytest
 from click.testing import CliRunner
 
+from slipstream.cli.testing import FakeServer, serve
+
+# The asyncio client uses syntax only available on Python 3.6 and above
+if sys.version_info < (3, 6):
+    collect_ignore = ['test_aio.py']
+
 
 @pytest.fixture(autouse=True)
 def config_file(monkeypatch, tmpdir):
@@ -23,6 +30,41 @@ def cookie_file(monkeypatch, tmpdir):
                         cookie_file.strpath)
     return cookie_file
 
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmpdir):
+    cache_dir = tmpdir.join('cache')
+    monkeypatch.setattr('slipstream.cli.conf.DEFAULT_CACHE_DIR',
+                        cache_dir.strpath)
+    return cache_dir
+
+@pytest.fixture(autouse=True)
+def index_file(monkeypatch, tmpdir):
+    index_file = tmpdir.join('modules.json')
+    monkeypatch.setattr('slipstream.cli.conf.DEFAULT_INDEX_FILE',
+                        index_file.strpath)
+    return index_file
+
+@pytest.fixture(autouse=True)
+def history_file(monkeypatch, tmpdir):
+    history_file = tmpdir.join('usage.dat')
+    monkeypatch.setattr('slipstream.cli.conf.DEFAULT_HISTORY_FILE',
+                        history_file.strpath)
+    return history_file
+
+@pytest.fixture(autouse=True)
+def mirror_file(monkeypatch, tmpdir):
+    mirror_file = tmpdir.join('mirror.db')
+    monkeypatch.setattr('slipstream.cli.conf.DEFAULT_MIRROR_FILE',
+                        mirror_file.strpath)
+    return mirror_file
+
+@pytest.fixture(autouse=True)
+def agent_socket(monkeypatch, tmpdir):
+    agent_socket = tmpdir.join('agent.sock')
+    monkeypatch.setattr('slipstream.cli.conf.DEFAULT_AGENT_SOCKET',
+                        agent_socket.strpath)
+    return agent_socket
+
 @pytest.fixture(scope='function')
 def runner():
     return CliRunner()
@@ -115,3 +157,17 @@ def usage():
         models.Usage('exoscale-ch-gva', 1, 20),
         models.Usage('ec2-eu-west', 0, 20),
     ]
+
+
+# The number of runs of `server`, overridden by the tests needing others
+@pytest.fixture(scope='function')
+def server_runs():
+    return 3
+
+
+@pytest.fixture(scope='function')
+def server(server_runs):
+    server = FakeServer(runs=server_runs)
+    with serve(server) as endpoint:
+        server.endpoint = endpoint
+        yield server
@@ -0,0 +1,158 @@
+from __future__ import unicode_literals
+
+import os
+import socket
+import threading
+import time
+
+import pytest
+import six
+
+from slipstream.cli import agent
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'),
+                                reason="Unix sockets are not available")
+
+
+class Terminal(six.StringIO):
+
+    def isatty(self):
+        return True
+
+
+@pytest.fixture
+def running_agent(agent_socket):
+    running_agent = agent.Agent(agent_socket.strpath, idle_timeout=0)
+    thread = threading.Thread(target=running_agent.serve)
+    thread.daemon = True
+    thread.start()
+    deadline = time.time() + 5
+    while agent.status(agent_socket.strpath) is None:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    yield running_agent
+    agent.stop(agent_socket.strpath)
+    thread.join(5)
+
+
+def forward(*args, **kwargs):
+    stdout, stderr = Terminal(), Terminal()
+    status = agent.forward(args, stdin=kwargs.get('stdin', Terminal()),
+                           stdout=stdout, stderr=stderr)
+    return status, stdout.getvalue(), stderr.getvalue()
+
+
+@pytest.mark.usefixtures('running_agent')
+def test_forward(runner, cli, server, running_agent):
+    result = runner.invoke(cli, ['login', '-u', 'test', '-p', 'test',
+                                 '-e', server.endpoint])
+    assert result.exit_code == 0
+
+    status, out, err = forward('list', 'runs', '-f', 'csv')
+    assert status == 0
+    assert len(out.splitlines()) == 4
+    assert err == ''
+    api, = [entry[0] for entry in running_agent.apis.values()]
+
+    status, out, err = forward('list', 'virtualmachines', '-f', 'ndjson')
+    assert status == 0
+    assert len(out.splitlines()) == 3
+    # The same session is used by every command
+    assert [entry[0] for entry in running_agent.apis.values()] == [api]
+    assert running_agent.commands == 2
+
+    status, out, err = forward('list', 'nothing')
+    assert status == 2
+    assert 'No such command "nothing"' in err
+
+    status, out, err = forward('terminate', '7ab49a2e-9e73-4d0a-8f3e-'
+                               '8ed6fa6bb4a2')
+    assert status == 1
+    assert '404' in err
+
+    # Standard input is read on demand
+    stdin = six.StringIO(''.join('%s\n' % run['uuid']
+                                 for run in server.runs[:2]))
+    status, out, err = forward('terminate', '-', stdin=stdin)
+    assert status == 0
+    assert len(out.splitlines()) == 2
+    stdin = six.StringIO('rest\n')
+    assert forward('list', 'runs', '-f', 'csv', stdin=stdin)[0] == 0
+    assert stdin.read() == 'rest\n'
+
+    # Only command names are run locally
+    status, out, err = forward('list', 'modules', 'watch')
+    assert status == 1
+    assert "Module 'watch' doesn't exists." in err
+
+
+@pytest.mark.usefixtures('running_agent')
+def test_fallback(runner, cli, server, cookie_file):
+    # Logging in would prompt for credentials
+    assert not cookie_file.check()
+    assert forward('list', 'runs') == (None, '', '')
+    # Commands which are run locally
+    assert forward('login', '-u', 'test') == (None, '', '')
+    assert forward('agent', 'status') == (None, '', '')
+
+
+@pytest.mark.usefixtures('running_agent')
+def test_local_commands(runner, cli, server):
+    result = runner.invoke(cli, ['login', '-u', 'test', '-p', 'test',
+                                 '-e', server.endpoint])
+    assert result.exit_code == 0
+    run_id = server.runs[0]['uuid']
+    # Polling until runs are done would block the other commands
+    assert forward('watch', run_id) == (None, '', '')
+    assert forward('-q', 'run', 'image', '--until', 'ready',
+                   'examples/images/centos-6') == (None, '', '')
+    assert forward('run', 'deployment', '--wait', 'x') == (None, '', '')
+    assert len(server.runs) == 3
+
+
+def test_not_running(agent_socket):
+    assert agent.status() is None
+    assert agent.stop() is False
+    assert forward('list', 'runs') == (None, '', '')
+    # Left behind by an agent which was killed
+    agent_socket.write('')
+    assert forward('list', 'runs') == (None, '', '')
+
+
+def test_status_and_stop(agent_socket, running_agent):
+    status = agent.status()
+    assert status['pid'] == os.getpid()
+    assert status['socket'] == agent_socket.strpath
+    # Only the user can connect
+    assert os.stat(agent_socket.strpath).st_mode & 0o077 == 0
+
+    with pytest.raises(agent.AgentError):
+        agent.Agent(agent_socket.strpath).serve()
+
+    assert agent.stop() is True
+    deadline = time.time() + 5
+    while agent_socket.check():
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert agent.status() is None
+
+
+def test_agent_commands(runner, cli, agent_socket):
+    result = runner.invoke(cli, ['agent', 'status'])
+    assert result.exit_code == 1
+    assert 'The agent is not running.' in result.output
+
+    result = runner.invoke(cli, ['agent', 'start', '--idle-timeout', '60'])
+    assert result.exit_code == 0
+    try:
+        assert 'Agent started' in result.output
+        result = runner.invoke(cli, ['agent', 'start'])
+        assert 'Agent already running' in result.output
+        result = runner.invoke(cli, ['agent', 'status'])
+        assert result.exit_code == 0
+        assert 'Socket: %s' % agent_socket.strpath in result.output
+        assert 'Commands run: 0' in result.output
+    finally:
+        result = runner.invoke(cli, ['agent', 'stop'])
+    assert result.exit_code == 0
+    assert result.output == 'Agent stopped.\n'
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import uuid
+
+import pytest
+
+from slipstream.cli import models
+from slipstream.cli.testing import FakeServer, serve
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from slipstream.cli.aio import AsyncApi  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+
+@pytest.fixture
+def endpoint(server):
+    with serve(server) as endpoint:
+        yield endpoint
+
+
+def run(endpoint, func):
+    """Run the coroutine function FUNC with a logged in AsyncApi."""
+    async def main():
+        async with AsyncApi(endpoint) as api:
+            await api.login('test', 'test')
+            return await func(api)
+    return asyncio.run(main())
+
+
+async def collect(generator):
+    return [item async for item in generator]
+
+
+def test_list_modules(endpoint):
+    async def list_modules(api):
+        return (await collect(api.list_modules()),
+                await collect(api.list_modules(recurse=True, concurrency=4)))
+
+    top, tree = run(endpoint, list_modules)
+
+    assert [app.path for app in top] == ['examples']
+    assert [app.path for app in tree] == [
+        'examples',
+        'examples/images',
+        'examples/images/centos-6',
+        'examples/images/ubuntu-12.04',
+        'examples/tutorials',
+        'examples/tutorials/wordpress',
+        'examples/tutorials/wordpress/wordpress',
+    ]
+    assert tree[2] == models.App(name='centos-6', type='image', version=479,
+                                 path='examples/images/centos-6')
+
+
+def test_unauthorized(endpoint):
+    async def main():
+        async with AsyncApi(endpoint) as api:
+            await collect(api.list_runs())
+
+    with pytest.raises(aiohttp.ClientResponseError) as excinfo:
+        asyncio.run(main())
+    assert excinfo.value.status == 401
+
+
+def test_runs(endpoint, server):
+    async def lifecycle(api):
+        run_id = await api.run_deployment(
+            'examples/tutorials/wordpress/wordpress',
+            [('wp', ('multiplicity', '2'))])
+        image_id = await api.run_image('examples/images/centos-6')
+        runs = await collect(api.list_runs(page_size=1))
+        vms = await collect(api.list_virtualmachines(run_id=run_id))
+        await api.terminate(run_id)
+        usage = await collect(api.usage())
+        return run_id, image_id, runs, vms, usage
+
+    run_id, image_id, runs, vms, usage = run(endpoint, lifecycle)
+
+    assert [run.id for run in runs] == [image_id, run_id]
+    assert runs[1].module == 'examples/tutorials/wordpress/wordpress/478'
+    assert runs[1].cloud == 'exoscale-ch-gva'
+    assert [vm.run_id for vm in vms] == [run_id]
+    assert usage == [models.Usage('exoscale-ch-gva', 1, 20),
+                     models.Usage('ec2-eu-west', 0, 20)]
+    assert server.runs[0]['status'] == 'Cancelled'
+
+
+def test_many_concurrent_operations(endpoint, server):
+    count = 200
+
+    async def launch_and_terminate(api):
+        run_ids = await asyncio.gather(*[
+            api.run_image('examples/images/centos-6') for _ in range(count)])
+        results = await collect(api.terminate_many(run_ids + [uuid.uuid4()],
+                                                   concurrency=50))
+        return run_ids, results
+
+    run_ids, results = run(endpoint, launch_and_terminate)
+
+    assert len(set(run_ids)) == count
+    errors = [run_id for run_id, error in results if error is not None]
+    assert len(results) == count + 1
+    assert len(errors) == 1
+    assert all(run['status'] == 'Cancelled' for run in server.runs)
+
+
+def test_modules(endpoint, server):
+    async def manage(api):
+        module = await api.get_module('examples/images/centos-6')
+        await api.unpublish('examples/images/centos-6')
+        applications = await collect(api.list_applications())
+        await api.delete_module('examples/images')
+        return module, applications, await collect(api.list_modules(
+            'examples', recurse=True))
+
+    module, applications, modules = run(endpoint, manage)
+
+    assert module.version == 479
+    assert [app.name for app in applications] == ['ubuntu-12.04', 'wordpress']
+    assert [app.path for app in modules] == [
+        'examples/tutorials',
+        'examples/tutorials/wordpress',
+        'examples/tutorials/wordpress/wordpress',
+    ]
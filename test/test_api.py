@@ -4,6 +4,7 @@ import os
 import uuid
 
 import requests
+from six.moves.urllib.parse import parse_qs, urlparse
 
 import mock
 import pytest
@@ -25,11 +26,10 @@ def test_login(api, cookie_file):
     @responses.activate
     def run():
         responses.add(responses.POST, 'https://slipstream.sixsq.com/login',
-                      status=303)
-        with mock.patch.object(api.session, 'cookies'):
-            api.login(username, password)
-            assert api.session.cookies.__getitem__.calls_with('com.sixsq.slipstream.cookie')
-            assert api.session.cookies.save.called is True
+                      status=303, adding_headers={
+                          'Set-Cookie': 'com.sixsq.slipstream.cookie=abcd; Path=/'})
+        api.login(username, password)
+        assert 'com.sixsq.slipstream.cookie\tabcd' in cookie_file.read()
 
         responses.reset()
         responses.add(responses.POST, 'https://slipstream.sixsq.com/login',
@@ -108,6 +108,23 @@ def test_list_modules(api):
         assert modules[7].name == 'client'
         assert modules[8].name == 'system'
 
+    @responses.activate
+    def list_all_concurrently():
+        responses.add(responses.GET, 'https://slipstream.sixsq.com/module',
+                      body=load_fixture('module.xml'), status=200,
+                      content_type='application/xml')
+        responses.add(responses.GET, 'https://slipstream.sixsq.com/module/examples/56',
+                      body=load_fixture('examples.xml'), status=200,
+                      content_type='application/xml')
+        responses.add(responses.GET, 'https://slipstream.sixsq.com/module/examples/images/57',
+                      body=load_fixture('images.xml'), status=200,
+                      content_type='application/xml')
+        responses.add(responses.GET, 'https://slipstream.sixsq.com/module/examples/tutorials/58',
+                      status=403, content_type='application/xml')
+        modules = list(api.list_modules(recurse=True, concurrency=4))
+        assert [module.name for module in modules] == [
+            'examples', 'images', 'centos-6', 'ubuntu-12.04', 'tutorials']
+
     @responses.activate
     def list_path():
         responses.add(responses.GET, 'https://slipstream.sixsq.com/module/examples',
@@ -146,10 +163,104 @@ def test_list_modules(api):
 
     list_root()
     list_all()
+    list_all_concurrently()
     list_path()
     list_path_recursive()
 
 
+def test_list_modules_cookie_writes(api, cookie_file):
+    cookie = {'Set-Cookie': 'com.sixsq.slipstream.cookie=abcd; Path=/'}
+
+    @responses.activate
+    def run():
+        for url, fixture in [('module', 'module.xml'),
+                             ('module/examples/56', 'examples.xml'),
+                             ('module/examples/images/57', 'images.xml'),
+                             ('module/examples/tutorials/58', 'tutorials.xml'),
+                             ('module/examples/tutorials/service-testing/60',
+                              'service_testing.xml')]:
+            responses.add(responses.GET, 'https://slipstream.sixsq.com/' + url,
+                          body=load_fixture(fixture), status=200,
+                          content_type='application/xml', adding_headers=cookie)
+
+        with mock.patch.object(api.session, 'save',
+                               wraps=api.session.save) as save:
+            assert len(list(api.list_modules(recurse=True))) == 9
+        # Only the first response changes the cookie jar
+        assert len(responses.calls) == 5
+        assert save.call_count == 1
+        assert 'com.sixsq.slipstream.cookie\tabcd' in cookie_file.read()
+
+        with mock.patch.object(api.session, 'save') as save:
+            assert len(list(api.list_modules(recurse=True, concurrency=4))) == 9
+        assert save.call_count == 0
+
+    run()
+
+
+def test_xml_iter(api):
+    body = '<vms>%s</vms>' % ''.join(
+        '<vm instanceId="%d"><disk/></vm>' % i for i in range(1000))
+
+    @responses.activate
+    def stream():
+        responses.add(responses.GET, 'https://slipstream.sixsq.com/vms',
+                      body=body, status=200, content_type='application/xml')
+        elems = []
+        for elem in api.xml_iter('/vms', 'vm'):
+            assert elem.get('instanceId') == str(len(elems))
+            elems.append(elem)
+        assert len(elems) == 1000
+        # Consumed elements are cleared as the parser moves on
+        assert all(len(elem) == 0 and not elem.attrib for elem in elems)
+
+    @responses.activate
+    def error():
+        responses.add(responses.GET, 'https://slipstream.sixsq.com/vms',
+                      body='<error>Boom</error>', status=500,
+                      content_type='application/xml')
+        with pytest.raises(requests.HTTPError) as excinfo:
+            list(api.xml_iter('/vms', 'vm'))
+        assert excinfo.value.response.text == '<error>Boom</error>'
+
+    stream()
+    error()
+
+
+def test_cached_get(cookie_file, cache_dir, runs):
+    from slipstream.cli.api import Api
+    from slipstream.cli.cache import ResponseCache
+
+    api = Api(cookie_file=cookie_file.strpath, cache=ResponseCache())
+    url = 'https://slipstream.sixsq.com/run'
+
+    @responses.activate
+    def run():
+        responses.add(responses.GET, url, body=load_fixture('run.xml'),
+                      status=200, content_type='application/xml',
+                      adding_headers={'ETag': '"v1"'})
+        assert list(api.list_runs()) == runs
+
+        responses.reset()
+        responses.add(responses.GET, url, status=304)
+        assert list(api.list_runs()) == runs
+        assert responses.calls[0].request.headers['If-None-Match'] == '"v1"'
+
+        # Fresh responses are used without asking the server
+        api.cache.max_age = 60
+        responses.reset()
+        assert list(api.list_runs()) == runs
+        assert len(responses.calls) == 0
+
+        responses.add(responses.DELETE, url + '/%s' % runs[0].id, status=204)
+        api.terminate(runs[0].id)
+        responses.add(responses.GET, url, body='<runs/>', status=200,
+                      content_type='application/xml')
+        assert list(api.list_runs()) == []
+
+    run()
+
+
 def test_list_virtualmachines(api, vms):
     @responses.activate
     def run():
@@ -161,6 +272,76 @@ def test_list_virtualmachines(api, vms):
     run()
 
 
+def vms_pages(vms_count):
+    """Return a responses callback serving VMS_COUNT virtual machines by
+    pages, the way SlipStream does.
+    """
+    def callback(request):
+        query = parse_qs(urlparse(request.url).query)
+        offset = int(query['offset'][0])
+        limit = int(query['limit'][0])
+        ids = range(offset, min(offset + limit, vms_count))
+        body = '<vms offset="%d" limit="%d" count="%d" totalCount="%d">%s</vms>' % (
+            offset, limit, len(ids), vms_count, ''.join(
+                '<vm cloud="c%d" instanceId="%s" state="Running" runUuid="%s"/>'
+                % (i % 2, uuid.UUID(int=i), uuid.UUID(int=i)) for i in ids))
+        return (200, {}, body)
+    return callback
+
+
+def test_list_virtualmachines_paging(api):
+    url = 'https://slipstream.sixsq.com/vms'
+
+    @responses.activate
+    def paginated():
+        responses.add_callback(responses.GET, url, callback=vms_pages(250),
+                               content_type='application/xml')
+        vms = list(api.list_virtualmachines(page_size=100))
+        assert len(vms) == 250
+        assert vms[-1].id == uuid.UUID(int=249)
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def lazy():
+        responses.add_callback(responses.GET, url, callback=vms_pages(250),
+                               content_type='application/xml')
+        vms = api.list_virtualmachines(offset=20, limit=30, page_size=25)
+        assert next(vms).id == uuid.UUID(int=20)
+        assert len(responses.calls) == 1
+        assert 'limit=25' in responses.calls[0].request.url
+        assert 'offset=20' in responses.calls[0].request.url
+        assert len(list(vms)) == 29
+        assert 'limit=5' in responses.calls[1].request.url
+        assert 'offset=45' in responses.calls[1].request.url
+
+    @responses.activate
+    def filtered():
+        run_id = uuid.UUID('fa204c53-2d74-4fee-a76e-014e21ca3bd0')
+        responses.add(responses.GET, url, body=load_fixture('vms.xml'),
+                      status=200, content_type='application/xml')
+        vms = list(api.list_virtualmachines(run_id=run_id, cloud='exoscale-ch-gva',
+                                            status='Running'))
+        assert [vm.run_id for vm in vms] == [run_id]
+        query = parse_qs(urlparse(responses.calls[0].request.url).query)
+        assert query['runUuid'] == [str(run_id)]
+        assert query['cloud'] == ['exoscale-ch-gva']
+        assert query['status'] == ['Running']
+
+    @responses.activate
+    def ignored():
+        # The fixture is a full listing without any paging attributes
+        responses.add(responses.GET, url, body=load_fixture('vms.xml'),
+                      status=200, content_type='application/xml')
+        vms = list(api.list_virtualmachines(offset=1, page_size=1))
+        assert [vm.cloud for vm in vms] == ['ec2-eu-west-1']
+        assert len(responses.calls) == 1
+
+    paginated()
+    lazy()
+    filtered()
+    ignored()
+
+
 def test_list_runs(api, runs):
     @responses.activate
     def run():
@@ -172,6 +353,40 @@ def test_list_runs(api, runs):
     run()
 
 
+def test_list_runs_paging(api):
+    url = 'https://slipstream.sixsq.com/run'
+
+    def callback(request):
+        query = parse_qs(urlparse(request.url).query)
+        offset = int(query['offset'][0])
+        limit = int(query['limit'][0])
+        ids = range(offset, min(offset + limit, 1000))
+        body = '<runs offset="%d" limit="%d" count="%d" totalCount="1000">%s</runs>' % (
+            offset, limit, len(ids), ''.join(
+                '<item uuid="%s" moduleResourceUri="module/examples/foo/1" '
+                'status="Done" startTime="" cloudServiceName="c"/>'
+                % uuid.UUID(int=i) for i in ids))
+        return (200, {}, body)
+
+    @responses.activate
+    def run():
+        responses.add_callback(responses.GET, url, callback=callback,
+                               content_type='application/xml')
+        runs = api.list_runs(page_size=10)
+        first = [next(runs) for _ in range(15)]
+        assert first[-1].id == uuid.UUID(int=14)
+        assert len(responses.calls) == 2
+        runs.close()
+
+        responses.calls.reset()
+        runs = list(api.list_runs(offset=990, limit=20, page_size=50))
+        assert len(runs) == 10
+        assert len(responses.calls) == 1
+        assert 'limit=20' in responses.calls[0].request.url
+
+    run()
+
+
 def test_build_image(api):
     @responses.activate
     def default():
@@ -290,6 +505,25 @@ def test_terminate(api):
     raises_error()
 
 
+def test_terminate_many(api):
+    run_ids = [uuid.UUID(int=i) for i in range(20)]
+
+    @responses.activate
+    def run():
+        for i, run_id in enumerate(run_ids):
+            responses.add(responses.DELETE,
+                          'https://slipstream.sixsq.com/run/%s' % run_id,
+                          status=409 if i % 5 == 0 else 204)
+        results = dict(api.terminate_many(iter(run_ids), concurrency=4))
+        assert sorted(results) == run_ids
+        failed = [run_id for run_id, error in results.items() if error]
+        assert sorted(failed) == run_ids[::5]
+        assert all(isinstance(results[run_id], requests.HTTPError)
+                   for run_id in failed)
+
+    run()
+
+
 def test_usage(api, usage):
     @responses.activate
     def run():
@@ -369,3 +603,208 @@ def test_delete_module(api):
         assert api.delete_module('examples/images/centos-6') is True
 
     run()
+
+
+def test_fake_server(cookie_file):
+    from slipstream.cli.api import Api
+    from slipstream.cli.testing import FakeServer, serve
+
+    server = FakeServer()
+    with serve(server) as endpoint:
+        api = Api(endpoint, cookie_file.strpath)
+        with pytest.raises(requests.HTTPError):
+            list(api.list_runs())
+        api.login('test', 'test')
+
+        run_id = api.run_image('examples/images/centos-6', 'ec2-eu-west')
+        server.set_status(run_id, 'Ready')
+        assert [(run.id, run.status, run.cloud) for run in api.list_runs()] \
+            == [(run_id, 'ready', 'ec2-eu-west')]
+        assert [vm.run_id for vm in api.list_virtualmachines(
+            cloud='ec2-eu-west')] == [run_id]
+        assert api.terminate(run_id) is True
+        assert [vm.status for vm in api.list_virtualmachines()] == \
+            ['terminated']
+        assert [app.path for app in api.list_modules('examples')] == \
+            ['examples/images', 'examples/tutorials']
+
+
+def test_synthetic_modules():
+    from slipstream.cli.testing import synthetic_modules
+
+    modules = synthetic_modules(10, depth=2, fanout=2)
+    projects = [path for path, category, _ in modules if category == 'Project']
+    assert projects == ['project-0', 'project-1', 'project-0/project-0',
+                        'project-0/project-1', 'project-1/project-0',
+                        'project-1/project-1']
+    apps = [(path, category) for path, category, _ in modules
+            if category != 'Project']
+    assert len(apps) == 10
+    assert apps[:2] == [('project-0/project-0/module-0', 'Image'),
+                        ('project-0/project-1/module-1', 'Deployment')]
+    assert len(set(version for _, _, version in modules)) == len(modules)
+    assert synthetic_modules(1, depth=0) == [('module-0', 'Image', 1)]
+
+
+def test_fake_server_catalog(cookie_file):
+    from slipstream.cli.api import Api
+    from slipstream.cli.testing import FakeServer, serve, synthetic_modules
+
+    server = FakeServer(synthetic_modules(20, depth=2, fanout=3), runs=25,
+                        vms_per_run=2)
+    with serve(server) as endpoint:
+        api = Api(endpoint, cookie_file.strpath)
+        api.login('test', 'test')
+
+        modules = list(api.list_modules(recurse=True, concurrency=4))
+        assert len(modules) == 3 + 9 + 20
+
+        runs = list(api.list_runs(page_size=10))
+        assert len(runs) == 25
+        # Newest first
+        assert [str(run.id) for run in runs] == \
+            [run['uuid'] for run in reversed(server.runs)]
+        assert [run.id for run in api.list_runs(offset=20, page_size=3)] == \
+            [run.id for run in runs[20:]]
+        assert runs[-1].status == 'initializing'
+
+        assert len(list(api.list_virtualmachines(page_size=7))) == 50
+        assert [vm.run_id for vm in api.list_virtualmachines(
+            run_id=runs[0].id)] == [runs[0].id] * 2
+        assert set(vm.status for vm in api.list_virtualmachines(
+            status='terminated')) == set(['terminated'])
+
+
+def test_fake_server_latency(cookie_file):
+    from slipstream.cli.api import Api
+    from slipstream.cli.testing import FakeServer, serve
+
+    server = FakeServer(latency=0.25)
+    with serve(server) as endpoint:
+        api = Api(endpoint, cookie_file.strpath)
+        with mock.patch('slipstream.cli.testing.time.sleep') as sleep:
+            api.login('test', 'test')
+            list(api.list_modules(recurse=True))
+        assert sleep.call_count == server.requests
+        sleep.assert_called_with(0.25)
+
+
+def test_request_stats(cookie_file):
+    from slipstream.cli.api import Api
+    from slipstream.cli.stats import RequestStats
+    from slipstream.cli.testing import FakeServer, serve
+
+    stats = RequestStats()
+    server = FakeServer(runs=5)
+    with serve(server) as endpoint:
+        api = Api(endpoint, cookie_file.strpath, stats=stats)
+        api.login('test', 'test')
+        assert len(list(api.list_runs(page_size=2))) == 5
+        list(api.list_modules('examples'))
+
+    summary = dict((row.endpoint, row) for row in stats.summary())
+    assert sorted(summary) == ['GET /module/{path}', 'GET /run',
+                               'POST /login']
+    runs = summary['GET /run']
+    assert (runs.requests, runs.errors) == (3, 0)
+    assert runs.received > 0
+    assert runs.ttfb_ms is not None
+    assert runs.parse_ms is not None
+    assert summary['POST /login'].sent > 0
+
+
+def test_session_expiry(cookie_file):
+    from slipstream.cli.api import Api, SessionExpired
+    from slipstream.cli.testing import FakeServer, serve
+
+    server = FakeServer()
+    with serve(server) as endpoint:
+        api = Api(endpoint, cookie_file.strpath)
+        assert api.session.expiry(endpoint) is None
+        api.login('test', 'test')
+        assert abs(api.session.expiry(endpoint) - server.expires_at) < 0.001
+        list(api.list_runs())
+
+        later = server.expires_at - 30
+        requests_sent = server.requests
+        with mock.patch('slipstream.cli.api.time.time', return_value=later):
+            # Failing before sending anything
+            with pytest.raises(SessionExpired):
+                list(api.list_runs())
+            assert server.requests == requests_sent
+
+            api.remember_credentials('test', 'test')
+            list(api.list_runs())
+            list(api.list_virtualmachines())
+        assert server.logins == 2
+        assert abs(api.session.expiry(endpoint) - server.expires_at) < 0.001
+
+        # Reloaded from the cookie file
+        api = Api(endpoint, cookie_file.strpath)
+        assert abs(api.session.expiry(endpoint) - server.expires_at) < 0.001
+        # Within the margin, which doesn't apply to logging out
+        with mock.patch('slipstream.cli.api.time.time',
+                        return_value=server.expires_at - 1):
+            api.logout()
+
+
+@pytest.mark.usefixtures('authenticated')
+def test_expired_session_fails_fast():
+    from slipstream.cli.api import Api, SessionExpired
+
+    api = Api()
+    assert api.session.expiry('https://slipstream.sixsq.com/run') == \
+        1403235417.973
+    with pytest.raises(SessionExpired):
+        list(api.list_runs())
+
+
+def test_where_pushdown(cookie_file):
+    from slipstream.cli.api import Api
+    from slipstream.cli.testing import FakeServer, serve, synthetic_modules
+    from slipstream.cli.where import Where
+
+    server = FakeServer(synthetic_modules(20, depth=2, fanout=3), runs=10,
+                        vms_per_run=2)
+    for i, run in enumerate(server.runs):
+        run['startTime'] = '2014-06-%02d 12:00:00.000 UTC' % (i + 1)
+    with serve(server) as endpoint:
+        api = Api(endpoint, cookie_file.strpath)
+        api.login('test', 'test')
+
+        # Projects which can't hold matching modules aren't fetched
+        requests = server.requests
+        modules = list(api.list_modules(recurse=True))
+        crawled = server.requests - requests
+        where = Where("path glob 'project-1/*' and type != project",
+                      models.App._fields)
+        for concurrency in (1, 4):
+            requests = server.requests
+            assert list(api.list_modules(recurse=True, concurrency=concurrency,
+                                         where=where)) == \
+                [module for module in modules if where.match(module)]
+            assert server.requests - requests < crawled / 2
+
+        # Runs are listed newest first, down to the earliest start time
+        where = Where("started_at >= 2014-06-08 and status != done",
+                      models.Run._fields)
+        requests = server.requests
+        runs = list(api.list_runs(page_size=1, where=where))
+        assert [run.started_at[:10] for run in runs] == \
+            ['2014-06-10', '2014-06-09', '2014-06-08']
+        assert server.requests - requests == 4
+        assert [run.id for run in api.list_runs(offset=1, limit=1,
+                                                where=where)] == [runs[1].id]
+
+        # Equalities are sent to the server, the rest checked by the client
+        run_id = runs[0].id
+        where = Where("run_id = %s and cloud = %s" % (run_id, runs[0].cloud),
+                      models.VirtualMachine._fields)
+        assert where.covered_by(('run_id', 'cloud', 'status'))
+        vms = list(api.list_virtualmachines(where=where))
+        assert [vm.run_id for vm in vms] == [run_id] * 2
+        assert list(api.list_virtualmachines(limit=1, where=where)) == vms[:1]
+        where = Where("run_id = %s and id ~ '^%s'" % (run_id, vms[1].id),
+                      models.VirtualMachine._fields)
+        assert list(api.list_virtualmachines(where=where)) == vms[1:]
+        assert list(api.list_virtualmachines(offset=1, where=where)) == []
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import pytest
+
+from slipstream.cli import batch
+
+
+def test_yaml(tmpdir):
+    pytest.importorskip('yaml')
+    manifest = tmpdir.join('manifest.yaml')
+    manifest.write("""
+- path: clara/wordpress
+  params:
+    wp: {cloud: cloud1, multiplicity: 2}
+- id: lamp
+  path: clara/lamp
+  params: ['apache:cloud=cloud2']
+- path: clara/empty
+""")
+
+    assert batch.read_manifest(str(manifest)) == [
+        ('1', 'clara/wordpress', (('wp', ('cloud', 'cloud1')),
+                                  ('wp', ('multiplicity', '2')))),
+        ('lamp', 'clara/lamp', (('apache', ('cloud', 'cloud2')),)),
+        ('3', 'clara/empty', ()),
+    ]
+
+
+def test_csv(tmpdir):
+    manifest = tmpdir.join('manifest.csv')
+    manifest.write("path,wp:cloud\nclara/wordpress,cloud1\nclara/lamp,\n")
+
+    assert batch.read_manifest(str(manifest)) == [
+        ('1', 'clara/wordpress', (('wp', ('cloud', 'cloud1')),)),
+        ('2', 'clara/lamp', ()),
+    ]
+
+
+@pytest.mark.parametrize('filename, content', [
+    ('manifest.txt', ''),
+    ('manifest.csv', 'id,module\n1,clara/wordpress\n'),
+    ('manifest.csv', 'path,wp\nclara/wordpress,cloud1\n'),
+])
+def test_invalid(tmpdir, filename, content):
+    manifest = tmpdir.join(filename)
+    manifest.write(content)
+    with pytest.raises(batch.ManifestError):
+        batch.read_manifest(str(manifest))
+
+
+def test_results(tmpdir):
+    results = tmpdir.join('runs')
+    assert batch.read_results(str(results)) == set()
+    with results.open('a') as fp:
+        batch.write_result(fp, 'a', 'clara/wordpress', 'uuid1')
+        batch.write_result(fp, 'b', 'clara/lamp', 'uuid2')
+    assert batch.read_results(str(results)) == {'a', 'b'}
@@ -0,0 +1,130 @@
+from __future__ import unicode_literals
+
+import os
+import time
+
+import requests
+
+import mock
+import pytest
+
+from slipstream.cli.cache import ResponseCache
+
+
+def make_response(**headers):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers.update(headers)
+    return response
+
+
+def store(cache, url, body, **headers):
+    writer = cache.writer(url, 'application/xml', make_response(**headers))
+    if writer is None:
+        return
+    writer.write(body)
+    writer.commit()
+
+
+@pytest.fixture(scope='function')
+def cache(cache_dir):
+    return ResponseCache()
+
+
+class TestResponseCache(object):
+
+    url = 'https://slipstream.sixsq.com/module'
+
+    def test_empty(self, cache):
+        assert cache.lookup(self.url, 'application/xml') is None
+
+    def test_store(self, cache):
+        store(cache, self.url, b'<list/>', ETag='"v1"')
+        entry = cache.lookup(self.url, 'application/xml')
+        assert entry.open().read() == b'<list/>'
+        assert entry.validators() == {'If-None-Match': '"v1"'}
+        assert cache.lookup(self.url, 'application/json') is None
+
+    def test_uncommitted(self, cache, cache_dir):
+        writer = cache.writer(self.url, 'application/xml',
+                              make_response(ETag='"v1"'))
+        writer.write(b'<li')
+        writer.close()
+        assert cache.lookup(self.url, 'application/xml') is None
+        assert os.listdir(cache_dir.strpath) == []
+
+    def test_not_cacheable(self, cache):
+        url = 'https://slipstream.sixsq.com/run'
+        store(cache, url, b'<runs/>')
+        assert cache.lookup(url, 'application/xml') is None
+
+    def test_ttl(self, cache):
+        assert cache.ttl(self.url) == 300
+        assert cache.ttl(self.url + '/examples/56') == 300
+        assert cache.ttl('https://slipstream.sixsq.com/run') == 0
+        assert cache.ttl('https://slipstream.sixsq.com/') == 0
+        assert ResponseCache(max_age=5).ttl(self.url) == 5
+
+    def test_fresh(self, cache):
+        store(cache, self.url, b'<list/>', ETag='"v1"')
+        entry = cache.lookup(self.url, 'application/xml')
+        assert entry.fresh is True
+        entry.meta['validated_at'] = time.time() - 301
+        assert entry.fresh is False
+
+        cache.revalidated(entry, make_response())
+        assert cache.lookup(self.url, 'application/xml').fresh is True
+
+    def test_eviction(self, cache):
+        for i in range(3):
+            store(cache, '%s/%d' % (self.url, i), b'0123456789', ETag='"v1"')
+            # Make sure modification times differ between entries
+            meta_file = cache._meta_file(
+                cache.key('%s/%d' % (self.url, i), 'application/xml'))
+            os.utime(meta_file, (i, i))
+        cache.lookup('%s/0' % self.url, 'application/xml')
+        cache.max_size = 20
+        cache.evict()
+
+        assert cache.lookup('%s/0' % self.url, 'application/xml') is not None
+        assert cache.lookup('%s/1' % self.url, 'application/xml') is None
+        assert cache.lookup('%s/2' % self.url, 'application/xml') is not None
+
+    def test_running_size(self, cache):
+        cache.max_size = 25
+        with mock.patch.object(cache, 'evict', wraps=cache.evict) as evict:
+            store(cache, '%s/0' % self.url, b'0123456789', ETag='"v1"')
+            # Replaced entries only count once
+            store(cache, '%s/0' % self.url, b'0123456789', ETag='"v2"')
+            store(cache, '%s/1' % self.url, b'0123456789', ETag='"v1"')
+            assert evict.call_count == 0
+            assert cache._size == 20
+            store(cache, '%s/2' % self.url, b'0123456789', ETag='"v1"')
+            assert evict.call_count == 1
+        assert cache._size == 20
+        # Other processes writing to the cache are counted on the first
+        # commit
+        assert ResponseCache(max_size=25)._scan()[1] == 20
+
+    def test_username(self, cache):
+        store(cache, self.url, b'<list/>', ETag='"v1"')
+        assert ResponseCache(username='alice').lookup(
+            self.url, 'application/xml') is None
+        store(ResponseCache(username='alice'), self.url, b'<list/>',
+              ETag='"v2"')
+        assert ResponseCache(username='alice').lookup(
+            self.url, 'application/xml').meta['etag'] == '"v2"'
+        assert cache.lookup(self.url, 'application/xml').meta['etag'] == \
+            '"v1"'
+
+    def test_invalidate(self, cache):
+        store(cache, self.url, b'<list/>', ETag='"v1"')
+        store(cache, 'https://slipstream.sixsq.com/vms', b'<vms/>', ETag='"v1"')
+        cache.invalidate('https://slipstream.sixsq.com/module')
+        assert cache.lookup(self.url, 'application/xml') is None
+        assert cache.lookup('https://slipstream.sixsq.com/vms',
+                            'application/xml') is not None
+
+        cache.clear()
+        assert cache.lookup('https://slipstream.sixsq.com/vms',
+                            'application/xml') is None
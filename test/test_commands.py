@@ -2,6 +2,7 @@
 from __future__ import unicode_literals
 
 import configparser
+import json
 import sys
 import uuid
 
@@ -10,6 +11,7 @@ import pytest
 import requests
 
 from slipstream.cli import models
+from slipstream.cli.cache import ResponseCache
 
 
 class UnauthorizedError(requests.HTTPError):
@@ -113,6 +115,20 @@ class TestLogin(object):
         parser.read(config_file.strpath)
         assert parser.get('slipstream', 'username') == 'clara'
 
+    def test_prompt_command_argument(self, runner, cli, config_file):
+        # Arguments named like commands run without credentials don't
+        # matter
+        with mock.patch('slipstream.cli.api.Api.login'), \
+                mock.patch('slipstream.cli.api.Api.terminate',
+                           return_value=True):
+            result = runner.invoke(cli, ['terminate', 'query'],
+                                   input="alice\nh4x0r\n")
+
+        assert result.output.startswith("Enter your SlipStream credentials.\n")
+        parser = configparser.RawConfigParser()
+        parser.read(config_file.strpath)
+        assert parser.get('slipstream', 'username') == 'alice'
+
     def test_with_credentials_other_command(self, runner, cli, config_file):
         with mock.patch('slipstream.cli.api.Api.login'):
             result = runner.invoke(cli, ['-u', 'alice', '-p', 'h4x0r', 'list'])
@@ -124,6 +140,20 @@ class TestLogin(object):
         parser.read(config_file.strpath)
         assert parser.get('slipstream', 'username') == 'alice'
 
+    def test_clears_cache(self, runner, cli, cache_dir):
+        cache = ResponseCache()
+        writer = cache.writer('https://nuv.la/module', 'application/xml',
+                              mock.Mock(headers={'ETag': '"v1"'}))
+        writer.write(b'<list/>')
+        writer.commit()
+        with mock.patch('slipstream.cli.api.Api.login'):
+            result = runner.invoke(cli, ['login', '-u', 'alice', '-p',
+                                         'h4x0r'])
+
+        assert result.exit_code == 0
+        assert cache.lookup('https://nuv.la/module',
+                            'application/xml') is None
+
     def test_with_credentials(self, runner, cli, config_file):
         with mock.patch('slipstream.cli.api.Api.login'):
             result = runner.invoke(cli, ['login'], input=("alice\nh4x0r\n"))
@@ -196,6 +226,47 @@ class TestLogout(object):
                 "# This is a generated file!  Do not edit.\n\n")
 
 
+@pytest.mark.usefixtures('authenticated')
+def test_invalid_transport_setting(runner, cli, config_file):
+    config_file.write("retries = lots\n", mode='a')
+    result = runner.invoke(cli, ['list', 'runs'])
+    assert result.exit_code == 1
+    assert "Invalid value for setting 'retries': lots" in result.output
+
+
+def test_stats(runner, cli, tmpdir, server):
+    stats_file = tmpdir.join('slipstream.prom')
+    result = runner.invoke(cli, ['-e', server.endpoint, '-u', 'test', '-p',
+                                 'test', '--no-cache', '--stats',
+                                 '--stats-file', stats_file.strpath, 'list',
+                                 'runs'])
+    assert result.exit_code == 0
+    assert 'GET /run' in result.output
+    assert 'slipstream_http_requests_total{method="GET",endpoint="/run",' \
+        'status="200"} 1' in stats_file.read().splitlines()
+
+
+def test_log_file(runner, cli, tmpdir, server):
+    from slipstream.cli.log import logger
+
+    log_file = tmpdir.join('slipstream.log')
+    result = runner.invoke(cli, ['-e', server.endpoint, '-u', 'test', '-p',
+                                 'test', '--no-cache', '--log-file',
+                                 log_file.strpath, 'list', 'runs',
+                                 '-f', 'ndjson'])
+    assert result.exit_code == 0
+    assert logger.sink is None
+    # Debug messages only go to the log file
+    assert len(result.output.splitlines()) == 3
+    records = [json.loads(line) for line in log_file.readlines()]
+    assert set(record['command'] for record in records) == set(['list runs'])
+    assert len(set(record['command_id'] for record in records)) == 1
+    requests = [record for record in records if 'request_id' in record]
+    assert [record['message'].split(' ')[0] for record in requests] == \
+        ['POST', 'GET']
+    assert requests[1]['message'].endswith('200')
+
+
 @pytest.mark.usefixtures('authenticated')
 class TestListApplications(object):
 
@@ -238,22 +309,120 @@ class TestListModules(object):
         assert result.output == "No modules found matching your criteria.\n"
 
     def test_with_filter(self, runner, cli, apps):
+        def list_modules(path, recurse, concurrency, where=None):
+            return (app for app in apps if where is None or where.match(app))
+
         with mock.patch('slipstream.cli.api.Api.list_modules',
-                        return_value=iter(apps)):
+                        side_effect=list_modules) as patcher:
             result = runner.invoke(cli, ['list', 'modules', '-k', 'image'])
+            assert patcher.call_args[1]['where'].text == 'type = image'
 
         assert result.exit_code == 0
         assert 'wordpress' not in result.output
         assert 'ubuntu-12.04' in result.output
 
         with mock.patch('slipstream.cli.api.Api.list_modules',
-                        return_value=iter(apps)):
+                        side_effect=list_modules):
             result = runner.invoke(cli, ['list', 'modules', '--type=deployment'])
 
         assert result.exit_code == 0
         assert 'wordpress' in result.output
         assert 'ubuntu-12.04' not in result.output
 
+        # Along with --where
+        with mock.patch('slipstream.cli.api.Api.list_modules',
+                        side_effect=list_modules) as patcher:
+            result = runner.invoke(cli, ['list', 'modules', '-k', 'image',
+                                         '-w', 'version < 480'])
+            assert patcher.call_args[1]['where'].text == \
+                '(version < 480) and (type = image)'
+
+        assert result.exit_code == 0
+        assert result.output == "No modules found matching your criteria.\n"
+
+    def test_with_concurrency(self, runner, cli, apps):
+        with mock.patch('slipstream.cli.api.Api.list_modules',
+                        return_value=iter(apps)) as patcher:
+            result = runner.invoke(cli, ['list', 'modules', '-r', '-j', '4'])
+            patcher.assert_called_with(None, True, 4, where=None)
+
+        assert result.exit_code == 0
+        assert 'wordpress' in result.output
+
+
+@pytest.mark.usefixtures('authenticated')
+class TestModuleIndex(object):
+
+    tree = {
+        None: [models.App('examples', 'project', 56, 'examples')],
+        'examples': [
+            models.App('ubuntu-12.04', 'image', 480, 'examples/ubuntu-12.04'),
+            models.App('wordpress', 'deployment', 478, 'examples/wordpress'),
+        ],
+    }
+
+    def list_modules(self, path=None, recurse=False, concurrency=1):
+        return iter(self.tree[path])
+
+    def test_refresh(self, runner, cli, index_file):
+        with mock.patch('slipstream.cli.api.Api.list_modules',
+                        side_effect=self.list_modules):
+            result = runner.invoke(cli, ['list', 'modules', '--refresh',
+                                         '-r', '-k', 'image'])
+
+        assert result.exit_code == 0
+        assert 'ubuntu-12.04' in result.output
+        assert 'wordpress' not in result.output
+        assert index_file.check()
+
+        with mock.patch('slipstream.cli.api.Api.list_modules') as patcher:
+            result = runner.invoke(cli, ['list', 'modules', '-r'])
+            assert patcher.called is False
+
+        assert result.exit_code == 0
+        assert 'ubuntu-12.04' in result.output
+        assert 'wordpress' in result.output
+
+        # Other listings are fetched, without refreshing a stale index
+        with mock.patch('slipstream.cli.index.ModuleIndex.stale', True), \
+                mock.patch('slipstream.cli.api.Api.list_modules',
+                           return_value=iter([])) as patcher:
+            runner.invoke(cli, ['list', 'modules', 'examples'])
+            patcher.assert_called_once_with('examples', False, 1, where=None)
+
+        with mock.patch('slipstream.cli.api.Api.list_modules',
+                        side_effect=self.list_modules):
+            result = runner.invoke(cli, ['list', 'modules', '--refresh',
+                                         'examples/foo'])
+
+        assert result.exit_code == 1
+        assert "Module 'examples/foo' doesn't exists." in result.output
+
+    def test_other_user(self, runner, cli, index_file, config_file):
+        with mock.patch('slipstream.cli.api.Api.list_modules',
+                        side_effect=self.list_modules):
+            runner.invoke(cli, ['list', 'modules', '--refresh'])
+        config_file.write("[slipstream]\nusername = alice\n")
+        with mock.patch('slipstream.cli.api.Api.list_modules',
+                        return_value=iter([])) as patcher:
+            result = runner.invoke(cli, ['list', 'modules', '-r'])
+            assert patcher.called is True
+
+        assert 'wordpress' not in result.output
+
+    def test_publish(self, runner, cli):
+        with mock.patch('slipstream.cli.api.Api.list_modules',
+                        side_effect=self.list_modules):
+            runner.invoke(cli, ['list', 'modules', '--refresh'])
+
+        with mock.patch('slipstream.cli.api.Api.publish') as publish:
+            with mock.patch('slipstream.cli.api.Api.get_module') as get_module:
+                result = runner.invoke(cli, ['publish', 'examples/wordpress'])
+                assert get_module.called is False
+            publish.assert_called_with('examples/wordpress/478')
+
+        assert result.exit_code == 0
+
 
 @pytest.mark.usefixtures('authenticated')
 class TestListRuns(object):
@@ -276,6 +445,86 @@ class TestListRuns(object):
         assert result.exit_code == 0
         assert result.output == "No runs found.\n"
 
+    def test_ndjson(self, runner, cli, runs):
+        with mock.patch('slipstream.cli.api.Api.list_runs',
+                        return_value=iter(runs)):
+            result = runner.invoke(cli, ['list', 'runs', '--format', 'ndjson'])
+
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert len(lines) == 3
+        assert json.loads(lines[0]) == {
+            'id': '3fd93072-fcef-4c03-bdec-0cb2b19699e2',
+            'module': 'examples/tutorials/wordpress/wordpress/478',
+            'status': 'running',
+            'started_at': '2014-06-13 12:09:47.202 UTC',
+            'cloud': 'exoscale-ch-gva'}
+
+    def test_csv(self, runner, cli, runs):
+        with mock.patch('slipstream.cli.api.Api.list_runs',
+                        return_value=iter(runs)):
+            result = runner.invoke(cli, ['list', 'runs', '-f', 'csv'])
+
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert lines[0] == 'id,module,status,started_at,cloud'
+        assert lines[3] == ('85127a28-455a-44a4-bba3-ca56bfe6858e,'
+                            'examples/images/centos-6/479,aborted,'
+                            '2014-06-12 08:48:23.677 UTC,exoscale-ch-gva')
+
+    def test_tsv_streaming(self, runner, cli, runs):
+        written = []
+
+        def list_runs(*args, **kwargs):
+            for i, run in enumerate(runs):
+                # Rows are written as soon as they are received
+                assert len(written) == (i + 1 if i else 0)
+                yield run
+
+        with mock.patch('slipstream.cli.api.Api.list_runs',
+                        side_effect=list_runs):
+            with mock.patch('slipstream.cli.formats.click.echo',
+                            side_effect=lambda line, nl: written.append(line)):
+                result = runner.invoke(cli, ['list', 'runs', '-f', 'tsv'])
+
+        assert result.exit_code == 0
+        assert len(written) == 4
+        assert written[1].split('\t')[0] == '3fd93072-fcef-4c03-bdec-0cb2b19699e2'
+
+    def test_empty_ndjson(self, runner, cli):
+        with mock.patch('slipstream.cli.api.Api.list_runs',
+                        return_value=iter([])):
+            result = runner.invoke(cli, ['list', 'runs', '-f', 'ndjson'])
+
+        assert result.exit_code == 0
+        assert result.output == "No runs found.\n"
+
+    def test_paging(self, runner, cli, runs):
+        with mock.patch('slipstream.cli.api.Api.list_runs',
+                        return_value=iter(runs)) as patcher:
+            result = runner.invoke(cli, ['list', 'runs', '--limit', '3',
+                                         '--offset', '1', '--page-size', '50'])
+            patcher.assert_called_with(offset=1, limit=3, page_size=50,
+                                       where=None)
+
+        assert result.exit_code == 0
+
+    def test_where(self, runner, cli, runs):
+        with mock.patch('slipstream.cli.api.Api.list_runs',
+                        return_value=iter(runs[:1])) as patcher:
+            result = runner.invoke(cli, ['list', 'runs', '--where',
+                                         'status = running'])
+            where = patcher.call_args[1]['where']
+
+        assert result.exit_code == 0
+        assert where.text == 'status = running'
+        assert [where.match(run) for run in runs] == [True, True, False]
+
+        result = runner.invoke(cli, ['list', 'runs', '-w', 'size > 1'])
+        assert result.exit_code == 2
+        assert 'invalid expression: Unknown field at position 0: size' \
+            in result.output
+
 
 @pytest.mark.usefixtures('authenticated')
 class TestListVirtualMachines(object):
@@ -291,9 +540,13 @@ class TestListVirtualMachines(object):
 
     def test_filter_by_run(self, runner, cli, vms):
         with mock.patch('slipstream.cli.api.Api.list_virtualmachines',
-                        return_value=iter(vms)):
+                        return_value=iter(vms[:1])) as patcher:
             result = runner.invoke(cli, ['list', 'virtualmachines', '--run',
                                          'fa204c53-2d74-4fee-a76e-014e21ca3bd0'])
+            patcher.assert_called_with(
+                run_id=uuid.UUID('fa204c53-2d74-4fee-a76e-014e21ca3bd0'),
+                cloud=None, status=None, offset=0, limit=None,
+                columnar=False, where=None)
 
         assert result.exit_code == 0
         assert 'a087572b-e368-421a-8a25-ed67fcdfe202' in result.output
@@ -301,9 +554,12 @@ class TestListVirtualMachines(object):
 
     def test_filter_by_cloud(self, runner, cli, vms):
         with mock.patch('slipstream.cli.api.Api.list_virtualmachines',
-                        return_value=iter(vms)):
+                        return_value=iter(vms[1:])) as patcher:
             result = runner.invoke(cli, ['list', 'virtualmachines',
                                          '--cloud', 'ec2-eu-west-1'])
+            patcher.assert_called_with(run_id=None, cloud='ec2-eu-west-1',
+                                       status=None, offset=0, limit=None,
+                                       columnar=False, where=None)
 
         assert result.exit_code == 0
         assert 'a087572b-e368-421a-8a25-ed67fcdfe202' not in result.output
@@ -311,9 +567,12 @@ class TestListVirtualMachines(object):
 
     def test_filter_by_status(self, runner, cli, vms):
         with mock.patch('slipstream.cli.api.Api.list_virtualmachines',
-                        return_value=iter(vms)):
+                        return_value=iter(vms[:1])) as patcher:
             result = runner.invoke(cli, ['list', 'virtualmachines',
                                          '--status', 'running'])
+            patcher.assert_called_with(run_id=None, cloud=None,
+                                       status='running', offset=0, limit=None,
+                                       columnar=False, where=None)
 
         assert result.exit_code == 0
         assert 'a087572b-e368-421a-8a25-ed67fcdfe202' in result.output
@@ -321,15 +580,29 @@ class TestListVirtualMachines(object):
 
     def test_multiple_filters(self, runner, cli, vms):
         with mock.patch('slipstream.cli.api.Api.list_virtualmachines',
-                        return_value=iter(vms)):
+                        return_value=iter(vms[:1])) as patcher:
             result = runner.invoke(cli, ['list', 'virtualmachines',
                                          '--cloud', 'exoscale-ch-gva',
                                          '--status', 'running'])
+            patcher.assert_called_with(run_id=None, cloud='exoscale-ch-gva',
+                                       status='running', offset=0, limit=None,
+                                       columnar=False, where=None)
 
         assert result.exit_code == 0
         assert 'a087572b-e368-421a-8a25-ed67fcdfe202' in result.output
         assert 'cac1725a-ee6d-45f4-bbf7-e67c0db7e64e' not in result.output
 
+    def test_paging(self, runner, cli, vms):
+        with mock.patch('slipstream.cli.api.Api.list_virtualmachines',
+                        return_value=iter(vms)) as patcher:
+            result = runner.invoke(cli, ['list', 'virtualmachines',
+                                         '--offset', '10', '--limit', '2'])
+            patcher.assert_called_with(run_id=None, cloud=None, status=None,
+                                       offset=10, limit=2, columnar=False,
+                                       where=None)
+
+        assert result.exit_code == 0
+
     def test_no_results(self, runner, cli):
         with mock.patch('slipstream.cli.api.Api.list_virtualmachines',
                         return_value=iter([])):
@@ -339,6 +612,27 @@ class TestListVirtualMachines(object):
         assert result.output == ("No virtual machines found matching "
                                  "your criteria.\n")
 
+    def test_group_by(self, runner, cli, vms):
+        from slipstream.cli.resultset import ResultSet
+
+        vms = ResultSet(models.VirtualMachine, vms + vms[:1])
+        with mock.patch('slipstream.cli.api.Api.list_virtualmachines',
+                        return_value=vms) as patcher:
+            result = runner.invoke(cli, ['list', 'virtualmachines',
+                                         '--group-by', 'cloud,status',
+                                         '--format', 'csv'])
+            assert patcher.call_args[1]['columnar'] is True
+
+        assert result.exit_code == 0
+        assert result.output == ("cloud,status,count\n"
+                                 "ec2-eu-west-1,terminated,1\n"
+                                 "exoscale-ch-gva,running,2\n")
+
+    def test_group_by_invalid(self, runner, cli):
+        result = runner.invoke(cli, ['list', 'virtualmachines',
+                                     '--group-by', 'size'])
+        assert result.exit_code == 2
+
 
 @pytest.mark.usefixtures("authenticated")
 class TestBuildImage(object):
@@ -415,6 +709,242 @@ class TestRunDeployment(object):
         assert result.exit_code == 0
         assert result.output == "%s\n" % run_id
 
+    def test_missing_path(self, runner, cli):
+        result = runner.invoke(cli, ['run', 'deployment'])
+        assert result.exit_code == 2
+
+
+@pytest.mark.usefixtures('authenticated')
+class TestRunBatch(object):
+
+    manifest = ("id,path,wp:cloud,wp:multiplicity\n"
+                "a,clara/wordpress,cloud1,2\n"
+                "b,clara/wordpress,cloud2,\n"
+                "c,clara/lamp,,\n")
+
+    def test_csv(self, runner, cli, tmpdir):
+        manifest = tmpdir.join('manifest.csv')
+        manifest.write(self.manifest)
+        run_ids = {}
+
+        def run_deployment(path, params):
+            run_ids[path, params] = uuid.uuid4()
+            return run_ids[path, params]
+
+        with mock.patch('slipstream.cli.api.Api.run_deployment',
+                        side_effect=run_deployment):
+            result = runner.invoke(cli, ['run', 'deployment', '-j', '2',
+                                         '--batch', str(manifest)])
+
+        assert result.exit_code == 0
+        assert sorted(run_ids) == [
+            ('clara/lamp', ()),
+            ('clara/wordpress', (('wp', ('cloud', 'cloud1')),
+                                 ('wp', ('multiplicity', '2')))),
+            ('clara/wordpress', (('wp', ('cloud', 'cloud2')),)),
+        ]
+        for run_id in run_ids.values():
+            assert "%s\n" % run_id in result.output
+        results = tmpdir.join('manifest.csv.runs').read().splitlines()
+        assert sorted(line.split('\t')[0] for line in results) == \
+            ['a', 'b', 'c']
+
+    def test_resume(self, runner, cli, tmpdir):
+        manifest = tmpdir.join('manifest.csv')
+        manifest.write(self.manifest)
+        output = tmpdir.join('runs.tsv')
+        # Along with a row which is no longer in the manifest
+        output.write("a\tclara/wordpress\t%s\n"
+                     "z\tclara/wordpress\t%s\n" % (uuid.uuid4(), uuid.uuid4()))
+
+        def run_deployment(path, params):
+            if path == 'clara/lamp':
+                raise ConflictError()
+            return uuid.uuid4()
+
+        with mock.patch('slipstream.cli.api.Api.run_deployment',
+                        side_effect=run_deployment) as patcher:
+            result = runner.invoke(cli, ['run', 'deployment', '--batch',
+                                         str(manifest), '-o', str(output)])
+            assert patcher.call_count == 2
+
+        assert result.exit_code == 1
+        assert "Skipping 1 deployments already launched.\n" in result.output
+        assert "Error: 1 of 2 deployments could not be launched." \
+            in result.output
+        assert [line.split('\t')[0] for line in
+                output.read().splitlines()] == ['a', 'z', 'b']
+
+        with mock.patch('slipstream.cli.api.Api.run_deployment',
+                        return_value=uuid.uuid4()) as patcher:
+            result = runner.invoke(cli, ['run', 'deployment', '--batch',
+                                         str(manifest), '-o', str(output)])
+            patcher.assert_called_once_with('clara/lamp', ())
+
+        assert result.exit_code == 0
+
+    def test_with_path(self, runner, cli, tmpdir):
+        manifest = tmpdir.join('manifest.csv')
+        manifest.write(self.manifest)
+        result = runner.invoke(cli, ['run', 'deployment', '--batch',
+                                     str(manifest), 'clara/wordpress'])
+        assert result.exit_code == 2
+
+    def test_with_open(self, runner, cli, tmpdir):
+        manifest = tmpdir.join('manifest.csv')
+        manifest.write(self.manifest)
+        with mock.patch('slipstream.cli.api.Api.run_deployment') as patcher:
+            result = runner.invoke(cli, ['run', 'deployment', '--batch',
+                                         str(manifest), '--open'])
+            assert patcher.called is False
+        assert result.exit_code == 2
+        assert "--open can't be given along with --batch." in result.output
+
+
+@pytest.mark.usefixtures('authenticated')
+class TestWatch(object):
+
+    run_ids = [uuid.UUID(int=i) for i in range(2)]
+
+    def runs(self, *statuses):
+        def list_runs():
+            for run_id, status in zip(self.run_ids, statuses):
+                yield models.Run(id=run_id, module='clara/wordpress',
+                                 status=status, started_at=None, cloud='c1')
+        return list_runs
+
+    def test_watch(self, runner, cli):
+        with mock.patch('slipstream.cli.api.Api.list_runs',
+                        side_effect=self.runs('done', 'done')) as patcher:
+            result = runner.invoke(cli, ['watch'] +
+                                   [str(run_id) for run_id in self.run_ids])
+            assert patcher.call_count == 1
+
+        assert result.exit_code == 0
+        assert result.output == ''.join("%s: done\n" % run_id
+                                        for run_id in self.run_ids)
+
+    def test_aborted(self, runner, cli):
+        with mock.patch('slipstream.cli.api.Api.list_runs',
+                        side_effect=self.runs('done', 'aborted')):
+            result = runner.invoke(cli, ['watch'], input=''.join(
+                "%s\n" % run_id for run_id in self.run_ids))
+
+        assert result.exit_code == 1
+        assert "%s: aborted\n" % self.run_ids[1] in result.output
+        assert "Error: 1 of 2 runs were aborted or cancelled.\n" \
+            in result.output
+
+    def test_not_found(self, runner, cli):
+        with mock.patch('slipstream.cli.watch.time.sleep'), \
+                mock.patch('slipstream.cli.api.Api.list_runs',
+                           side_effect=self.runs('done')):
+            result = runner.invoke(cli, ['watch', str(self.run_ids[0]),
+                                         str(uuid.UUID(int=9))])
+
+        assert result.exit_code == 1
+        assert "Error: Runs not found: %s\n" % uuid.UUID(int=9) \
+            in result.output
+
+    def test_wait(self, runner, cli):
+        with mock.patch('slipstream.cli.api.Api.run_deployment',
+                        return_value=self.run_ids[0]), \
+                mock.patch('slipstream.cli.api.Api.list_runs',
+                           side_effect=self.runs('ready')):
+            result = runner.invoke(cli, ['run', 'deployment', '--until',
+                                         'ready', 'clara/wordpress'])
+
+        assert result.exit_code == 0
+        assert result.output == "{0}\n{0}: ready\n".format(self.run_ids[0])
+
+
+@pytest.mark.usefixtures('authenticated')
+class TestTerminate(object):
+
+    run_ids = [uuid.UUID(int=i) for i in range(3)]
+
+    def test_many(self, runner, cli):
+        with mock.patch('slipstream.cli.api.Api.terminate',
+                        return_value=True) as patcher:
+            result = runner.invoke(cli, ['terminate', '-j', '2'] +
+                                   [str(run_id) for run_id in self.run_ids])
+            assert sorted(call[0][0] for call in patcher.call_args_list) == \
+                self.run_ids
+
+        assert result.exit_code == 0
+        for run_id in self.run_ids:
+            assert "%s: terminated\n" % run_id in result.output
+
+    def test_stdin(self, runner, cli):
+        with mock.patch('slipstream.cli.api.Api.terminate',
+                        return_value=True) as patcher:
+            result = runner.invoke(cli, ['terminate'], input=''.join(
+                '%s\n' % run_id for run_id in self.run_ids))
+            assert patcher.call_count == 3
+
+        assert result.exit_code == 0
+
+    def test_failures(self, runner, cli):
+        def terminate(run_id):
+            if run_id == self.run_ids[1]:
+                raise ConflictError()
+            return True
+
+        with mock.patch('slipstream.cli.api.Api.terminate',
+                        side_effect=terminate):
+            result = runner.invoke(cli, ['terminate'] +
+                                   [str(run_id) for run_id in self.run_ids])
+
+        assert result.exit_code == 1
+        assert "%s: terminated\n" % self.run_ids[0] in result.output
+        assert "%s: " % self.run_ids[1] in result.output
+        assert "Error: 1 of 3 runs could not be terminated.\n" in result.output
+
+    def test_invalid(self, runner, cli):
+        result = runner.invoke(cli, ['terminate', 'foo'])
+        assert result.exit_code == 2
+
+
+@pytest.mark.usefixtures('authenticated')
+class TestUsage(object):
+
+    def test_record_and_trend(self, runner, cli, usage):
+        with mock.patch('slipstream.cli.api.Api.usage',
+                        side_effect=lambda: iter(usage)):
+            for _ in range(2):
+                result = runner.invoke(cli, ['usage', '--record', '-f', 'csv'])
+                assert result.exit_code == 0
+
+        assert result.output == ("cloud,usage,quota\n"
+                                 "exoscale-ch-gva,1,20\n"
+                                 "ec2-eu-west,0,20\n")
+
+        result = runner.invoke(cli, ['usage', '--history', '--since', '1h',
+                                     '-f', 'csv'])
+        assert result.exit_code == 0
+        assert len(result.output.splitlines()) == 5
+
+        result = runner.invoke(cli, ['usage', '--trend', '-f', 'csv'])
+        assert result.exit_code == 0
+        assert result.output == (
+            "cloud,samples,peak,average,usage,quota,time_to_quota\n"
+            "exoscale-ch-gva,2,1,1.0,1,20,-\n"
+            "ec2-eu-west,2,0,0.0,0,20,-\n")
+
+    def test_no_history(self, runner, cli):
+        result = runner.invoke(cli, ['usage', '--trend'])
+        assert result.exit_code == 0
+        assert "No usage recorded." in result.output
+
+
+def test_format_duration():
+    from slipstream.cli.commands import format_duration
+
+    assert format_duration(None) == '-'
+    assert format_duration(90) == '1m'
+    assert format_duration(3 * 3600 + 120) == '3h 2m'
+    assert format_duration(2 * 86400 + 5 * 3600) == '2d 5h'
+
 
 @pytest.mark.usefixtures('authenticated')
 class TestPublish(object):
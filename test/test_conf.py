@@ -0,0 +1,34 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from slipstream.cli import conf
+
+
+def test_atomic_write(tmpdir):
+    filename = tmpdir.join('data').strpath
+    conf.atomic_write(filename, b'first')
+    conf.atomic_write(filename, b'second')
+    assert tmpdir.join('data').read_binary() == b'second'
+
+    def write(tmp_filename):
+        with open(tmp_filename, 'wb') as fp:
+            fp.write(b'third')
+
+    conf.atomic_write(filename, write)
+    assert tmpdir.join('data').read_binary() == b'third'
+    assert tmpdir.listdir() == [tmpdir.join('data')]
+
+
+def test_atomic_write_error(tmpdir):
+    filename = tmpdir.join('data').strpath
+    conf.atomic_write(filename, b'first')
+
+    def write(tmp_filename):
+        raise IOError("Disk full")
+
+    with pytest.raises(IOError):
+        conf.atomic_write(filename, write)
+    # The file is left as it was, without temporary files
+    assert tmpdir.listdir() == [tmpdir.join('data')]
+    assert tmpdir.join('data').read_binary() == b'first'
@@ -0,0 +1,76 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from slipstream.cli import models
+from slipstream.cli.history import RECORD, Sample, UsageHistory
+
+HOUR = 3600
+
+
+@pytest.fixture
+def history(history_file):
+    return UsageHistory(history_file.strpath)
+
+
+def record_hours(history, count, start=0):
+    for hour in range(start, start + count):
+        history.record([models.Usage('exoscale-ch-gva', hour, 20),
+                        models.Usage('ec2-eu-west', 5, 10)],
+                       timestamp=hour * HOUR)
+
+
+def test_record(history, history_file):
+    assert list(history.samples()) == []
+    record_hours(history, 3)
+
+    assert len(history) == 6
+    assert history_file.size() == 6 * RECORD.size
+    assert history.clouds() == ['exoscale-ch-gva', 'ec2-eu-west']
+    assert list(history.samples())[-2:] == [
+        Sample(2 * HOUR, 'exoscale-ch-gva', 2, 20),
+        Sample(2 * HOUR, 'ec2-eu-west', 5, 10),
+    ]
+
+
+def test_samples_range(history):
+    record_hours(history, 100)
+
+    samples = list(history.samples(since=10 * HOUR, until=12 * HOUR))
+    assert [sample.time for sample in samples] == [10 * HOUR] * 2 + \
+        [11 * HOUR] * 2
+    assert list(history.samples(since=200 * HOUR)) == []
+
+
+def test_ordered(history):
+    record_hours(history, 2, start=5)
+    history.record([models.Usage('exoscale-ch-gva', 1, 20)], timestamp=0)
+    assert list(history.samples())[-1].time == 6 * HOUR
+
+
+def test_partial_record(history, history_file):
+    record_hours(history, 2)
+    with history_file.open('ab') as fp:
+        fp.write(b'\0\0\0')
+    assert len(list(history.samples())) == 4
+
+    record_hours(history, 1, start=2)
+    assert history_file.size() == 6 * RECORD.size
+    assert list(history.samples())[-2:] == [
+        Sample(2 * HOUR, 'exoscale-ch-gva', 2, 20),
+        Sample(2 * HOUR, 'ec2-eu-west', 5, 10),
+    ]
+
+
+def test_trends(history):
+    record_hours(history, 11)
+
+    growing, flat = history.trends()
+    assert growing.cloud == 'exoscale-ch-gva'
+    assert (growing.samples, growing.peak, growing.average) == (11, 10, 5)
+    # One more VM per hour, with 10 left
+    assert growing.time_to_quota == pytest.approx(10 * HOUR)
+    assert flat.time_to_quota is None
+
+    growing, flat = history.trends(since=8 * HOUR)
+    assert (growing.samples, growing.peak, growing.average) == (3, 10, 9)
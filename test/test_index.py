@@ -0,0 +1,163 @@
+from __future__ import unicode_literals
+
+import time
+
+import pytest
+
+from slipstream.cli import models
+from slipstream.cli.index import ModuleIndex, index_path
+
+
+class FakeApi(object):
+    """Serve a module tree from a dict of project path to modules."""
+
+    endpoint = 'https://slipstream.sixsq.com'
+
+    def __init__(self, tree, cache=None):
+        self.tree = tree
+        self.cache = cache
+        self.fetched = []
+        self.max_ages = []
+
+    def list_modules(self, path=None):
+        self.fetched.append(path)
+        if self.cache is not None:
+            self.max_ages.append(self.cache.max_age)
+        return iter(self.tree[path or ''])
+
+
+def make_tree(examples_version=56, images_version=57, centos_version=479):
+    return {
+        '': [models.App('examples', 'project', examples_version, 'examples')],
+        'examples': [
+            models.App('images', 'project', images_version, 'examples/images'),
+            models.App('tutorials', 'project', 58, 'examples/tutorials'),
+        ],
+        'examples/images': [
+            models.App('centos-6', 'image', centos_version,
+                       'examples/images/centos-6'),
+            models.App('ubuntu-12.04', 'image', 480,
+                       'examples/images/ubuntu-12.04'),
+        ],
+        'examples/tutorials': [
+            models.App('wordpress', 'deployment', 478,
+                       'examples/tutorials/wordpress'),
+        ],
+    }
+
+
+@pytest.fixture(scope='function')
+def index(index_file):
+    return ModuleIndex()
+
+
+def test_index_path():
+    assert index_path(None) == ''
+    assert index_path('module/examples/images/57') == 'examples/images'
+    assert index_path('/examples/images/') == 'examples/images'
+
+
+class TestModuleIndex(object):
+
+    def test_refresh(self, index, index_file):
+        api = FakeApi(make_tree())
+        index.refresh(api)
+        assert sorted(api.fetched, key=str) == [
+            None, 'examples', 'examples/images', 'examples/tutorials']
+
+        index = ModuleIndex()
+        assert index.load() is True
+        assert index.stale is False
+        assert [app.name for app in index.list_modules(recurse=True)] == [
+            'examples', 'images', 'centos-6', 'ubuntu-12.04', 'tutorials',
+            'wordpress']
+        assert [app.name for app in index.list_modules('examples/56')] == [
+            'images', 'tutorials']
+        assert list(index.list_modules('foo')) == []
+
+    def test_incremental_refresh(self, index):
+        assert index.refresh(FakeApi(make_tree())) == [
+            '', 'examples', 'examples/images', 'examples/tutorials']
+        # Nothing below an unchanged project is listed again
+        api = FakeApi(make_tree(images_version=59, centos_version=481))
+        api.tree['examples/tutorials'].append(models.App(
+            'lamp', 'deployment', 490, 'examples/tutorials/lamp'))
+        assert index.refresh(api) == []
+        assert api.fetched == [None]
+        assert index.get_module('examples/images/centos-6').version == 479
+
+        api = FakeApi(make_tree(examples_version=60, images_version=59,
+                                centos_version=481))
+        assert index.refresh(api) == ['', 'examples', 'examples/images']
+        assert api.fetched == [None, 'examples', 'examples/images']
+        assert index.get_module('examples/images/centos-6').version == 481
+        assert index.get_module('examples/tutorials/wordpress').version == 478
+
+        # Unless forced
+        tree = make_tree()
+        tree['examples/tutorials'].append(models.App(
+            'lamp', 'deployment', 490, 'examples/tutorials/lamp'))
+        api = FakeApi(tree)
+        assert len(index.refresh(api, force=True, concurrency=4)) == 4
+        assert len(api.fetched) == 4
+        assert index.get_module('examples/tutorials/lamp').version == 490
+
+    def test_other_user(self, index):
+        api = FakeApi(make_tree())
+        index.refresh(api)
+        assert index.matches(api)
+        api = FakeApi(make_tree())
+        api.username = 'alice'
+        assert not index.matches(api)
+        index.refresh(api)
+        assert len(api.fetched) == 4
+
+        index = ModuleIndex()
+        assert index.load() is True
+        assert index.username == 'alice'
+        assert index.matches(api)
+
+    def test_refresh_revalidates(self, index):
+        class Cache(object):
+            max_age = 300
+
+        api = FakeApi(make_tree(), Cache())
+        index.refresh(api)
+        # Cached listings are revalidated with the server
+        assert api.max_ages == [0] * 4
+        assert api.cache.max_age == 300
+        api = FakeApi(make_tree(examples_version=60), Cache())
+        index.refresh(api)
+        assert api.max_ages == [0] * 2
+
+    def test_knows(self, index):
+        index.refresh(FakeApi(make_tree()))
+        assert index.knows(None)
+        assert index.knows('examples/images')
+        assert index.knows('module/examples/images/centos-6/479')
+        assert not index.knows('examples/foo')
+
+    def test_stale(self, index):
+        index.refresh(FakeApi(make_tree()))
+        assert index.stale is False
+        index.refreshed_at = time.time() - 301
+        assert index.stale is True
+
+    def test_get_module(self, index):
+        index.refresh(FakeApi(make_tree()))
+        assert index.get_module('module/examples/images/centos-6') == \
+            models.App('centos-6', 'image', 479, 'examples/images/centos-6')
+        assert index.get_module('examples/images/foo') is None
+        assert index.get_module('foo/bar') is None
+
+    def test_discard(self, index):
+        index.refresh(FakeApi(make_tree()))
+        index.discard('examples/images')
+        assert index.get_module('examples/images/centos-6') is None
+        assert [app.name for app in index.list_modules(recurse=True)] == [
+            'examples', 'tutorials', 'wordpress']
+
+        api = FakeApi(make_tree())
+        assert index.refresh(api) == ['examples', 'examples/images']
+        assert api.fetched == [None, 'examples', 'examples/images']
+        assert index.get_module('examples/images/centos-6').version == 479
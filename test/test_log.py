@@ -0,0 +1,64 @@
+from __future__ import unicode_literals
+
+import json
+
+import mock
+import pytest
+
+from slipstream.cli.log import JsonSink, Logger
+
+
+class Unformattable(object):
+
+    def __str__(self):
+        raise AssertionError("Formatted a message which is not output")
+
+
+@pytest.fixture
+def logger():
+    return Logger()
+
+
+def test_suppressed_levels_are_not_formatted(logger):
+    with mock.patch('click.secho') as secho:
+        logger.debug("Found module with path: %s", Unformattable())
+        logger.log(logger.VERBOSE_DEBUG, "%(path)s", path=Unformattable())
+    assert not secho.called
+    assert not logger.enabled_for(logger.INFO)
+    assert logger.enabled_for(logger.NOTIFY)
+
+
+def test_deferred_arguments(logger):
+    with mock.patch('click.secho') as secho:
+        logger.notify("%s: %s", 'abcd', 'ready')
+        logger.notify("%(run)s: %(status)s", run='abcd', status='done')
+        logger.notify("100% done")
+    assert [call[0][0] for call in secho.call_args_list] == [
+        'abcd: ready', 'abcd: done', '100% done']
+    with pytest.raises(TypeError):
+        logger.notify("%s", 'a', status='done')
+
+
+def test_sink(logger, tmpdir):
+    log_file = tmpdir.join('log.jsonl')
+    logger.set_sink(JsonSink(log_file.strpath, logger.DEBUG,
+                             {'command': 'list runs'}))
+    assert logger.enabled_for(logger.DEBUG)
+    assert not logger.enabled_for(logger.VERBOSE_DEBUG)
+    with mock.patch('click.secho') as secho:
+        logger.debug("GET %s: %d", '/run', 200, extra={'request_id': 'ab12'})
+        logger.log(logger.VERBOSE_DEBUG, "%s", Unformattable())
+        logger.error("Failed")
+    logger.set_sink(None)
+    assert not logger.enabled_for(logger.DEBUG)
+
+    # Only the error is shown
+    assert [call[0][0] for call in secho.call_args_list] == ['Failed']
+    debug, error = [json.loads(line) for line in log_file.readlines()]
+    assert debug['message'] == 'GET /run: 200'
+    assert debug['level'] == 'debug'
+    assert debug['command'] == 'list runs'
+    assert debug['request_id'] == 'ab12'
+    assert debug['time'].endswith('Z')
+    assert error['level'] == 'error'
+    assert 'request_id' not in error
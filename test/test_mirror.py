@@ -0,0 +1,117 @@
+from __future__ import unicode_literals
+
+import sqlite3
+
+import mock
+import pytest
+
+from slipstream.cli.api import Api
+from slipstream.cli.index import ModuleIndex
+from slipstream.cli.mirror import Change, Mirror
+from slipstream.cli.testing import FakeServer, serve
+
+
+@pytest.fixture
+def server_runs():
+    return 9
+
+
+@pytest.fixture
+def api(server):
+    api = Api(server.endpoint)
+    api.login('test', 'test')
+    return api
+
+
+def changes(mirror, api, full=False):
+    return dict((change.table, change) for change in
+                mirror.sync(api, full, index=ModuleIndex()))
+
+
+def test_sync(server, api, mirror_file):
+    mirror = Mirror()
+    first = changes(mirror, api)
+    assert first['runs'] == Change('runs', 9, 9, 0, 0)
+    assert first['vms'] == Change('vms', 9, 9, 0, 0)
+    assert first['modules'] == Change('modules', 7, 7, 0, 0)
+    assert first['usage'].fetched == 2
+    assert mirror_file.check()
+
+    # Unfinished runs are listed again until they are done
+    for run in server.runs:
+        server.set_status(run['uuid'], 'Done')
+    assert changes(mirror, api)['runs'] == Change('runs', 9, 0, 8, 0)
+
+    server.add_runs(2)
+    server.terminate(server.runs[0]['uuid'])
+    second = changes(mirror, api)
+    # Only the new runs are listed
+    assert second['runs'] == Change('runs', 2, 2, 0, 0)
+    assert second['vms'] == Change('vms', 11, 2, 1, 0)
+    assert second['modules'] == Change('modules', 7, 0, 0, 0)
+    assert changes(mirror, api, full=True)['runs'] == Change('runs', 11, 0,
+                                                             1, 0)
+
+    # Full syncs find modules below projects whose version didn't change
+    server.add_module('examples/tutorials/lamp', 'Deployment', 490)
+    assert changes(mirror, api, full=True)['modules'] == Change('modules', 8,
+                                                                1, 0, 0)
+
+    # Only the runs which were listed are read from the mirror
+    with mock.patch.object(Mirror, '_rows', autospec=True,
+                           side_effect=Mirror._rows) as rows:
+        changes(mirror, api)
+    keys = [call[0][2] for call in rows.call_args_list
+            if call[0][1] == 'runs']
+    # The first run listed after the 2 unfinished ones, and then those
+    assert [len(key) for key in keys] == [1, 2]
+
+    columns, rows = mirror.query(
+        'SELECT status, count(*) AS runs FROM runs GROUP BY status '
+        'ORDER BY status')
+    assert columns == ['status', 'runs']
+    assert [row for row in rows] == [('cancelled', 1), ('done', 8),
+                                     ('initializing', 1), ('provisioning', 1)]
+    columns, rows = mirror.query(
+        'SELECT module, version FROM runs WHERE id = ?',
+        (server.runs[0]['uuid'],))
+    assert [row for row in rows] == [('examples/images/centos-6', 479)]
+
+    # Queries can't modify the mirror
+    with pytest.raises(sqlite3.OperationalError):
+        mirror.query('DELETE FROM runs')
+    mirror.close()
+
+
+def test_sync_other_endpoint(server, api):
+    mirror = Mirror()
+    changes(mirror, api)
+    other = FakeServer(runs=1)
+    with serve(other) as endpoint:
+        other_api = Api(endpoint)
+        other_api.login('test', 'test')
+        assert changes(mirror, other_api)['runs'] == Change('runs', 1, 1, 0,
+                                                            0)
+    columns, rows = mirror.query('SELECT id FROM runs')
+    assert [row for row in rows] == [(other.runs[0]['uuid'],)]
+    mirror.close()
+
+
+def test_commands(runner, cli, server):
+    result = runner.invoke(cli, ['query', 'SELECT * FROM runs'])
+    assert result.exit_code == 1
+    assert 'No mirror found' in result.output
+
+    result = runner.invoke(cli, ['-e', server.endpoint, '-u', 'test', '-p',
+                                 'test', 'sync'])
+    assert result.exit_code == 0
+    assert 'runs' in result.output
+
+    result = runner.invoke(cli, ['query', '-f', 'csv',
+                                 'SELECT count(*) AS runs FROM runs'])
+    assert result.exit_code == 0
+    assert result.output == 'runs\n9\n'
+
+    result = runner.invoke(cli, ['query', 'SELECT * FROM missing'])
+    assert result.exit_code == 1
+    assert 'no such table: missing' in result.output
@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+
+import collections
+import pickle
+import uuid
+
+import pytest
+
+from slipstream.cli import models
+from slipstream.cli.api import etree, to_virtualmachine
+
+RUN_ID = uuid.UUID('fa204c53-2d74-4fee-a76e-014e21ca3bd0')
+VM_ID = uuid.UUID('a087572b-e368-421a-8a25-ed67fcdfe202')
+
+# The models as they used to be defined
+PlainVirtualMachine = collections.namedtuple('VirtualMachine', [
+    'id',
+    'cloud',
+    'status',
+    'run_id',
+])
+
+
+def test_tuple_compatible():
+    vm = models.VirtualMachine(id=VM_ID, cloud='exoscale-ch-gva',
+                               status='running', run_id=str(RUN_ID))
+    plain = PlainVirtualMachine(VM_ID, 'exoscale-ch-gva', 'running', RUN_ID)
+
+    assert vm.id == VM_ID
+    assert vm.run_id == RUN_ID
+    assert vm[0] == VM_ID
+    assert vm[-1] == RUN_ID
+    assert vm[1:] == plain[1:]
+    assert tuple(vm) == plain
+    assert vm._asdict() == plain._asdict()
+    assert vm._fields == plain._fields
+    assert repr(vm) == repr(plain)
+    assert vm._replace(status='stopped') == \
+        models.VirtualMachine(VM_ID, 'exoscale-ch-gva', 'stopped', RUN_ID)
+    assert pickle.loads(pickle.dumps(vm)) == vm
+
+    id, cloud, status, run_id = vm
+    assert (id, run_id) == (VM_ID, RUN_ID)
+    assert '%s %s %s %s' % tuple(vm) == '{0} {1} {2} {3}'.format(*vm) == \
+        '%s exoscale-ch-gva running %s' % (VM_ID, RUN_ID)
+
+
+def test_interned():
+    first = models.Run(uuid.uuid4(), 'a/b/1', ''.join(['Don', 'e']).lower(),
+                       None, 'cloud')
+    second = models.Run(uuid.uuid4(), 'a/b/1', ''.join(['Do', 'ne']).lower(),
+                        None, 'cloud')
+    assert first.status is second.status
+    assert models.App('a', 'project', 1, 'a').type is \
+        models.App('b', ''.join(['pro', 'ject']), 1, 'b').type
+
+
+def test_invalid_uuid():
+    with pytest.raises(ValueError):
+        models.VirtualMachine('foo', 'cloud', 'running', RUN_ID)
+
+
+def test_memory():
+    """Compact virtual machines take at least 40% less memory than plain
+    ones, for an inventory with a few distinct clouds and states.
+    """
+    tracemalloc = pytest.importorskip('tracemalloc')
+    count = 10000
+    root = etree.fromstring('<vms>%s</vms>' % ''.join(
+        '<vm cloud="cloud-%d" instanceId="%s" state="%s" runUuid="%s"/>'
+        % (i % 4, uuid.uuid4(), ['Running', 'Terminated'][i % 2],
+           uuid.uuid4()) for i in range(count)))
+
+    def plain(elem):
+        return PlainVirtualMachine(id=uuid.UUID(elem.get('instanceId')),
+                                   cloud=elem.get('cloud'),
+                                   status=elem.get('state').lower(),
+                                   run_id=uuid.UUID(elem.get('runUuid')))
+
+    def measure(convert):
+        tracemalloc.start()
+        try:
+            vms = [convert(elem) for elem in root]
+            return tracemalloc.get_traced_memory()[0] / float(len(vms))
+        finally:
+            tracemalloc.stop()
+
+    plain_size = measure(plain)
+    compact_size = measure(to_virtualmachine)
+    print("Bytes per virtual machine: %d plain, %d compact"
+          % (plain_size, compact_size))
+    assert compact_size < plain_size * 0.6
+
+
+def test_compare_decoded():
+    vm = models.VirtualMachine(VM_ID, 'exoscale-ch-gva', 'running', RUN_ID)
+    plain = PlainVirtualMachine(VM_ID, 'exoscale-ch-gva', 'running', RUN_ID)
+    values = (VM_ID, 'exoscale-ch-gva', 'running', RUN_ID)
+
+    assert vm == plain
+    assert vm == values and values == vm
+    assert not vm != values
+    assert vm != values[:-1] + (uuid.uuid4(),)
+    assert hash(vm) == hash(plain) == hash(values)
+    assert set([vm, plain, values]) == set([values])
+    assert {vm: 1}[plain] == {values: 1}[vm] == 1
+    assert RUN_ID in vm
+    assert RUN_ID.int not in vm
+    assert vm.index(RUN_ID) == 3
+    assert vm.count(VM_ID) == 1
+    assert vm + (1,) == values + (1,)
+    assert (1,) + vm == (1,) + values
+
+    other = vm._replace(id=uuid.UUID(int=VM_ID.int + 1))
+    assert sorted([other, vm]) == [vm, other]
+    assert vm < other and other > vm and vm <= vm and vm >= plain
@@ -0,0 +1,74 @@
+from __future__ import unicode_literals
+
+import collections
+import uuid
+
+import pytest
+
+from slipstream.cli import models
+from slipstream.cli.resultset import ResultSet
+
+RUN_IDS = [uuid.UUID(int=i) for i in range(3)]
+
+
+@pytest.fixture
+def vms():
+    return ResultSet(models.VirtualMachine, [
+        models.VirtualMachine(uuid.UUID(int=100 + i), cloud, status, run_id)
+        for i, (cloud, status, run_id) in enumerate([
+            ('exoscale-ch-gva', 'running', RUN_IDS[0]),
+            ('exoscale-ch-gva', 'running', RUN_IDS[0]),
+            ('ec2-eu-west', 'running', RUN_IDS[1]),
+            ('ec2-eu-west', 'terminated', RUN_IDS[1]),
+            ('exoscale-ch-gva', 'terminated', RUN_IDS[2]),
+        ])])
+
+
+def test_records(vms):
+    assert len(vms) == 5
+    assert vms[2] == models.VirtualMachine(uuid.UUID(int=102), 'ec2-eu-west',
+                                           'running', RUN_IDS[1])
+    assert vms[-1].run_id == RUN_IDS[2]
+    assert [vm.id for vm in vms] == vms.column('id')
+    assert vms.column('status')[3] == 'terminated'
+    with pytest.raises(IndexError):
+        vms[5]
+
+
+def test_lookup(vms):
+    assert [vm.id.int for vm in vms.lookup(run_id=RUN_IDS[1])] == [102, 103]
+    assert [vm.id.int for vm in vms.lookup(cloud='exoscale-ch-gva',
+                                           status='terminated')] == [104]
+    assert vms.lookup(cloud='openstack') == []
+    assert vms.lookup(run_id=uuid.uuid4()) == []
+    assert len(vms.lookup()) == 5
+
+
+def test_index_updated(vms):
+    assert len(vms.lookup(status='stopped')) == 0
+    vms.append(models.VirtualMachine(uuid.uuid4(), 'ec2-eu-west', 'stopped',
+                                     RUN_IDS[2]))
+    assert len(vms.lookup(status='stopped')) == 1
+
+
+def test_count_by(vms):
+    assert vms.count_by('cloud', 'status') == collections.Counter({
+        ('exoscale-ch-gva', 'running'): 2,
+        ('exoscale-ch-gva', 'terminated'): 1,
+        ('ec2-eu-west', 'running'): 1,
+        ('ec2-eu-west', 'terminated'): 1,
+    })
+    assert vms.count_by('run_id')[(RUN_IDS[0],)] == 2
+
+
+def test_join(vms):
+    runs = ResultSet(models.Run, [
+        models.Run(RUN_IDS[0], 'examples/wordpress/478', 'ready', None,
+                   'exoscale-ch-gva'),
+        models.Run(RUN_IDS[1], 'examples/lamp/12', 'done', None,
+                   'ec2-eu-west'),
+    ])
+    pairs = list(vms.join(runs, 'run_id'))
+    assert [run and run.module for _, run in pairs] == [
+        'examples/wordpress/478', 'examples/wordpress/478',
+        'examples/lamp/12', 'examples/lamp/12', None]
@@ -0,0 +1,126 @@
+from __future__ import unicode_literals
+
+import mock
+import pytest
+
+from slipstream.cli import shell
+from slipstream.cli.api import Api
+
+
+@pytest.fixture
+def api(server):
+    api = Api(server.endpoint, cache=None)
+    api.login('test', 'test')
+    return shell.MemoizingApi(api)
+
+
+def test_memoized_listings(server, api):
+    requests = server.requests
+    runs = [run for run in api.list_runs()]
+    assert len(runs) == 3
+    assert server.requests > requests
+
+    requests = server.requests
+    assert [run for run in api.list_runs()] == runs
+    assert server.requests == requests
+    # Other arguments are fetched separately
+    assert len([run for run in api.list_runs(limit=1)]) == 1
+    assert server.requests > requests
+
+    assert api.refresh() == 2
+    requests = server.requests
+    assert [run for run in api.list_runs()] == runs
+    assert server.requests > requests
+
+    assert set('%s' % run.id for run in runs) <= api.run_ids
+    assert 'examples/tutorials/wordpress/wordpress' in api.paths
+
+
+def test_mutations(server, api):
+    [run for run in api.list_runs()]
+    assert api.listings
+    run_id = api.run_image('examples/images/ubuntu-12.04')
+    assert not api.listings
+    assert '%s' % run_id in api.run_ids
+    assert len([run for run in api.list_runs()]) == 4
+
+
+def test_completion(cli, server, api):
+    completer = shell.Completer(cli, api, aliases={'ls': 'list'})
+    candidates = completer.candidates('', '')
+    assert 'list' in candidates
+    assert 'ls' in candidates
+    assert 'refresh' in candidates
+    assert completer.candidates('li', 'li') == ['list']
+    assert 'runs' in completer.candidates('list ', '')
+    assert completer.candidates('list runs --li', '--li') == ['--limit']
+
+    assert completer.candidates('terminate ', '') == []
+    runs = [run for run in api.list_runs()]
+    run_id = '%s' % runs[0].id
+    assert completer.candidates('terminate ' + run_id[:8],
+                                run_id[:8]) == [run_id]
+    assert completer.candidates('run image examples/tutorials/',
+                                'examples/tutorials/') \
+        == ['examples/tutorials/wordpress/wordpress']
+
+
+def test_shell(runner, cli, server):
+    result = runner.invoke(cli, [
+        '-e', server.endpoint, '-u', 'test', '-p', 'test', '--no-cache',
+        'shell'], input='list runs -f csv\n\nlist runs -f csv\nrefresh\n'
+                        'list runs -f csv\nls nothing\nshell\nexit\n'
+                        'list runs\n')
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert len([line for line in lines if line.startswith('id,')]) == 3
+    assert 'Forgot 1 listings.' in lines
+    assert 'Already in the shell.' in lines
+    assert server.logins == 1
+
+
+def test_shell_profile(runner, cli, server, config_file):
+    config_file.write('[slipstream]\nendpoint = http://localhost:1\n\n'
+                      '[other]\nendpoint = %s\n' % server.endpoint)
+    with mock.patch('slipstream.cli.cache.ResponseCache') as cache:
+        result = runner.invoke(cli, [
+            '-P', 'other', '-u', 'test', '-p', 'test', '--no-cache', 'shell'],
+            input='list runs -f csv\nlist runs -f csv\nexit\n')
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert len([line for line in lines if line.startswith('id,')]) == 2
+    # Commands reuse the session and the options of the shell
+    assert server.logins == 1
+    assert mock.call(max_age=None, username='test') \
+        not in cache.call_args_list
+
+
+def test_polling(server, api):
+    runs = api.list_runs()
+    assert next(runs) is not None
+    runs.close()
+    runs = api.list_runs()
+    assert len([run for run in runs]) == 3
+    runs.close()
+
+    # Polls go to the server
+    assert api.fresh() is api.api
+    run_id = server.runs[0]['uuid']
+    server.set_status(run_id, 'Done')
+    assert 'done' not in [run.status for run in api.list_runs()]
+    assert [run.status for run in api.fresh().list_runs()
+            if '%s' % run.id == run_id] == ['done']
+
+
+def test_shell_watch(runner, cli, server):
+    run_id = server.runs[0]['uuid']
+
+    def finish(seconds):
+        server.set_status(run_id, 'Done')
+
+    with mock.patch('slipstream.cli.watch.time.sleep', side_effect=finish):
+        result = runner.invoke(cli, [
+            '-e', server.endpoint, '-u', 'test', '-p', 'test', '--no-cache',
+            'shell'], input='list runs -f csv\nwatch %s\nexit\n' % run_id)
+    assert result.exit_code == 0
+    assert '%s: done' % run_id in result.output.splitlines()
@@ -0,0 +1,107 @@
+from __future__ import unicode_literals
+
+import os
+import subprocess
+import sys
+
+import click
+import pytest
+
+from slipstream.cli.base import AliasedGroup
+
+# Modules which must not be imported by commands that don't talk to the server
+HEAVY_MODULES = ('requests', 'prettytable', 'defusedxml', 'pkg_resources')
+
+# The only modules of the CLI that `aliases` may import
+ALIASES_MODULES = set([
+    'slipstream',
+    'slipstream.cli',
+    'slipstream.cli.agent',
+    'slipstream.cli.base',
+    'slipstream.cli.commands',
+    'slipstream.cli.conf',
+    'slipstream.cli.formats',
+    'slipstream.cli.log',
+    'slipstream.cli.models',
+    'slipstream.cli.types',
+    'slipstream.cli.where',
+])
+
+# Cumulative import time budget of the CLI for trivial commands, in seconds,
+# loose enough not to fail on a slow machine
+IMPORT_TIME_BUDGET = 1.0
+
+
+def run_cli(tmpdir, *args):
+    """Run the CLI with ARGS in a new interpreter and return the names of
+    the modules it imported, along with the cumulative import time of each
+    top-level import, in seconds, where `python -X importtime` is supported.
+    """
+    env = dict(os.environ, HOME=tmpdir.strpath,
+               PYTHONPATH=os.pathsep.join(sys.path))
+    options = ['-X', 'importtime'] if sys.version_info >= (3, 7) else []
+    process = subprocess.Popen(
+        [sys.executable] + options + [
+            '-c',
+            'import sys; from slipstream.cli import main; '
+            'sys.argv[0] = "slipstream"\n'
+            'try:\n    main()\n'
+            'except SystemExit:\n    pass\n'
+            'sys.stderr.write("\\n".join(sys.modules))'] + list(args),
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    assert process.returncode == 0, err
+    modules = set()
+    import_times = {}
+    for line in err.decode('utf-8').splitlines():
+        if not line.startswith('import time:'):
+            modules.add(line)
+        elif 'cumulative' not in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            # Top-level imports are the ones without indentation
+            if not name.startswith('  '):
+                import_times[name.strip()] = int(cumulative) / 1e6
+    return modules, import_times
+
+
+@pytest.mark.parametrize('args', [['aliases'], ['--help']])
+def test_imports(tmpdir, args):
+    modules, _ = run_cli(tmpdir, *args)
+    names = set(name.split('.')[0] for name in modules)
+    assert 'slipstream' in names
+    assert names.isdisjoint(HEAVY_MODULES)
+
+
+def test_aliases_imports(tmpdir):
+    modules, _ = run_cli(tmpdir, 'aliases')
+    assert set(name for name in modules
+               if name.split('.')[0] == 'slipstream') == ALIASES_MODULES
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason="-X importtime requires Python 3.7")
+@pytest.mark.parametrize('args', [['aliases'], ['--help']])
+def test_import_time(tmpdir, args):
+    _, import_times = run_cli(tmpdir, *args)
+    cli_time = sum(cumulative for name, cumulative in import_times.items()
+                   if name.split('.')[0] in ('slipstream', 'click'))
+    assert 0 < cli_time < IMPORT_TIME_BUDGET
+
+
+def test_lazy_command(runner, monkeypatch):
+    group = AliasedGroup('group')
+    group.add_lazy_command('hello', 'lazy_hello:hello')
+
+    @click.command()
+    def hello():
+        click.echo('Hello')
+
+    module = type(sys)(str('lazy_hello'))
+    module.hello = hello
+    monkeypatch.setitem(sys.modules, 'lazy_hello', module)
+
+    assert group.list_commands(None) == ['hello']
+    result = runner.invoke(group, ['hello'])
+    assert result.exit_code == 0
+    assert result.output == 'Hello\n'
+    assert group.commands['hello'] is hello
@@ -0,0 +1,95 @@
+from __future__ import unicode_literals
+
+import json
+
+from slipstream.cli.stats import (Histogram, RequestStats, Timer,
+                                  endpoint_pattern)
+
+
+def test_endpoint_pattern():
+    assert endpoint_pattern('https://slipstream.sixsq.com/run?offset=0') == \
+        '/run'
+    assert endpoint_pattern('https://slipstream.sixsq.com/run/'
+                            '3fd93072-fcef-4c03-bdec-0cb2b19699e2') == \
+        '/run/{id}'
+    assert endpoint_pattern('/module/examples/images/56') == '/module/{path}'
+    assert endpoint_pattern('/module') == '/module'
+    assert endpoint_pattern('/user/42/quota') == '/user/{n}/quota'
+    assert endpoint_pattern('https://slipstream.sixsq.com') == '/'
+
+
+def test_histogram():
+    hist = Histogram()
+    assert hist.mean() is None
+    assert hist.quantile(0.95) is None
+    for seconds in [0.001, 0.02, 0.02, 0.3, 42]:
+        hist.observe(seconds)
+    assert hist.count == 5
+    assert hist.mean() == (0.001 + 0.02 + 0.02 + 0.3 + 42) / 5
+    assert hist.quantile(0.5) == 0.025
+    assert hist.quantile(0.95) == float('inf')
+    cumulative = dict(hist.cumulative())
+    assert cumulative[0.005] == 1
+    assert cumulative[0.5] == 4
+    assert cumulative[float('inf')] == 5
+
+
+def test_summary():
+    stats = RequestStats()
+    stats.record_request('get', 'https://slipstream.sixsq.com/run?limit=10',
+                         200, ttfb=0.02)
+    stats.record_received('GET', 'https://slipstream.sixsq.com/run', 2048)
+    stats.record_parse('GET', 'https://slipstream.sixsq.com/run', 0.004)
+    stats.record_request('GET', 'https://slipstream.sixsq.com/run', 503,
+                         ttfb=0.04)
+    stats.record_request('GET', 'https://slipstream.sixsq.com/run', None)
+    stats.record_cached('GET', 'https://slipstream.sixsq.com/run')
+    stats.record_request('POST', 'https://slipstream.sixsq.com/run', 201,
+                         sent=120, ttfb=0.1)
+
+    get, post = stats.summary()
+    assert get.endpoint == 'GET /run'
+    assert (get.requests, get.errors, get.cached, get.sent, get.received) \
+        == (3, 2, 1, 0, 2048)
+    assert get.ttfb_ms == 30.0
+    assert get.ttfb_p95_ms == 50.0
+    assert get.parse_ms == 4.0
+    assert (post.endpoint, post.requests, post.errors, post.sent) == \
+        ('POST /run', 1, 0, 120)
+
+
+def test_write(tmpdir):
+    stats = RequestStats()
+    stats.record_request('GET', '/vms', 200, ttfb=0.02)
+    stats.record_received('GET', '/vms', 512)
+
+    json_file = tmpdir.join('stats.json')
+    stats.write(json_file.strpath)
+    endpoint, = json.loads(json_file.read())['endpoints']
+    assert endpoint['endpoint'] == '/vms'
+    assert endpoint['statuses'] == {'200': 1}
+    assert endpoint['bytes_received'] == 512
+    assert endpoint['ttfb_seconds']['count'] == 1
+    assert endpoint['ttfb_seconds']['buckets'][-1] == ['+Inf', 1]
+
+    prom_file = tmpdir.join('slipstream.prom')
+    stats.write(prom_file.strpath)
+    lines = prom_file.read().splitlines()
+    assert '# TYPE slipstream_http_requests counter' in lines
+    assert 'slipstream_http_requests_total{method="GET",endpoint="/vms",' \
+        'status="200"} 1' in lines
+    assert 'slipstream_http_received_bytes_total{method="GET",' \
+        'endpoint="/vms"} 512' in lines
+    assert 'slipstream_http_ttfb_seconds_bucket{method="GET",' \
+        'endpoint="/vms",le="0.025"} 1' in lines
+    assert 'slipstream_http_ttfb_seconds_count{method="GET",' \
+        'endpoint="/vms"} 1' in lines
+    # No temporary file is left behind
+    assert sorted(path.basename for path in tmpdir.listdir()) == [
+        'slipstream.prom', 'stats.json']
+
+
+def test_timer():
+    timer = Timer()
+    assert list(timer.iterate(range(3))) == [0, 1, 2]
+    assert timer.seconds >= 0
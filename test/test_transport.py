@@ -0,0 +1,108 @@
+from __future__ import unicode_literals
+
+import mock
+import pytest
+import requests
+import responses
+
+from slipstream.cli import transport
+from slipstream.cli.api import Api
+
+URL = 'https://slipstream.sixsq.com/run'
+
+
+@pytest.fixture
+def sleep():
+    with mock.patch('slipstream.cli.api.time.sleep') as patcher:
+        yield patcher
+
+
+def test_retry_after():
+    assert transport.retry_after(None) is None
+    assert transport.retry_after('120') == 120
+    assert transport.retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert transport.retry_after('soon') is None
+
+
+def test_from_settings():
+    policy = transport.TransportPolicy.from_settings({
+        'endpoint': 'https://slipstream.sixsq.com',
+        'retries': '5',
+        'retry_backoff': '0.1',
+    })
+    assert policy.retries == 5
+    assert policy.retry_backoff == 0.1
+    assert policy.max_connections == \
+        transport.DEFAULT_SETTINGS['max_connections']
+
+    for value in ('lots', '-1'):
+        with pytest.raises(ValueError):
+            transport.TransportPolicy.from_settings({'retries': value})
+
+
+def test_delay():
+    policy = transport.TransportPolicy(retry_backoff=1, retry_max_backoff=5)
+    with mock.patch('random.uniform', side_effect=lambda a, b: b):
+        assert [policy.delay(attempt) for attempt in range(5)] == \
+            [1, 2, 4, 5, 5]
+
+    response = requests.Response()
+    response.headers['Retry-After'] = '3'
+    assert policy.delay(0, response) == 3
+    response.headers['Retry-After'] = '60'
+    assert policy.delay(0, response) is None
+
+
+@responses.activate
+def test_retry_get(api, sleep):
+    responses.add(responses.GET, URL, status=503)
+    responses.add(responses.GET, URL, status=502, adding_headers={
+        'Retry-After': '2'})
+    responses.add(responses.GET, URL, status=200, body='<runs/>')
+
+    assert api.session.get(URL).status_code == 200
+    assert len(responses.calls) == 3
+    assert sleep.call_args_list[1] == mock.call(2)
+
+
+@responses.activate
+def test_retry_exhausted(cookie_file, sleep):
+    api = Api(cookie_file=cookie_file.strpath,
+              policy=transport.TransportPolicy(retries=2))
+    responses.add(responses.DELETE, URL, status=503)
+
+    assert api.session.delete(URL).status_code == 503
+    assert len(responses.calls) == 3
+
+
+@responses.activate
+def test_no_retry_post(api, sleep):
+    responses.add(responses.POST, URL, status=503)
+
+    assert api.session.post(URL).status_code == 503
+    assert len(responses.calls) == 1
+    assert not sleep.called
+
+
+@responses.activate
+def test_circuit_breaker(cookie_file, sleep):
+    api = Api(cookie_file=cookie_file.strpath,
+              policy=transport.TransportPolicy(retries=0, circuit_threshold=2,
+                                               circuit_timeout=30))
+    responses.add(responses.GET, URL,
+                  body=requests.ConnectionError("Connection refused"))
+
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            api.session.get(URL)
+    with pytest.raises(transport.CircuitOpenError):
+        api.session.get(URL)
+    assert len(responses.calls) == 2
+
+    # A request is let through once the timeout has passed
+    api.session.breaker.opened_at -= 30
+    responses.reset()
+    responses.add(responses.GET, URL, status=200)
+    assert api.session.get(URL).status_code == 200
+    assert api.session.get(URL).status_code == 200
+    assert api.session.breaker.failures == 0
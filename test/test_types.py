@@ -35,3 +35,39 @@ class TestNodeKeyValue(object):
 
 
 
+
+
+@click.command()
+@click.option('--fields', type=types.FieldList(['cloud', 'status']))
+def fields_cmd(fields):
+    click.echo(' '.join(fields))
+
+
+class TestFieldList(object):
+
+    def test_ok(self, runner):
+        result = runner.invoke(fields_cmd, ['--fields', 'status, cloud'])
+        assert result.exit_code == 0
+        assert result.output == 'status cloud\n'
+
+    def test_fail(self, runner):
+        result = runner.invoke(fields_cmd, ['--fields', 'cloud,size'])
+        assert result.exit_code == 2
+
+
+@click.command()
+@click.option('--since', type=types.Duration())
+def duration_cmd(since):
+    click.echo(since)
+
+
+class TestDuration(object):
+
+    def test_ok(self, runner):
+        result = runner.invoke(duration_cmd, ['--since', '2h'])
+        assert result.exit_code == 0
+        assert result.output == '7200\n'
+
+    def test_fail(self, runner):
+        result = runner.invoke(duration_cmd, ['--since', '2 hours'])
+        assert result.exit_code == 2
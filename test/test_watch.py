@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import uuid
+
+import mock
+import pytest
+
+from slipstream.cli import models, watch
+
+
+class FakeApi(object):
+    """Serve a list of runs whose statuses follow the given timelines, runs
+    being missing while their status is None. Runs are listed newest first,
+    started a day apart.
+    """
+
+    def __init__(self, timelines):
+        self.timelines = timelines
+        self.polls = 0
+        self.listed = []
+
+    def list_runs(self):
+        tick = self.polls
+        self.polls += 1
+        for index, (run_id, timeline) in enumerate(self.timelines):
+            status = timeline[min(tick, len(timeline) - 1)]
+            if status is None:
+                continue
+            self.listed.append(run_id)
+            yield models.Run(id=run_id, module='clara/wordpress',
+                             status=status,
+                             started_at='2014-06-%02d' % (30 - index),
+                             cloud='cloud1')
+
+
+run_ids = [uuid.UUID(int=i) for i in range(3)]
+
+
+@pytest.fixture
+def sleep():
+    with mock.patch('slipstream.cli.watch.time.sleep') as patcher:
+        yield patcher
+
+
+def test_watch_runs(sleep):
+    api = FakeApi([
+        (run_ids[0], ['initializing', 'executing', 'executing', 'done']),
+        (run_ids[1], ['executing', 'aborted']),
+        (run_ids[2], ['done']),
+    ])
+
+    assert list(watch.watch_runs(api, run_ids[:2])) == [
+        (run_ids[0], 'initializing'),
+        (run_ids[1], 'executing'),
+        (run_ids[0], 'executing'),
+        (run_ids[1], 'aborted'),
+        (run_ids[0], 'done'),
+    ]
+    assert api.polls == 4
+    # Polling slows down while nothing changes
+    assert [call[0][0] for call in sleep.call_args_list] == [2, 2, 4]
+
+
+def test_poll_stops_early(sleep):
+    api = FakeApi([(run_id, ['done']) for run_id in run_ids])
+
+    assert list(watch.watch_runs(api, [run_ids[0]])) == [(run_ids[0], 'done')]
+    assert api.listed == [run_ids[0]]
+
+
+def test_until(sleep):
+    api = FakeApi([(run_ids[0], ['provisioning', 'finalizing'])])
+
+    assert list(watch.watch_runs(api, run_ids[:1], until='ready')) == [
+        (run_ids[0], 'provisioning'),
+        (run_ids[0], 'finalizing'),
+    ]
+
+
+def test_max_interval(sleep):
+    api = FakeApi([(run_ids[0], ['executing'] * 10 + ['done'])])
+
+    list(watch.watch_runs(api, run_ids[:1], interval=1, max_interval=5))
+    assert [call[0][0] for call in sleep.call_args_list] == \
+        [1, 2, 4, 5, 5, 5, 5, 5, 5, 5]
+
+
+def test_missing(sleep):
+    api = FakeApi([(run_ids[0], ['executing'] * 10 + ['done'])])
+
+    with pytest.raises(watch.WatchError) as excinfo:
+        list(watch.watch_runs(api, run_ids[:2]))
+    assert str(excinfo.value) == "Runs not found: %s" % run_ids[1]
+    assert api.polls == 3
+
+    # Runs can show up late
+    api = FakeApi([(run_ids[0], [None, None, 'done'])])
+    assert list(watch.watch_runs(api, run_ids[:1])) == [(run_ids[0], 'done')]
+    api = FakeApi([(run_ids[0], [None, None, 'done'])])
+    with pytest.raises(watch.WatchError):
+        list(watch.watch_runs(api, run_ids[:1], max_missing=2))
+
+
+def test_missing_bounded(sleep):
+    api = FakeApi([(run_id, ['executing']) for run_id in run_ids])
+
+    with pytest.raises(watch.WatchError):
+        list(watch.watch_runs(api, [run_ids[0], uuid.uuid4()]))
+    # Only the first poll goes through older runs
+    assert api.listed == run_ids + run_ids[:2] * 2
+
+    # Runs which show up late are newer than those listed before
+    api = FakeApi([(run_ids[2], [None, 'done']),
+                   (run_ids[0], ['executing', 'done']),
+                   (run_ids[1], ['done'])])
+    assert list(watch.watch_runs(api, run_ids[::2])) == [
+        (run_ids[0], 'executing'),
+        (run_ids[0], 'done'),
+        (run_ids[2], 'done'),
+    ]
+    assert api.listed == run_ids[:2] + [run_ids[2], run_ids[0]]
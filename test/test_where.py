@@ -0,0 +1,158 @@
+from __future__ import unicode_literals
+
+import pytest
+
+from slipstream.cli import models
+from slipstream.cli.where import (And, Comparison, Not, Or, Where, WhereError,
+                                  parse, tokenize)
+
+APPS = [
+    models.App('examples', 'project', 56, 'examples'),
+    models.App('centos-6', 'image', 479, 'examples/images/centos-6'),
+    models.App('ubuntu-12.04', 'image', 480, 'examples/images/ubuntu-12.04'),
+    models.App('wordpress', 'deployment', 478,
+               'examples/tutorials/wordpress/wordpress'),
+]
+
+RUNS = [
+    models.Run('3fd93072-fcef-4c03-bdec-0cb2b19699e2',
+               'examples/tutorials/wordpress/wordpress/478', 'running',
+               '2014-06-13 12:09:47.202 UTC', 'exoscale-ch-gva'),
+    models.Run('85127a28-455a-44a4-bba3-ca56bfe6858e',
+               'examples/images/centos-6/479', 'aborted',
+               '2014-06-12 08:48:23.677 UTC', 'ec2-eu-west'),
+]
+
+
+def names(text, apps=APPS):
+    where = Where(text, models.App._fields)
+    return [app.name for app in apps if where.match(app)]
+
+
+def test_tokenize():
+    assert [(token.kind, token.value) for token in tokenize(
+        "name == 'a b' AND version>=480 or path ~ \"\\\"\"")] == [
+        ('word', 'name'), ('operator', '='), ('string', 'a b'),
+        ('keyword', 'and'), ('word', 'version'), ('operator', '>='),
+        ('word', '480'), ('keyword', 'or'), ('word', 'path'),
+        ('operator', '~'), ('string', '"'), ('end', None)]
+
+
+def test_parse():
+    fields = models.App._fields
+    assert parse("type = image", fields) == Comparison('type', '=',
+                                                       ['image'])
+    assert parse("not (type = image or name in (a, b)) and version > 1",
+                 fields) == And([
+                     Not(Or([Comparison('type', '=', ['image']),
+                             Comparison('name', 'in', ['a', 'b'])])),
+                     Comparison('version', '>', ['1'])])
+    assert parse("name not in ('and')", fields) == \
+        Comparison('name', 'not in', ['and'])
+
+
+@pytest.mark.parametrize('text, message', [
+    ("", "Expected a field at position 0, found the end"),
+    ("size = 1", "Unknown field at position 0: size"),
+    ("name", "Expected an operator at position 4"),
+    ("name = ", "Expected a value at position 7"),
+    ("name = a b", "Expected an operator or the end at position 9"),
+    ("(name = a", "Expected ) at position 9"),
+    ("name = 'a", "Unexpected character at position 7: '"),
+    ("name ~ '('", "Invalid regular expression"),
+])
+def test_errors(text, message):
+    with pytest.raises(WhereError) as excinfo:
+        Where(text, models.App._fields)
+    assert message in str(excinfo.value)
+
+
+def test_match():
+    assert names("type = image") == ['centos-6', 'ubuntu-12.04']
+    # Statuses and types are lower-cased by the API
+    assert names("type == Image") == ['centos-6', 'ubuntu-12.04']
+    assert names("type != image") == ['examples', 'wordpress']
+    assert names("name in (wordpress, examples)") == ['examples', 'wordpress']
+    assert names("name not in (wordpress, examples)") == ['centos-6',
+                                                          'ubuntu-12.04']
+    assert names("path glob 'examples/images/*'") == ['centos-6',
+                                                      'ubuntu-12.04']
+    assert names("name ~ '^[cu]'") == ['centos-6', 'ubuntu-12.04']
+    assert names("name !~ '[.-]'") == ['examples', 'wordpress']
+    # Numbers are compared as such
+    assert names("version >= 479") == ['centos-6', 'ubuntu-12.04']
+    assert names("version < 100") == ['examples']
+    assert names("version = 480.0") == ['ubuntu-12.04']
+    assert names("version in (56, 478)") == ['examples', 'wordpress']
+    assert names("type = image and not name = centos-6 or version = 56") == \
+        ['examples', 'ubuntu-12.04']
+    assert names("type = image and (name = centos-6 or version = 56)") == \
+        ['centos-6']
+    assert names("type = image and version > 1 and name glob '*-6'") == \
+        ['centos-6']
+
+
+def test_match_runs():
+    where = Where("started_at >= '2014-06-13' or status = Aborted",
+                  models.Run._fields)
+    assert [where.match(run) for run in RUNS] == [True, True]
+    where = Where("id = 85127a28-455a-44a4-bba3-ca56bfe6858e",
+                  models.Run._fields)
+    assert [where.match(run) for run in RUNS] == [False, True]
+    # UUIDs are compared in their canonical form
+    where = Where("id in (85127A28-455A-44A4-BBA3-CA56BFE6858E, "
+                  "{3fd93072fcef4c03bdec0cb2b19699e2})", models.Run._fields)
+    assert [where.match(run) for run in RUNS] == [True, True]
+    vm = models.VirtualMachine('0b5e3b7e-8ebb-4eb6-ae7c-2e5c4b4cf5a5', 'c1',
+                               'running',
+                               '85127a28-455a-44a4-bba3-ca56bfe6858e')
+    assert Where("run_id = 85127A28-455A-44A4-BBA3-CA56BFE6858E",
+                 models.VirtualMachine._fields).match(vm)
+
+
+def test_pushdown():
+    fields = models.VirtualMachine._fields
+    params = ('run_id', 'cloud', 'status')
+    where = Where("cloud = ec2-eu-west and status in (Running)", fields)
+    assert where.equalities(params) == {'cloud': 'ec2-eu-west',
+                                        'status': 'running'}
+    assert where.covered_by(params)
+    where = Where("run_id = 85127A28-455A-44A4-BBA3-CA56BFE6858E", fields)
+    assert where.equalities(params) == {
+        'run_id': '85127a28-455a-44a4-bba3-ca56bfe6858e'}
+    where = Where("cloud = ec2-eu-west and id glob 'i-*'", fields)
+    assert where.equalities(params) == {'cloud': 'ec2-eu-west'}
+    assert not where.covered_by(params)
+    assert Where("cloud = a or status = b", fields).equalities(params) == {}
+    assert not Where("cloud = a and cloud = b", fields).covered_by(params)
+
+    where = Where("started_at > '2014-06-01' and started_at >= '2014-06-12'",
+                  models.Run._fields)
+    assert where.lower_bound('started_at') == '2014-06-12'
+    assert Where("started_at < 2014", models.Run._fields).lower_bound(
+        'started_at') is None
+
+    where = Where("path glob 'examples/tut*' and type = image",
+                  models.App._fields)
+    assert where.may_contain('examples')
+    assert where.may_contain('examples/tutorials')
+    assert not where.may_contain('examples/images')
+    where = Where("path in (a/b/c, d/e)", models.App._fields)
+    assert where.may_contain('a') and where.may_contain('a/b')
+    assert where.may_contain('d')
+    assert not where.may_contain('a/b/c') and not where.may_contain('e')
+    assert Where("path ~ x", models.App._fields).may_contain('e')
+
+
+def test_conjoin():
+    where = Where("type = image or version = 56", models.App._fields)
+    assert names(where.conjoin("name != centos-6").text) == ['examples',
+                                                             'ubuntu-12.04']
+
+
+def test_equality():
+    fields = models.App._fields
+    assert Where("type = image", fields) == Where("type = image", fields)
+    assert len(set([Where("type = image", fields),
+                    Where("type = image", fields)])) == 1
+    assert Where("type = image", fields) != Where("type = project", fields)